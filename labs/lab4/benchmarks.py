@@ -0,0 +1,152 @@
+'''Compare the running time of the executables produced by the
+tac2x64 backend and by the tac2c backend (gcc -O2) over the examples,
+and measure how the CFG simplification of tac_cfopt scales with the
+number of blocks.
+
+Usage:
+    python3 benchmarks.py [REPEAT]'''
+
+import os
+import subprocess
+import sys
+import time
+
+from ast2tac import Prog
+from bx2front import bxfront
+from tac_cfopt import optimize, optimize_body
+import tac2c
+import tac2x64
+
+bx_path = 'examples/'
+bx_files = sorted(os.path.join(dp, f)
+                  for dp, _, fn in os.walk(bx_path) for f in fn if f.endswith(".bx"))
+
+
+class HiddenPrints:
+    def __enter__(self):
+        self._original_stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        sys.stdout.close()
+        sys.stdout = self._original_stdout
+
+
+def build(tac: list, backend: str, exe: str) -> bool:
+    '''Compile the tac into the executable exe, return True on success'''
+    if backend == 'c':
+        src = exe + '.c'
+        tac2c.compile_tac(tac, src)
+        cmd = ['gcc', '-O2', '-o', exe, 'bx_runtime.c', src]
+    else:
+        src = exe + '.s'
+        tac2x64.compile_tac(tac, src)
+        cmd = ['gcc', '-o', exe, 'bx_runtime.c', src]
+    p = subprocess.Popen(cmd, stderr=subprocess.DEVNULL)
+    p.wait()
+    os.remove(src)
+    return p.returncode == 0
+
+
+def run(exe: str, repeat: int):
+    '''Run exe `repeat' times, return (output, best time)'''
+    best, output = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run(['timeout', '10', './' + exe],
+                                stdout=subprocess.PIPE).stdout
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return output, best
+
+
+def benchmark_backends(repeat: int = 5) -> None:
+    print(f'{"file":60} {"x64 (ms)":>10} {"c (ms)":>10} {"speedup":>8}')
+    for bx_file in bx_files:
+        if "regression" in bx_file:
+            continue
+        with HiddenPrints():
+            tac = optimize(Prog(bxfront(bx_file)).js_obj)
+            built = build(tac, 'x64', 'bench_x64') and build(tac, 'c', 'bench_c')
+        if not built:
+            print(f'{bx_file:60} {"compilation failed":>30}')
+            continue
+        out_x64, t_x64 = run('bench_x64', repeat)
+        out_c, t_c = run('bench_c', repeat)
+        status = '' if out_x64 == out_c else '  DIFFERENT OUTPUT'
+        print(f'{bx_file:60} {1000 * t_x64:10.2f} {1000 * t_c:10.2f} '
+              f'{t_x64 / t_c:8.2f}{status}')
+    for exe in ('bench_x64', 'bench_c'):
+        if os.path.exists(exe):
+            os.remove(exe)
+
+
+def _instr(opcode, args, result=None):
+    return {'opcode': opcode, 'args': args, 'result': result}
+
+
+def else_if_chain(n: int) -> list:
+    '''TAC of a chain of n `else if' testing %x, in the shape produced by
+    the frontend: every branch goes through empty blocks to the end'''
+    body = [_instr('const', [n // 2], '%x')]
+    end = 4 * n
+    for i in range(n):
+        body += [_instr('const', [i], '%c'),
+                 _instr('sub', ['%x', '%c'], '%t'),
+                 _instr('jz', ['%t', f'%.L{4 * i}']),
+                 _instr('jmp', [f'%.L{4 * i + 1}']),
+                 _instr('label', [f'%.L{4 * i}']),
+                 _instr('param', [1, '%c']),
+                 _instr('call', ['@__bx_print_int', 1]),
+                 _instr('jmp', [f'%.L{4 * i + 2}']),
+                 _instr('label', [f'%.L{4 * i + 2}']),
+                 _instr('jmp', [f'%.L{end}']),
+                 _instr('label', [f'%.L{4 * i + 1}'])]
+    return body + [_instr('label', [f'%.L{end}']), _instr('ret', [])]
+
+
+def nested_loops(n: int, depth: int = 3) -> list:
+    '''TAC of n/(3*depth) sequences of `depth' nested while loops'''
+    body = []
+    label = 0
+    for _ in range(max(1, n // (3 * depth))):
+        exits = []
+        for d in range(depth):
+            head, inner, exit = label, label + 1, label + 2
+            label += 3
+            body += [_instr('const', [0], f'%i{d}'),
+                     _instr('label', [f'%.L{head}']),
+                     _instr('const', [3], '%k'),
+                     _instr('sub', [f'%i{d}', '%k'], '%t'),
+                     _instr('jl', ['%t', f'%.L{inner}']),
+                     _instr('jmp', [f'%.L{exit}']),
+                     _instr('label', [f'%.L{inner}'])]
+            exits.append((head, exit, d))
+        body += [_instr('param', [1, '%i0']),
+                 _instr('call', ['@__bx_print_int', 1])]
+        for head, exit, d in reversed(exits):
+            body += [_instr('const', [1], '%k'),
+                     _instr('add', [f'%i{d}', '%k'], f'%i{d}'),
+                     _instr('jmp', [f'%.L{head}']),
+                     _instr('label', [f'%.L{exit}'])]
+    return body + [_instr('ret', [])]
+
+
+def benchmark_cfopt(sizes=(100, 1000, 10000)) -> None:
+    '''Time the CFG simplification of procedures of growing size'''
+    print(f'{"procedure":15} {"size":>6} {"instrs":>7} {"after":>7}'
+          f' {"time (ms)":>10} {"us/instr":>9}')
+    for name, gen in (('else if chain', else_if_chain),
+                      ('nested loops', nested_loops)):
+        for n in sizes:
+            body = gen(n)
+            start = time.perf_counter()
+            optimized = optimize_body(body)
+            elapsed = time.perf_counter() - start
+            print(f'{name:15} {n:6d} {len(body):7d} {len(optimized):7d}'
+                  f' {1000 * elapsed:10.2f} {1e6 * elapsed / len(body):9.2f}')
+
+
+if __name__ == '__main__':
+    benchmark_backends(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
+    benchmark_cfopt()
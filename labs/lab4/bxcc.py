@@ -4,9 +4,10 @@ Optimizes the intermediate tac.
 
 Usage:
     python3 bxcc.py filename.bx
+    python3 bxcc.py --backend=c filename.bx
     
 Returns:
-    filename.s'''
+    filename (executable)'''
 
 import argparse
 import json
@@ -17,6 +18,7 @@ from bx2front import bxfront
 from bx_ast import Program
 from bx2tac import bx2tac, bx2tacjson
 from tac2x64 import compile_tac
+import tac2c
 from ast2tac import Prog
 from tac_cfopt import optimize
 
@@ -26,6 +28,8 @@ if __name__ == '__main__':
                     help='Produce intermediate tac.json file')
     ap.add_argument('--no-optimize', dest='optim', action='store_true', default=False,
                     help='Optimize intermediate tac.json file')
+    ap.add_argument('--backend', dest='backend', choices=['x64', 'c'], default='x64',
+                    help='Compile the tac to x64 directly or through C and gcc -O2')
     ap.add_argument('fname', metavar='FILE', type=str, nargs=1,
                     help='The BX(JSON) file to process')
     opts = ap.parse_args(sys.argv[1:])
@@ -40,13 +44,19 @@ if __name__ == '__main__':
     if opts.keep_tac:
         with open(fname + '.tac.json', 'w') as fp:
             json.dump(tac, fp, indent=2)
-    compile_tac(tac, fname[:-3] + '.s')  # Compile tac to x64
+    if opts.backend == 'c':
+        src = fname[:-3] + '.c'
+        tac2c.compile_tac(tac, src)  # Compile tac to C
+        cmd = ['gcc', '-O2', '-o', fname[:-3], 'bx_runtime.c', src]
+    else:
+        src = fname[:-3] + '.s'
+        compile_tac(tac, src)  # Compile tac to x64
+        cmd = ['gcc', '-o', fname[:-3], 'bx_runtime.c', src]
 
     # Linking and running
-    cmd = ['gcc', '-o', fname[:-3], 'bx_runtime.c', fname[:-3] + '.s']
     p = subprocess.Popen(cmd)
     p.wait()
-    cmd = ['rm', fname[:-3] + '.s']
+    cmd = ['rm', src]
     p = subprocess.Popen(cmd)
     p.wait()
     print(f'{fname[:-3] + ".bx"} -> {fname[:-3]}')
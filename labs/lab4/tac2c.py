@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+
+"""
+TAC to C backend. Every TAC procedure is lowered to a C function where
+temporaries are int64_t locals, labels are goto targets and phi-functions
+are parallel assignments done on the incoming edges. The result is meant to
+be compiled with `gcc -O2' so that gcc takes care of register allocation
+and scheduling.
+
+Usage: python3 tac2c.py tacfile.tac.json
+Produces: tacfile.c
+"""
+
+import json
+import sys
+
+# condition under which each conditional jump is taken, both the lab4
+# (je/jne/jg/jge) and the lab5 (jz/jnz/jnle/jnl) spellings are accepted;
+# set<cc> and cmov<cc> test the condition of j<cc>
+jcc = {'je': '==', 'jz': '==',
+       'jne': '!=', 'jnz': '!=',
+       'jl': '<', 'jle': '<=',
+       'jg': '>', 'jnle': '>',
+       'jge': '>=', 'jnl': '>='}
+
+# operations that are done on uint64_t to get the two's complement
+# wraparound of x64 instead of signed overflow (undefined behaviour in C)
+wrapping_binops = {'add': '+', 'sub': '-', 'mul': '*'}
+binops = {'div': '/', 'mod': '%', 'and': '&', 'or': '|', 'xor': '^'}
+unops = {'neg': (lambda a: f'(int64_t)(0 - (uint64_t){a})'),
+         'not': (lambda a: f'~{a}')}
+
+runtime = {'@__bx_print_int': '__bx_print_int',
+           '@__bx_print_bool': '__bx_print_bool'}
+
+
+def c_int(k: int) -> str:
+    '''Return a C literal for the 64-bit value `k' '''
+    k &= 0xffffffffffffffff
+    if k & (1 << 63):
+        k -= 1 << 64
+    if k == -(1 << 63):
+        return 'INT64_MIN'
+    return f'INT64_C({k})'
+
+
+def c_global(name: str) -> str:
+    '''Mangle a global symbol (variable or procedure)'''
+    return runtime.get(name, f'bx_{name[1:]}')
+
+
+class ProcLowering:
+    '''Lowers the body of a single procedure'''
+
+    def __init__(self, name: str, t_args: list, body: list) -> None:
+        self.name = name
+        self.t_args = list(t_args)
+        self.body = body
+        self.temps = dict()
+        self.labels = dict()
+        self.phis = self._collect_phis()
+        self.nparams = 0
+
+    def _collect_phis(self) -> dict:
+        '''Map each label to the phi-functions at the start of its block'''
+        phis = dict()
+        lab_cur = None
+        for instr in self.body:
+            if instr['opcode'] == 'label':
+                lab_cur = instr['args'][0]
+            elif instr['opcode'] == 'phi':
+                phis.setdefault(lab_cur, []).append(instr)
+        return phis
+
+    def temp(self, t: str) -> str:
+        '''C expression for the temporary or global `t' '''
+        if t[0] == '@':
+            return c_global(t)
+        return self.temps.setdefault(t, f't{len(self.temps)}')
+
+    def label(self, lab: str) -> str:
+        return self.labels.setdefault(lab, f'L{len(self.labels)}')
+
+    def shadow(self, t: str) -> str:
+        '''Temporary receiving the value of the phi defining `t' on an edge'''
+        return f'{self.temp(t)}_in'
+
+    def edge(self, lab_from: str, lab_to: str) -> list:
+        '''Statements transferring control from `lab_from' to `lab_to' '''
+        stmts = []
+        for phi in self.phis.get(lab_to, []):
+            src = phi['args'][0].get(lab_from)
+            if src is not None:
+                stmts.append(f'{self.shadow(phi["result"])} = {self.temp(src)};')
+        stmts.append(f'goto {self.label(lab_to)};')
+        return stmts
+
+    def lower(self) -> list:
+        stmts = []
+        lab_cur = self.name
+        params = []
+        falls_through = True
+        for instr in self.body:
+            opcode = instr['opcode']
+            args = [arg for arg in instr['args'] if arg is not None]
+            result = instr['result']
+            if opcode != 'label':
+                falls_through = opcode not in ('jmp', 'ret')
+            if opcode == 'nop':
+                pass
+            elif opcode == 'label':
+                if falls_through:
+                    stmts.extend(self.edge(lab_cur, args[0])[:-1])
+                lab_cur = args[0]
+                stmts.append(f'{self.label(lab_cur)}:;')
+            elif opcode == 'phi':
+                stmts.append(f'{self.temp(result)} = {self.shadow(result)};')
+            elif opcode == 'const':
+                stmts.append(f'{self.temp(result)} = {c_int(args[0])};')
+            elif opcode == 'copy':
+                stmts.append(f'{self.temp(result)} = {self.temp(args[0])};')
+            elif opcode in wrapping_binops:
+                a, b = self.temp(args[0]), self.temp(args[1])
+                stmts.append(f'{self.temp(result)} = (int64_t)((uint64_t){a} '
+                             f'{wrapping_binops[opcode]} (uint64_t){b});')
+            elif opcode in binops:
+                a, b = self.temp(args[0]), self.temp(args[1])
+                stmts.append(f'{self.temp(result)} = {a} {binops[opcode]} {b};')
+            elif opcode == 'shl':
+                a, b = self.temp(args[0]), self.temp(args[1])
+                stmts.append(f'{self.temp(result)} = '
+                             f'(int64_t)((uint64_t){a} << ({b} & 63));')
+            elif opcode == 'shr':
+                a, b = self.temp(args[0]), self.temp(args[1])
+                stmts.append(f'{self.temp(result)} = {a} >> ({b} & 63);')
+            elif opcode in unops:
+                stmts.append(f'{self.temp(result)} = '
+                             f'{unops[opcode](self.temp(args[0]))};')
+            elif opcode.startswith('set') and 'j' + opcode[3:] in jcc:
+                cond = f'{self.temp(args[0])} {jcc["j" + opcode[3:]]} 0'
+                stmts.append(f'{self.temp(result)} = ({cond});')
+            elif opcode.startswith('cmov') and 'j' + opcode[4:] in jcc:
+                # the result keeps its value when the condition fails
+                cond = f'{self.temp(args[0])} {jcc["j" + opcode[4:]]} 0'
+                stmts.append(f'if ({cond}) {self.temp(result)} = '
+                             f'{self.temp(args[1])};')
+            elif opcode == 'jmp':
+                stmts.extend(self.edge(lab_cur, args[0]))
+            elif opcode in jcc:
+                cond = f'{self.temp(args[0])} {jcc[opcode]} 0'
+                stmts.append(f'if ({cond}) {{ '
+                             f'{" ".join(self.edge(lab_cur, args[1]))} }}')
+            elif opcode == 'jtab':
+                # an index out of [0, n) matches no case and falls through,
+                # as the unsigned `index < n' test of tac2x64
+                cases = dict()
+                for k, lab in enumerate(args[1]):
+                    cases.setdefault(lab, []).append(f'case {k}:')
+                stmts.append(f'switch ((uint64_t){self.temp(args[0])}) {{')
+                for lab, labels in cases.items():
+                    stmts.append(f'{" ".join(labels)} '
+                                 f'{" ".join(self.edge(lab_cur, lab))}')
+                stmts.append('default: break; }')
+            elif opcode == 'param':
+                # the argument is read when the param is executed
+                for _ in range(args[0] - len(params)):
+                    params.append(None)
+                    self.nparams = max(self.nparams, len(params))
+                stmts.append(f'p{args[0]} = {self.temp(args[1])};')
+                params[args[0] - 1] = f'p{args[0]}'
+            elif opcode == 'call':
+                call = f'{c_global(args[0])}({", ".join(params[:args[1]])})'
+                if result:
+                    stmts.append(f'{self.temp(result)} = {call};')
+                else:
+                    stmts.append(f'{call};')
+                params = []
+            elif opcode == 'print':
+                stmts.append(f'__bx_print_int({self.temp(args[0])});')
+            elif opcode == 'ret':
+                stmts.append(f'return {self.temp(args[0]) if args else 0};')
+            else:
+                assert False, f'unknown opcode: {opcode}'
+        stmts.append('return 0;')
+        return stmts
+
+    def to_c(self) -> list:
+        stmts = self.lower()
+        params = [self.temp(t) for t in self.t_args]
+        decls = [t for t in self.temps.values() if t not in params]
+        decls += [self.shadow(phi['result'])
+                  for phis in self.phis.values() for phi in phis]
+        decls += [f'p{n + 1}' for n in range(self.nparams)]
+        lines = [f'{self.signature()} {{']
+        if decls:
+            lines.append(f'\tint64_t {" = 0, ".join(decls)} = 0;')
+        lines.extend('\t' + stmt for stmt in stmts)
+        lines.append('}')
+        return lines
+
+    def signature(self) -> str:
+        params = ', '.join(f'int64_t {self.temp(t)}' for t in self.t_args)
+        return f'int64_t {c_global(self.name)}({params or "void"})'
+
+
+def tac_to_c(tjs: list) -> list:
+    '''Given a list of TAC declarations, return the lines of a C
+    translation unit'''
+    assert isinstance(tjs, list), tjs
+    lines = ['#include <stdint.h>',
+             '',
+             'void __bx_print_int(int64_t x);',
+             'void __bx_print_bool(int64_t b);']
+    procs = []
+    for json_obj in tjs:
+        if 'var' in json_obj:
+            lines.append(f'int64_t {c_global(json_obj["var"])} = '
+                         f'{c_int(json_obj["init"])};')
+        if 'proc' in json_obj:
+            procs.append(ProcLowering(json_obj['proc'], json_obj['args'],
+                                      json_obj['body']))
+    # prototypes first, procedures may be mutually recursive
+    lines.extend(f'{proc.signature()};' for proc in procs)
+    for proc in procs:
+        lines.append('')
+        lines.extend(proc.to_c())
+    lines.extend(['',
+                  'int main(void) {',
+                  '\tbx_main();',
+                  '\treturn 0;',
+                  '}'])
+    return lines
+
+
+def compile_tac(tjs: list, fname: str) -> None:
+    '''Given a list of tac declarations, create a C file'''
+    with open(fname, 'w') as cfp:
+        print(*tac_to_c(tjs), file=cfp, sep='\n')
+    print(f'compiled into {fname}')
+
+
+def compile_tac_from_json(fname: str) -> None:
+    assert fname.endswith('.tac.json')
+    with open(fname, 'rb') as fp:
+        tjs = json.load(fp)
+    compile_tac(tjs, fname[:-9] + '.c')
+
+
+if __name__ == "__main__":
+    compile_tac_from_json(sys.argv[1])
@@ -44,6 +44,10 @@ jcc = {"je": (lambda arg, label: ['movq $0, %r11',
                                     f'cmpq %r11, {arg}',
                                     f'jge {label}'])
        }
+# lab5 spellings of the conditional jumps
+jcc.update({"jnz": jcc["jne"], "jnle": jcc["jg"], "jnl": jcc["jge"]})
+# x64 condition codes of the lab5 set<cc> and cmov<cc>, comparing with 0
+conds = {'z': 'e', 'nz': 'ne', 'l': 'l', 'le': 'le', 'nl': 'ge', 'nle': 'g'}
 
 
 binops = {'add': 'addq',
@@ -84,6 +88,35 @@ def lookup_temp(temp, temp_map):
     return temp_map.setdefault(temp, f'{-8 * (len(temp_map) + 1)-64}(%rbp)')
 
 
+def asm_label(label, name_proc):
+    '''Labels only need to be unique inside a procedure in TAC'''
+    return f'.{name_proc}{label[1:]}'
+
+
+def is_tail_call(tac_instrs, index, labels, name_proc):
+    '''True if the call at tac_instrs[index] is directly followed (through
+    labels and jumps) by a ret of its result, or by a ret of nothing
+    (except in main, whose return value is the exit status)'''
+    result = tac_instrs[index]["result"]
+    seen = set()
+    index += 1
+    while index < len(tac_instrs) and index not in seen:
+        seen.add(index)
+        instr = tac_instrs[index]
+        args = [arg for arg in instr["args"] if arg is not None]
+        if instr["opcode"] in ('label', 'nop'):
+            index += 1
+        elif instr["opcode"] == 'jmp':
+            index = labels[args[0]]
+        elif instr["opcode"] == 'ret':
+            if not args:
+                return name_proc != 'main'
+            return args[0] == result
+        else:
+            return False
+    return False
+
+
 def tac_to_asm_proc(tac_instrs, args_proc,name_proc):
     """
     Get the x64 instructions correspondign to the TAC instructions for the procedure
@@ -105,9 +138,21 @@ def tac_to_asm_proc(tac_instrs, args_proc,name_proc):
             asm.append(f'movq {8*(index_arg+1)}(%rbp), {stack_slot}')
             
             
+    labels = {instr["args"][0]: index for index, instr in enumerate(tac_instrs)
+              if instr["opcode"] == 'label'}
+    # the temporaries only ever assigned one 32-bit constant are used as
+    # immediate operands of the arithmetic and the shifts
+    ndefs = dict()
     for instr in tac_instrs:
+        ndefs[instr["result"]] = ndefs.get(instr["result"], 0) + 1
+    consts = {instr["result"]: instr["args"][0] for instr in tac_instrs
+              if instr["opcode"] == 'const' and ndefs[instr["result"]] == 1
+              and instr["result"] not in args_proc
+              and -(1 << 31) <= instr["args"][0] < (1 << 31)}
+    for index, instr in enumerate(tac_instrs):
         opcode = instr["opcode"]
-        args = instr["args"]
+        # lab5 tac pads the arguments with None
+        args = [arg for arg in instr["args"] if arg is not None]
         result = instr["result"]
         if opcode == 'nop':
             pass
@@ -135,6 +180,14 @@ def tac_to_asm_proc(tac_instrs, args_proc,name_proc):
             for index_arg in range(1,min(6,args[1])+1) :
                 arg_temp = lookup_temp(f'%-{index_arg}', temp_map)
                 asm.append(f'movq {arg_temp}, %{arg_nb_to_reg[index_arg]}')
+
+            # tail call: the frame is released and the callee returns
+            # directly to our caller
+            if args[1] <= 6 and is_tail_call(tac_instrs, index, labels, name_proc) :
+                asm.extend([f'movq %rbp, %rsp',
+                            f'popq %rbp',
+                            f'jmp {args[0][1:]}'])
+                continue
             
             for index_arg in range(args[1], min(6,args[1]),-1) :
                 arg_temp = lookup_temp(f'%-{index_arg}', temp_map) 
@@ -165,19 +218,44 @@ def tac_to_asm_proc(tac_instrs, args_proc,name_proc):
         elif opcode == 'const':
             assert len(args) == 1 and isinstance(args[0], int)
             result = lookup_temp(result, temp_map)
-            asm.append(f'movq ${args[0]}, {result}')
+            if -(1 << 31) <= args[0] < (1 << 31):
+                asm.append(f'movq ${args[0]}, {result}')
+            else:
+                # only movabsq takes a 64-bit immediate, into a register
+                asm.extend([f'movabsq ${args[0]}, %r11',
+                            f'movq %r11, {result}'])
         elif opcode == 'label':
             assert len(args) == 1
-            asm.append(f'{args[0][1:]}:')
+            asm.append(f'{asm_label(args[0], name_proc)}:')
         elif opcode == 'jmp':
             assert len(args) == 1
-            asm.append(f'jmp {args[0][1:]}')
+            asm.append(f'jmp {asm_label(args[0], name_proc)}')
         elif opcode in jcc:
             jump = jcc[opcode]
             assert len(args) == 2
             arg = lookup_temp(args[0], temp_map)
-            label = args[1][1:]
+            label = asm_label(args[1], name_proc)
             asm.extend(jump(arg, label))
+        elif opcode == 'jtab':
+            # the table holds the offsets of the labels from its start, and
+            # goes to .rodata; out of range indexes fall through
+            assert len(args) == 2
+            arg = lookup_temp(args[0], temp_map)
+            table = f'.{name_proc}_jtab{index}'
+            asm.extend([f'movq {arg}, %r11',
+                        f'cmpq ${len(args[1])}, %r11',
+                        f'jae {table}_skip',
+                        f'leaq {table}(%rip), %rax',
+                        f'movslq (%rax,%r11,4), %r11',
+                        f'addq %rax, %r11',
+                        f'jmp *%r11',
+                        f'.section .rodata',
+                        f'.align 4',
+                        f'{table}:'])
+            asm.extend(f'.long {asm_label(lab, name_proc)}-{table}'
+                       for lab in args[1])
+            asm.extend([f'.text',
+                        f'{table}_skip:'])
         elif opcode == 'copy':
             assert len(args) == 1
             arg = lookup_temp(args[0], temp_map)
@@ -190,9 +268,14 @@ def tac_to_asm_proc(tac_instrs, args_proc,name_proc):
             arg2 = lookup_temp(args[1], temp_map)
             result = lookup_temp(result, temp_map)
             proc = binops[opcode]
-            if isinstance(proc, str):
+            k = consts.get(args[1])
+            if opcode in ('shl', 'shr') and k is not None and 0 <= k < 64:
+                asm.extend([f'movq {arg1}, %r11',
+                            f'{"salq" if opcode == "shl" else "sarq"} ${k}, %r11',
+                            f'movq %r11, {result}'])
+            elif isinstance(proc, str):
                 asm.extend([f'movq {arg1}, %r11',
-                            f'{proc} {arg2}, %r11',
+                            f'{proc} {arg2 if k is None else f"${k}"}, %r11',
                             f'movq %r11, {result}'])
             else:
                 asm.extend(proc(arg1, arg2, result))
@@ -204,6 +287,24 @@ def tac_to_asm_proc(tac_instrs, args_proc,name_proc):
             asm.extend([f'movq {arg}, %r11',
                         f'{proc} %r11',
                         f'movq %r11, {result}'])
+        elif opcode.startswith('set') and opcode[3:] in conds:
+            assert len(args) == 1
+            arg = lookup_temp(args[0], temp_map)
+            result = lookup_temp(result, temp_map)
+            asm.extend([f'movq $0, %r11',
+                        f'cmpq $0, {arg}',
+                        f'set{conds[opcode[3:]]} %r11b',
+                        f'movq %r11, {result}'])
+        elif opcode.startswith('cmov') and opcode[4:] in conds:
+            # the result keeps its value when the condition fails
+            assert len(args) == 2
+            arg1 = lookup_temp(args[0], temp_map)
+            arg2 = lookup_temp(args[1], temp_map)
+            result = lookup_temp(result, temp_map)
+            asm.extend([f'movq {result}, %r11',
+                        f'cmpq $0, {arg1}',
+                        f'cmov{conds[opcode[4:]]}q {arg2}, %r11',
+                        f'movq %r11, {result}'])
         elif opcode == 'print':
             assert len(args) == 1
             assert result == None
@@ -218,7 +319,8 @@ def tac_to_asm_proc(tac_instrs, args_proc,name_proc):
             assert False, f'unknown opcode: {opcode}'
     asm[:0] = [f'pushq %rbp',
                f'movq %rsp, %rbp',
-               f'subq ${8 * (len(temp_map) + len(temp_map)%2)}, %rsp'] 
+               # the stack slots start 64 bytes below %rbp
+               f'subq ${8 * (len(temp_map) + len(temp_map)%2) + 64}, %rsp'] 
     asm.extend([f'.{ret_label}:',
                 f'movq %rbp, %rsp'])
 
@@ -17,11 +17,12 @@ from typing import List, Tuple, Union
 __last_label = 0
 
 _conditional_jumps = ["je", "jne", "jl", "jle",
-                      "jg", "jge"]  # list of cond jump instructions
+                      "jg", "jge", "jz", "jnz"]  # list of cond jump instructions
 
-_conditional_jumps_pars = {'je': ['je', 'jle', 'jge'], 'jne': ['jne'],
-                           'jl': ['jl', 'jne', 'jle'], 'jle': ['jle'],
-                           'jg': ['jg', 'jne', 'jge'], 'jge': ['jge']}
+_conditional_jumps_pars = {'je': ['je', 'jz', 'jle', 'jge'], 'jne': ['jne', 'jnz'],
+                           'jl': ['jl', 'jne', 'jnz', 'jle'], 'jle': ['jle'],
+                           'jg': ['jg', 'jne', 'jnz', 'jge'], 'jge': ['jge'],
+                           'jz': ['je', 'jz', 'jle', 'jge'], 'jnz': ['jne', 'jnz']}
 
 
 class BasicBlock():
@@ -83,11 +84,29 @@ class CFG():
     def predecessors(self, label: str):
         return iter(self._bwd[label])
 
-    def add_node(self, block):
-        pass
-
-    def add_edge(self, label_from, label_to):
-        pass
+    def add_node(self, block: BasicBlock) -> None:
+        '''Add a block and the edges to its successors'''
+        self._block_map[block.label] = block
+        self._fwd.setdefault(block.label, set())
+        self._bwd.setdefault(block.label, set())
+        for succ in block.succ:
+            self.add_edge(block.label, succ)
+
+    def remove_node(self, label: str) -> None:
+        '''Remove a block and all the edges from and to it'''
+        for succ in list(self._fwd[label]):
+            self.remove_edge(label, succ)
+        for pred in list(self._bwd[label]):
+            self.remove_edge(pred, label)
+        del self._block_map[label], self._fwd[label], self._bwd[label]
+
+    def add_edge(self, label_from: str, label_to: str) -> None:
+        self._fwd[label_from].add(label_to)
+        self._bwd[label_to].add(label_from)
+
+    def remove_edge(self, label_from: str, label_to: str) -> None:
+        self._fwd[label_from].discard(label_to)
+        self._bwd[label_to].discard(label_from)
 
     def _construct_cfg(self, entry_block: str, blocks: List[BasicBlock]) -> None:
         '''Constructs the cfg'''
@@ -115,152 +134,168 @@ class CFG():
         instrs = self._block_map[block].instructions
         return len(instrs) == 2 and instrs[1]['opcode'] == 'jmp'
 
-    def _coalesce(self) -> bool:
-        '''Coalesce all linear blocks'''
-        modified = False
-        while True:
-            recently_modified = False
-            for b1 in self._block_map:
-                if len(self._fwd[b1]) == 1:
-                    b2 = next(iter(self._fwd[b1]))
-                    if self._can_merge(b1, b2) and b2 != self._entry_block:
-                        self._block_map[b1].instructions = self._block_map[b1].instructions[:-1] \
-                            + self._block_map[b2].instructions
-                        self._uce()
-                        modified = True
-                        recently_modified = True
-                        break  # Repeat process
-            if recently_modified:
-                continue
-            else:
-                break  # No more blocks that can be merged
-        return modified
+    def _jumps(self, block: str):
+        '''Iterator over the pairs (jump instruction, index of its label
+        argument) of a block'''
+        for instr in self._block_map[block].instructions:
+            if instr['opcode'] in _conditional_jumps:
+                yield instr, 1
+            elif instr['opcode'] == 'jmp':
+                yield instr, 0
+
+    def _retarget(self, block: str, instr: dict, pos: int, label: str) -> None:
+        '''Make the jump `instr` of a block go to `label` and update the
+        edges'''
+        old = instr['args'][pos]
+        instr['args'][pos] = label
+        self._block_map[block].update_succ()
+        if old not in self._block_map[block].succ:
+            self.remove_edge(block, old)
+        self.add_edge(block, label)
+
+    def _coalesce(self, b1: str) -> bool:
+        '''Merge the block with its only successor if it is the only
+        predecessor of the latter. The jmp at the end of the block must be
+        its only jump to the successor.'''
+        if len(self._fwd[b1]) != 1:
+            return False
+        b2 = next(iter(self._fwd[b1]))
+        if b2 == b1 or b2 == self._entry_block or not self._can_merge(b1, b2):
+            return False
+        instrs = self._block_map[b1].instructions
+        if instrs[-1]['opcode'] != 'jmp' or \
+           any(instr['args'][pos] == b2 for instr, pos in self._jumps(b1)
+               if instr is not instrs[-1]):
+            return False
+        # the label of b2 is no longer the target of any jump
+        instrs[-1:] = self._block_map[b2].instructions[1:]
+        succs = list(self._fwd[b2])
+        self.remove_node(b2)
+        self._block_map[b1].update_succ()
+        for succ in succs:
+            self.add_edge(b1, succ)
+        return True
 
     def _uce(self) -> None:
         '''Perform Unreachable Code Elimination'''
-        self._construct_cfg(self._entry_block, self._block_map.values())
         visited_blocks = self._uce_traversal(self._entry_block, set())
-        self._construct_cfg(self._entry_block, [
-                            basic_block for block_key, basic_block in self._block_map.items() if block_key in visited_blocks])
+        for label in [label for label in self._block_map
+                      if label not in visited_blocks]:
+            self.remove_node(label)
 
     def _uce_traversal(self, block: str, visited_blocks: set) -> set:
         '''Perform DFS on the cfg and return all the visited blocks'''
         visited_blocks.add(block)
-        for block in self._fwd[block]:
-            if block not in visited_blocks:
-                visited_blocks.add(block)
-                visited_blocks = self._uce_traversal(block, visited_blocks)
+        stack = [block]
+        while stack:
+            for succ in self._fwd[stack.pop()]:
+                if succ not in visited_blocks:
+                    visited_blocks.add(succ)
+                    stack.append(succ)
         return visited_blocks
 
-    def _unconditional_jump_threading_sequencing(self) -> bool:
-        '''Sequence a linear sequence of blocks'''
-        modified = False
-        while True:
-            recently_modified = False
-            for b1 in self._block_map:
-                if len(self._fwd[b1]) == 1:
-                    block_sequence = [b1]
-                    bi = b1
-                    while True:
-                        bj = next(iter(self._fwd[bi]))
-                        if self._can_merge(bi, bj) and self._is_empty(bj):
-                            block_sequence.append(bj)
-                            bi = bj
-                        else:
-                            block_sequence.append(bj)
-                            bi = bj
-                            break  # End of sequence
-                    if len(block_sequence) > 2:
-                        self._block_map[b1].instructions[-1]['args'] = [bi]
-                        self._uce()
-                        modified = True
-                        recently_modified = True
-                        break  # Repeat process
-            if recently_modified:
+    def _final_target(self, label: str) -> str:
+        '''Follow the sequence of empty blocks starting at `label`'''
+        seen = {label}
+        while self._is_empty(label):
+            nxt = self._block_map[label].instructions[1]['args'][0]
+            if nxt in seen:
+                break  # Loop of empty blocks
+            seen.add(nxt)
+            label = nxt
+        return label
+
+    def _unconditional_jump_threading_sequencing(self, b1: str) -> List[str]:
+        '''Make the jumps of a block to a sequence of empty blocks go to the
+        end of the sequence. Return the blocks that lost a predecessor.'''
+        bypassed = []
+        for instr, pos in list(self._jumps(b1)):
+            target = instr['args'][pos]
+            final = self._final_target(target)
+            if final != target:
+                self._retarget(b1, instr, pos, final)
+                bypassed.append(target)
+        return bypassed
+
+    def _conditional_jump_threading_sequencing(self, b1: str) -> List[str]:
+        '''Thread the conditional jumps of a block to a block that only
+        tests the same temporary again with an implied condition. Return
+        the blocks that lost a predecessor.'''
+        bypassed = []
+        for instr, pos in list(self._jumps(b1)):
+            if instr['opcode'] not in _conditional_jumps:
                 continue
-            else:
-                break  # No more blocks to merge
-        return modified
-
-    def _fetch_condition(self, block: str) -> str:
-        pass
-
-    def _check_writes(self, block: str, temporary: str) -> bool:
-        '''Check if there are any writes to a temporary in a given block'''
-        return any((True if temporary in instr['result'] else False for instr in self._block_map[block].instructions))
-
-    def _update_jmp(self, block: str, label: str) -> None:
-        '''Given a new label update the jmp at the end of a block'''
-        self._block_map[block].instructions[-1]['args'] = [label]
-
-    def _conditional_jump_threading_sequencing(self) -> bool:
-        '''Turn a sequence of conditional jumps into uncoditional
-        jumps with jump threading'''
-        modified = False
-        while True:
-            for b1 in self._block_map:
-                for b2 in self._fwd[b1]:
-                    jmp_instr_b1 = next(
-                        (instr for instr in self._block_map[b1].instructions if instr['opcode']
-                         in _conditional_jumps if instr['args'][-1] == b2), None)
-                    if jmp_instr_b1:
-                        temporary = jmp_instr_b1['args'][0]
-                        jmp_instr_b2 = next(
-                            ((i, instr) for i, instr in enumerate(self._block_map[b2].instructions) if instr['opcode']
-                             in _conditional_jumps if instr['args'][0] == temporary), None)
-                        if jmp_instr_b2:
-                            if not self._check_writes(b2, temporary) and jmp_instr_b2[1]['opcode'] in _conditional_jumps_pars[jmp_instr_b1['opcode']]:
-                                deleted_instr = self._block_map[b2].instructions.pop(
-                                    jmp_instr_b2[0])
-                                self._update_jmp(b2, deleted_instr['args'][1])
-                                self._uce()
-                                modified = True
-                                break  # Repeat process
-            break  # No more blocks to perform conditional jmp threading on
-        return modified
+            temporary, b2 = instr['args']
+            instrs_b2 = self._block_map[b2].instructions
+            if len(instrs_b2) != 3 or b2 == b1:
+                continue
+            test = instrs_b2[1]
+            if test['opcode'] in _conditional_jumps_pars[instr['opcode']] and \
+               test['args'][0] == temporary:
+                self._retarget(b1, instr, pos, test['args'][1])
+                bypassed.append(b2)
+        return bypassed
 
     def _remove_redundant_jumps(self, instrs: list) -> list:
-        '''Remove redundant jumps at the end of blocks
-        once serialized'''
+        '''Remove the jumps at the end of blocks to the label that follows
+        them once serialized'''
         new_instrs = []
-        for i, instr in enumerate(instrs[:-1]):
-            if instr['opcode'] == 'jmp':
-                if instr['args'][0] == instrs[i + 1]['args'][0]:
-                    print(instrs[i])
-                    print(instrs[i + 1])
-                    pass
-            else:
-                new_instrs.append(instr)
-        new_instrs.append(instrs[-1])
+        for i, instr in enumerate(instrs):
+            if instr['opcode'] == 'jmp' and i + 1 < len(instrs) and \
+               instrs[i + 1]['opcode'] == 'label' and \
+               instrs[i + 1]['args'][0] == instr['args'][0]:
+                continue
+            new_instrs.append(instr)
         return new_instrs
 
     def optimize(self) -> None:
-        '''Apply the available optimization routines'''
-        modified = True
-        while modified:
-            modified = False
-            modified |= self._unconditional_jump_threading_sequencing()
-            modified |= self._coalesce()
-            modified |= self._conditional_jump_threading_sequencing()
+        '''Apply the available optimization routines. Every block is put on
+        a worklist, and is visited again whenever one of the rewrites may
+        apply to it anew: when it changed, or when it lost a predecessor.
+        The edges are updated incrementally.'''
+        self._uce()
+        worklist = list(reversed(self._block_map))
+        pending = set(worklist)
+        while worklist:
+            b1 = worklist.pop()
+            pending.discard(b1)
+            if b1 not in self._block_map:
+                continue
+            if not self._bwd[b1] and b1 != self._entry_block:
+                # Unreachable
+                succs = list(self._fwd[b1])
+                self.remove_node(b1)
+                changed = succs
+            else:
+                changed = self._unconditional_jump_threading_sequencing(b1) + \
+                    self._conditional_jump_threading_sequencing(b1)
+                if self._coalesce(b1) or changed:
+                    changed.append(b1)
+            # a block left with a single predecessor may now be merged into it
+            for label in changed:
+                if label not in self._block_map:
+                    continue
+                preds = self._bwd[label] if len(self._bwd[label]) == 1 else ()
+                for other in [label, *preds]:
+                    if other not in pending:
+                        pending.add(other)
+                        worklist.append(other)
+        self._uce()  # Unreachable loops of blocks
 
     def serialize(self) -> list:
-        '''Serialize the cfg and return the tac'''
-        remaining_blocks = set(self._block_map.keys())
-        remaining_blocks.remove(self._entry_block)
+        '''Serialize the cfg and return the tac. Every block is followed
+        by the target of its final jmp when it is not already placed.'''
+        scheduled = set()
         schedule: List[str] = []
-        current_block: str = self._entry_block
-        while True:
-            while True:
+        for start in [self._entry_block] + list(self._block_map):
+            current_block = start
+            while current_block not in scheduled:
                 schedule.append(current_block)
-                potential_successors = [
-                    block for block in self._fwd[current_block] if block not in schedule]
-                if not potential_successors:
+                scheduled.add(current_block)
+                last = self._block_map[current_block].instructions[-1]
+                if last['opcode'] != 'jmp':
                     break
-                current_block = potential_successors[0]
-                remaining_blocks.remove(current_block)
-            if not remaining_blocks:
-                break
-            current_block = remaining_blocks.pop()
+                current_block = last['args'][0]
         tac = []
         for block in schedule:
             tac += self._block_map[block].instructions
@@ -368,8 +403,7 @@ def optimize_body(body: list) -> list:
     cfg = CFG(entry_block, basic_blocks)
     cfg.optimize()
     serialized_tac = cfg.serialize()
-    # Unknown bug if activated -> prob in tac->x64
-    # serialized_tac = cfg._remove_redundant_jumps(serialized_tac) 
+    serialized_tac = cfg._remove_redundant_jumps(serialized_tac)
     return serialized_tac
 
 
@@ -9,6 +9,7 @@ from bx2front import bxfront
 from bx2tac import bx2tac, bx2tacjson
 from bx_ast import Program
 from tac2x64 import compile_tac
+import tac2c
 from tac_cfopt import optimize
 
 tac_path = 'examples/'
@@ -157,11 +158,51 @@ def test_execution():
 
         
 
+def test_c_backend():
+
+    print('---------- TEST C BACKEND AGAINST TAC2X64 -------------')
+
+    for bx_file in bx_files :
+
+        if "regression" not in bx_file :
+            print(bx_file)
+            try :
+
+                with HiddenPrints():
+                    program = bxfront(bx_file)
+                    prog = Prog(program)  # Create ast + tac
+                    tac = prog.js_obj  # Create json for tac
+
+                    compile_tac(tac, 'to_del.s')
+                    tac2c.compile_tac(tac, 'to_del.c')
+
+                    cmd = ['gcc', '-o', 'to_del', 'bx_runtime.c', 'to_del.s']
+                    p = subprocess.Popen(cmd)
+                    p.wait()
+                    cmd = ['gcc', '-O2', '-o', 'to_del_c', 'bx_runtime.c', 'to_del.c']
+                    p = subprocess.Popen(cmd)
+                    p.wait()
+
+                    cmd = ['timeout', '2', './to_del']
+                    output1 = subprocess.Popen(cmd, stdout=subprocess.PIPE ).communicate()[0]
+                    cmd = ['timeout', '2', './to_del_c']
+                    output2 = subprocess.Popen(cmd, stdout=subprocess.PIPE ).communicate()[0]
+
+                    cmd = ['rm', '-f', 'to_del', 'to_del_c', 'to_del.c']
+                    p = subprocess.Popen(cmd)
+                    p.wait()
+
+                print(f'Produced {"same" if output1 == output2 else "different"} output')
+            except Exception as e :
+                print(e)
+
+
 if __name__ == '__main__':
     run_test_bx2front()
     run_test_optim()
     test_compilation()
     test_execution()
+    test_c_backend()
     
 
     
@@ -0,0 +1,678 @@
+'''Scaling benchmarks for the analyses and optimizations on large
+synthetic TAC procedures.
+
+Usage:
+    python3 benchmarks.py [MAX_INSTRS]'''
+
+import copy
+import os
+import sys
+import time
+
+import cfg as cfglib
+import dataflow
+import ipa
+import peval
+import ssagen
+import tac
+import tac_doft
+
+nvars = 8
+
+
+def synthetic_proc(n_instrs: int, name: str = '@main') -> tac.Proc:
+    '''A procedure of about `n_instrs' instructions made of a sequence of
+    counted while loops with an if/else diamond in their body, in the
+    shape produced by the frontend. The procedure terminates and prints
+    the values of its variables.'''
+    body = [tac.Instr(None, 'label', ('%.Lentry', None))]
+    temps = iter(range(sys.maxsize))
+
+    def emit(dest, opcode, *args):
+        body.append(tac.Instr(dest, opcode, args))
+
+    def fresh():
+        return f'%{next(temps)}'
+
+    for i in range(nvars):
+        emit(f'%x{i}', 'const', i)
+    k = 0
+    while len(body) < n_instrs:
+        xi, xj, xk = (f'%x{(k + d) % nvars}' for d in range(3))
+        head, bod, then, els, end = (f'%.L{k}{s}' for s in 'hbtfe')
+        emit(xi, 'const', 0)
+        emit(None, 'label', head)
+        t1, t2 = fresh(), fresh()
+        emit(t1, 'const', 10)
+        emit(t2, 'sub', xi, t1)
+        emit(None, 'jl', t2, bod)
+        emit(None, 'jmp', end)
+        emit(None, 'label', bod)
+        t3, t4, t5 = fresh(), fresh(), fresh()
+        emit(t3, 'const', 1)
+        emit(t4, 'and', xi, t3)
+        emit(None, 'jz', t4, els)
+        emit(None, 'label', then)
+        emit(t5, 'add', xj, xi)
+        emit(xj, 'copy', t5)
+        emit(None, 'jmp', f'%.L{k}j')
+        emit(None, 'label', els)
+        t6 = fresh()
+        emit(t6, 'xor', xk, xi)
+        emit(xk, 'copy', t6)
+        emit(None, 'label', f'%.L{k}j')
+        t7 = fresh()
+        emit(t7, 'add', xi, t3)
+        emit(xi, 'copy', t7)
+        emit(None, 'jmp', head)
+        emit(None, 'label', end)
+        k += 1
+    for i in range(nvars):
+        emit(None, 'param', 1, f'%x{i}')
+        emit(None, 'call', '@__bx_print_int', 1)
+    emit(None, 'ret')
+    return tac.Proc(name, (), body)
+
+
+def copy_heavy_proc(n_instrs: int, name: str = '@main') -> tac.Proc:
+    '''A straight-line procedure of about `n_instrs' instructions made of
+    assignments x = y op z, in the shape produced by Prog.tmm_expr: every
+    read of a variable is a copy into a fresh temporary'''
+    body = [tac.Instr(None, 'label', ('%.Lentry', None))]
+    for i in range(nvars):
+        body.append(tac.Instr(f'%x{i}', 'const', (i, None)))
+    temps = iter(range(sys.maxsize))
+    ops = ('add', 'sub', 'xor', 'and', 'or')
+    k = 0
+    while len(body) < n_instrs:
+        args = []
+        for d in (1, 2):
+            t = f'%{next(temps)}'
+            body.append(tac.Instr(t, 'copy', (f'%x{(k + d) % nvars}', None)))
+            args.append(t)
+        body.append(tac.Instr(f'%x{k % nvars}', ops[k % len(ops)], args))
+        k += 1
+    for i in range(nvars):
+        body.append(tac.Instr(None, 'param', (1, f'%x{i}')))
+        body.append(tac.Instr(None, 'call', ('@__bx_print_int', 1)))
+    body.append(tac.Instr(None, 'ret', (None, None)))
+    return tac.Proc(name, (), body)
+
+
+def timed(fn, *args):
+    '''Return the pair (result, seconds) of calling fn(*args)'''
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def sizes(max_instrs: int):
+    n = 100
+    while n <= max_instrs:
+        yield n
+        n *= 10
+
+
+def benchmark_dataflow(max_instrs: int) -> None:
+    print('---------- DATAFLOW SCALING -------------')
+    print(f'{"instrs":>8} {"blocks":>7} {"liveness":>10} {"per-instr":>10}'
+          f' {"reachdefs":>10} {"availexprs":>10}  (seconds)')
+    for n in sizes(max_instrs):
+        proc = synthetic_proc(n)
+        cfg = cfglib.infer(proc)
+        ninstrs = sum(1 for _ in cfg.instrs())
+        nblocks = sum(1 for _ in cfg.nodes())
+        _, t_live = timed(dataflow.solve, dataflow.Liveness(cfg))
+        _, t_instr = timed(cfglib.recompute_liveness, cfg, dict(), dict())
+        _, t_rd = timed(dataflow.solve, dataflow.ReachingDefinitions(cfg))
+        _, t_ae = timed(dataflow.solve, dataflow.AvailableExpressions(cfg))
+        print(f'{ninstrs:8d} {nblocks:7d} {t_live:10.4f} {t_instr:10.4f}'
+              f' {t_rd:10.4f} {t_ae:10.4f}')
+
+
+def count_phis(cfg) -> int:
+    return sum(1 for instr in cfg.instrs() if instr.opcode == 'phi')
+
+
+def benchmark_ssa(max_instrs: int) -> None:
+    print('---------- SSA CONSTRUCTION: CRUDE VS PRUNED -------------')
+    print(f'{"instrs":>8} {"crude phis":>11} {"time":>8}'
+          f' {"pruned phis":>12} {"time":>8}  (seconds)')
+    for n in sizes(max_instrs):
+        proc = synthetic_proc(n)
+        cfg = cfglib.infer(proc)
+        results = []
+        for ssagen_fn in (ssagen.crude_ssagen, ssagen.pruned_ssagen):
+            tlv, g = copy.deepcopy((proc, cfg))
+            _, t = timed(ssagen_fn, tlv, g)
+            results.append((count_phis(g), t))
+        (crude, t_crude), (pruned, t_pruned) = results
+        print(f'{n:8d} {crude:11d} {t_crude:8.4f} {pruned:12d} {t_pruned:8.4f}')
+
+
+def benchmark_dce(max_instrs: int) -> None:
+    print('---------- DEAD CODE: DSE (LIVENESS) VS DCE (SSA USE COUNTS) -------------')
+    print(f'{"instrs":>8} {"DSE removed":>12} {"time":>8}'
+          f' {"DCE removed":>12} {"time":>8}  (seconds)')
+    for n in sizes(max_instrs):
+        proc = synthetic_proc(n)
+        # every loop computes a value that is never used
+        for i, instr in enumerate(proc.body):
+            if instr.opcode == 'label' and instr.arg1.endswith('b'):
+                proc.body.insert(i + 1, tac.Instr(f'%dead{i}', 'mul',
+                                                  ('%x0', '%x1')))
+        cfg = cfglib.infer(proc)
+        size = sum(1 for _ in cfg.instrs())
+        _, t_dse = timed(tac_doft.DSE, cfg)
+        dse = size - sum(1 for _ in cfg.instrs())
+        cfg = cfglib.infer(proc)
+        ssagen.pruned_ssagen(proc, cfg)
+        dce, t_dce = timed(tac_doft.DCE, cfg)
+        print(f'{n:8d} {dse:12d} {t_dse:8.4f} {dce:12d} {t_dce:8.4f}')
+
+
+def benchmark_copies(max_instrs: int) -> None:
+    print('---------- COPY PROPAGATION -------------')
+    print(f'{"instrs":>8} {"copies":>8} {"left":>6} {"time":>8}  (seconds)')
+    for n in sizes(max_instrs):
+        proc = copy_heavy_proc(n)
+        cfg = cfglib.infer(proc)
+        copies = sum(1 for instr in cfg.instrs() if instr.opcode == 'copy')
+        _, t = timed(tac_doft.GCP, proc, cfg)
+        left = sum(1 for instr in cfg.instrs() if instr.opcode == 'copy')
+        print(f'{n:8d} {copies:8d} {left:6d} {t:8.4f}')
+
+
+def examples():
+    '''Iterator over the pairs (name, cfg) of the procedures of the test
+    corpus, in SSA form after GCP'''
+    import tests
+    for name, decls in tests.corpus():
+        for decl in decls:
+            if not isinstance(decl, tac.Proc):
+                continue
+            try:
+                cfg = cfglib.infer(decl)
+            except AssertionError:
+                continue
+            tac_doft.GCP(decl, cfg)
+            yield os.path.basename(name) + decl.name, cfg
+
+
+def report_sccp() -> None:
+    '''Instructions and blocks removed by SCCP (followed by DCE)'''
+    print('---------- SCCP ON THE EXAMPLES -------------')
+    print(f'{"procedure":40} {"instrs":>7} {"SCCP":>5} {"DCE":>5} {"blocks":>7}')
+    for proc, cfg in examples():
+        size = sum(1 for _ in cfg.instrs())
+        instrs, blocks = tac_doft.SCCP(cfg)
+        dead = tac_doft.DCE(cfg)
+        print(f'{proc:40} {size:7d} {instrs:5d} {dead:5d} {blocks:7d}')
+
+
+def report_gvn() -> None:
+    '''Redundant instructions found by GVN (followed by DCE)'''
+    print('---------- GVN ON THE EXAMPLES -------------')
+    print(f'{"procedure":40} {"instrs":>7} {"GVN":>5} {"DCE":>5}')
+    for proc, cfg in examples():
+        size = sum(1 for _ in cfg.instrs())
+        redundant = tac_doft.GVN(cfg)
+        dead = tac_doft.DCE(cfg)
+        print(f'{proc:40} {size:7d} {redundant:5d} {dead:5d}')
+
+
+def report_licm() -> None:
+    '''Loops and instructions hoisted by LICM'''
+    print('---------- LICM ON THE EXAMPLES -------------')
+    print(f'{"procedure":40} {"loops":>6} {"depth":>6} {"hoisted":>8}')
+    for proc, cfg in examples():
+        loops = cfg.analyses['loops']
+        if not loops.body:
+            continue
+        depth = max(loops.depth.values())
+        print(f'{proc:40} {len(loops.body):6d} {depth:6d}'
+              f' {tac_doft.LICM(cfg):8d}')
+
+
+def dynamic_counts(decls: list) -> dict:
+    '''Run the program in the interpreter and return the number of
+    executed instructions per opcode'''
+    import contextlib
+    import io
+    gvars = {decl.name: decl for decl in decls if isinstance(decl, tac.Gvar)}
+    procs = {decl.name: decl for decl in decls if isinstance(decl, tac.Proc)}
+    counts = dict()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tac.execute(gvars, procs, '@main', [], counts=counts)
+    return counts
+
+
+def taken_jumps(decls: list) -> int:
+    '''Run the program in the interpreter and return the number of jumps
+    taken'''
+    import contextlib
+    import io
+    gvars = {decl.name: copy.deepcopy(decl) for decl in decls
+             if isinstance(decl, tac.Gvar)}
+    procs = {decl.name: decl for decl in decls if isinstance(decl, tac.Proc)}
+    taken = dict()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tac.execute(gvars, procs, '@main', [], taken=taken)
+    return sum(taken.values())
+
+
+def report_layout() -> None:
+    '''Taken jumps of the programs out of SSA form, linearized in depth
+    first order, laid out with the static weights, and with a profile'''
+    import layout
+    import tests
+    print('---------- BLOCK LAYOUT: TAKEN JUMPS -------------')
+    print(f'{"program":30} {"dfs":>8} {"static":>8} {"profile":>8}'
+          f' {"removed":>8}')
+    for name, decls in tests.corpus():
+        if tests.expected_output(name, decls) is None or \
+           not all(decl.body and decl.body[0].opcode == 'label'
+                   for decl in decls if isinstance(decl, tac.Proc)):
+            continue
+        row = []
+        for profile in (None, False, True):
+            optimized = copy.deepcopy(decls)
+            tests.ssa_roundtrip(optimized)
+            removed = 0 if profile is None else \
+                layout.layout_decls(optimized, profile=profile)
+            row.append(taken_jumps(optimized))
+        if row[0]:
+            print(f'{os.path.basename(name):30} {row[0]:8d} {row[1]:8d}'
+                  f' {row[2]:8d} {removed:8d}')
+
+
+def report_rotate() -> None:
+    '''Executed and taken jumps of the programs optimized by
+    `tac_doft.optimize_decl', without and with loop rotation'''
+    import tests
+    print('---------- LOOP ROTATION: DYNAMIC JUMP COUNTS -------------')
+    print(f'{"program":30} {"rotated":>8} {"jumps":>8} {"taken":>8}'
+          f' {"jumps":>8} {"taken":>8}')
+    for name, decls in tests.corpus():
+        if tests.expected_output(name, decls) is None or \
+           not all(decl.body and decl.body[0].opcode == 'label'
+                   for decl in decls if isinstance(decl, tac.Proc)):
+            continue
+        rotated = 0
+        for decl in copy.deepcopy(decls):
+            if isinstance(decl, tac.Proc):
+                rotated += tac_doft.rotate_loops(cfglib.infer(decl))
+        if not rotated:
+            continue
+        row = []
+        for rotate in (False, True):
+            optimized = copy.deepcopy(decls)
+            for decl in optimized:
+                if isinstance(decl, tac.Proc):
+                    tac_doft.optimize_decl(decl, rotate=rotate)
+            counts = dynamic_counts(copy.deepcopy(optimized))
+            row.append(sum(n for op, n in counts.items()
+                           if op == 'jmp' or op in tac.jumps))
+            row.append(taken_jumps(optimized))
+        print(f'{os.path.basename(name):30} {rotated:8d} {row[0]:8d}'
+              f' {row[1]:8d} {row[2]:8d} {row[3]:8d}')
+
+
+def report_unroll() -> None:
+    '''Executed instructions and conditional jumps, and static size, of the
+    programs optimized by `tac_doft.optimize_decl' without and with loop
+    unrolling'''
+    import unroll
+    import tests
+    print('---------- LOOP UNROLLING: DYNAMIC COUNTS -------------')
+    print(f'{"program":30} {"full":>5} {"part":>5} {"instrs":>8}'
+          f' {"jumps":>8} {"size":>6} {"instrs":>8} {"jumps":>8}'
+          f' {"size":>6}')
+    for name, decls in tests.corpus():
+        if tests.expected_output(name, decls) is None or \
+           not all(decl.body and decl.body[0].opcode == 'label'
+                   for decl in decls if isinstance(decl, tac.Proc)):
+            continue
+        kinds = []
+        for decl in copy.deepcopy(decls):
+            if isinstance(decl, tac.Proc):
+                kinds.extend(unroll.unroll_loops(cfglib.infer(decl)))
+        if not kinds:
+            continue
+        row = []
+        for unroll_loops in (False, True):
+            optimized = copy.deepcopy(decls)
+            for decl in optimized:
+                if isinstance(decl, tac.Proc):
+                    tac_doft.optimize_decl(decl, unroll_loops=unroll_loops)
+            # the labels of the copies cost nothing once assembled
+            counts = dynamic_counts(copy.deepcopy(optimized))
+            row.append(sum(n for op, n in counts.items() if op != 'label'))
+            row.append(sum(n for op, n in counts.items() if op in tac.jumps))
+            row.append(sum(len(decl.body) for decl in optimized
+                           if isinstance(decl, tac.Proc)))
+        print(f'{os.path.basename(name):30} {kinds.count("full"):5d}'
+              f' {kinds.count("partial"):5d} {row[0]:8d} {row[1]:8d}'
+              f' {row[2]:6d} {row[3]:8d} {row[4]:8d} {row[5]:6d}')
+
+
+def report_switch() -> None:
+    '''Executed instructions and jumps of the programs with else-if chains,
+    out of SSA form and laid out, before and after lowering the chains'''
+    import layout
+    import switch
+    import tests
+    print('---------- ELSE-IF CHAINS: DYNAMIC COUNTS -------------')
+    print(f'{"program":30} {"tables":>7} {"trees":>7} {"instrs":>8}'
+          f' {"jumps":>8} {"instrs":>8} {"jumps":>8}')
+    for name, decls in tests.corpus():
+        if tests.expected_output(name, decls) is None or \
+           not all(decl.body and decl.body[0].opcode == 'label'
+                   for decl in decls if isinstance(decl, tac.Proc)):
+            continue
+        kinds = []
+        row = []
+        for lower in (False, True):
+            optimized = copy.deepcopy(decls)
+            for decl in optimized:
+                if isinstance(decl, tac.Proc) and lower:
+                    cfg = cfglib.infer(decl)
+                    kinds.extend(switch.lower_chain(cfg, chain)
+                                 for chain in switch.find_chains(cfg))
+                    cfglib.linearize(decl, cfg)
+            tests.ssa_roundtrip(optimized)
+            layout.layout_decls(optimized)
+            counts = dynamic_counts(copy.deepcopy(optimized))
+            row.append(sum(counts.values()))
+            row.append(sum(n for op, n in counts.items()
+                           if op in ('jmp', 'jtab') or op in tac.jumps))
+        if 'table' in kinds or 'search' in kinds:
+            print(f'{os.path.basename(name):30} {kinds.count("table"):7d}'
+                  f' {kinds.count("search"):7d} {row[0]:8d} {row[1]:8d}'
+                  f' {row[2]:8d} {row[3]:8d}')
+
+
+def report_ifconvert() -> None:
+    '''Executed instructions and conditional jumps of the programs out of
+    SSA form and laid out, before and after if-conversion'''
+    import ifconvert
+    import layout
+    import tests
+    print('---------- IF-CONVERSION: DYNAMIC COUNTS -------------')
+    print(f'{"program":30} {"diamonds":>8} {"instrs":>8} {"jcc":>8}'
+          f' {"instrs":>8} {"jcc":>8}')
+    for name, decls in tests.corpus():
+        if tests.expected_output(name, decls) is None or \
+           not all(decl.body and decl.body[0].opcode == 'label'
+                   for decl in decls if isinstance(decl, tac.Proc)):
+            continue
+        converted = 0
+        row = []
+        for convert in (False, True):
+            optimized = copy.deepcopy(decls)
+            tests.ssa_roundtrip(optimized)
+            if convert:
+                converted = ifconvert.if_convert_decls(optimized)
+            layout.layout_decls(optimized)
+            counts = dynamic_counts(copy.deepcopy(optimized))
+            row.append(sum(counts.values()))
+            row.append(sum(n for op, n in counts.items() if op in tac.jumps))
+        if converted:
+            print(f'{os.path.basename(name):30} {converted:8d} {row[0]:8d}'
+                  f' {row[1]:8d} {row[2]:8d} {row[3]:8d}')
+
+
+def report_vrp() -> None:
+    '''Executed instructions, divisions (div and mod) and conditional
+    jumps of the programs in SSA form after SCCP, without and with
+    value-range propagation'''
+    import ranges
+    import tests
+    print('---------- VRP: DYNAMIC COUNTS -------------')
+    print(f'{"program":30} {"instrs":>8} {"divs":>6} {"jcc":>6}'
+          f' {"instrs":>8} {"divs":>6} {"jcc":>6}')
+    for name, decls in tests.corpus():
+        if tests.expected_output(name, decls) is None or \
+           not all(decl.body and decl.body[0].opcode == 'label'
+                   for decl in decls if isinstance(decl, tac.Proc)):
+            continue
+        row = []
+        for passes in ((tac_doft.SCCP,), (tac_doft.SCCP, ranges.VRP)):
+            optimized = copy.deepcopy(decls)
+            tests.ssa_pipeline(*passes, tac_doft.DCE)(optimized)
+            counts = dynamic_counts(optimized)
+            row.extend([sum(counts.values()),
+                        counts.get('div', 0) + counts.get('mod', 0),
+                        sum(n for op, n in counts.items() if op in tac.jumps)])
+        if row[:3] != row[3:]:
+            print(f'{os.path.basename(name):30} {row[0]:8d} {row[1]:6d}'
+                  f' {row[2]:6d} {row[3]:8d} {row[4]:6d} {row[5]:6d}')
+
+
+def report_ivsr() -> None:
+    '''Executed instructions (and multiplications) of the loop programs
+    before and after strength reduction'''
+    import tests
+    print('---------- IVSR: DYNAMIC INSTRUCTION COUNTS -------------')
+    print(f'{"program":30} {"reduced":>8} {"before":>8} {"mul":>6}'
+          f' {"after":>8} {"mul":>6}')
+    for name, decls in tests.corpus():
+        if tests.expected_output(name, decls) is None:
+            continue
+        if not all(decl.body and decl.body[0].opcode == 'label'
+                   for decl in decls if isinstance(decl, tac.Proc)):
+            continue
+        results = []
+        reduced = 0
+        for strength_reduce in (False, True):
+            optimized = copy.deepcopy(decls)
+            for decl in optimized:
+                if isinstance(decl, tac.Proc):
+                    cfg = cfglib.infer(decl)
+                    tac_doft.GCP(decl, cfg)
+                    tac_doft.LICM(cfg)
+                    if strength_reduce:
+                        reduced += tac_doft.IVSR(cfg)
+                    tac_doft.DCE(cfg)
+                    cfglib.linearize(decl, cfg)
+            counts = dynamic_counts(optimized)
+            results.append((sum(counts.values()), counts.get('mul', 0)))
+        if reduced:
+            (before, mul_before), (after, mul_after) = results
+            print(f'{os.path.basename(name):30} {reduced:8d} {before:8d}'
+                  f' {mul_before:6d} {after:8d} {mul_after:6d}')
+
+
+def report_inline() -> None:
+    '''Executed instructions (and calls) of the programs optimized with
+    and without inlining, with the size heuristic alone and with a profile'''
+    import contextlib
+    import io
+    import tests
+    print('---------- INLINING: DYNAMIC INSTRUCTION COUNTS -------------')
+    print(f'{"program":30} {"mode":>8} {"inlined":>8} {"size":>6}'
+          f' {"instrs":>8} {"calls":>6}')
+    for name, decls in tests.corpus():
+        if tests.expected_output(name, decls) is None or \
+           not ipa.CallGraph(decls).sccs or \
+           not all(decl.body and decl.body[0].opcode == 'label'
+                   for decl in decls if isinstance(decl, tac.Proc)):
+            continue
+        rows = []
+        for mode in ('none', 'size', 'profile'):
+            optimized = copy.deepcopy(decls)
+            inlined = 0
+            if mode == 'size':
+                inlined = ipa.inline(optimized)
+            elif mode == 'profile':
+                with contextlib.redirect_stdout(io.StringIO()):
+                    calls = ipa.profile(decls)
+                inlined = ipa.inline(optimized, profile=calls, hot_calls=10)
+            for decl in optimized:
+                if isinstance(decl, tac.Proc):
+                    tac_doft.optimize_decl(decl)
+            size = sum(ipa.proc_size(decl) for decl in optimized
+                       if isinstance(decl, tac.Proc))
+            counts = dynamic_counts(optimized)
+            rows.append((mode, inlined, size, sum(counts.values()),
+                         counts.get('call', 0)))
+        if any(row[1] for row in rows):
+            for mode, inlined, size, instrs, calls in rows:
+                print(f'{os.path.basename(name):30} {mode:>8} {inlined:8d}'
+                      f' {size:6d} {instrs:8d} {calls:6d}')
+
+
+def report_specialize() -> None:
+    '''Clones created by specialization, code growth, and executed
+    instructions of the optimized programs with and without it'''
+    import tests
+    print('---------- SPECIALIZATION -------------')
+    print(f'{"program":30} {"clones":>6} {"calls":>6} {"size":>6} {"after":>6}'
+          f' {"instrs":>8} {"after":>8}')
+    for name, decls in tests.corpus():
+        if tests.expected_output(name, decls) is None or \
+           not all(decl.body and decl.body[0].opcode == 'label'
+                   for decl in decls if isinstance(decl, tac.Proc)):
+            continue
+        rows = []
+        for specialize in (False, True):
+            optimized = copy.deepcopy(decls)
+            clones = ipa.specialize(optimized) if specialize else []
+            for decl in optimized:
+                if isinstance(decl, tac.Proc):
+                    tac_doft.optimize_decl(decl)
+            size = sum(ipa.proc_size(decl) for decl in optimized
+                       if isinstance(decl, tac.Proc))
+            rows.append((clones, size, sum(dynamic_counts(optimized).values())))
+        (_, size, instrs), (clones, size_after, instrs_after) = rows
+        if clones:
+            calls = sum(clone[3] for clone in clones)
+            print(f'{os.path.basename(name):30} {len(clones):6d} {calls:6d}'
+                  f' {size:6d} {size_after:6d} {instrs:8d} {instrs_after:8d}')
+
+
+def report_summaries() -> None:
+    '''Procedures, arguments and results removed by pruning, and static
+    size and executed instructions of the optimized programs with and
+    without the procedure summaries'''
+    import tests
+    print('---------- INTERPROCEDURAL SUMMARIES -------------')
+    print(f'{"program":30} {"procs":>5} {"args":>5} {"rets":>5} {"size":>6}'
+          f' {"after":>6} {"instrs":>8} {"after":>8}')
+    for name, decls in tests.corpus():
+        if tests.expected_output(name, decls) is None or \
+           not all(decl.body and decl.body[0].opcode == 'label'
+                   for decl in decls if isinstance(decl, tac.Proc)):
+            continue
+        rows = []
+        for summarize in (False, True):
+            optimized = copy.deepcopy(decls)
+            pruned = ipa.prune(optimized) if summarize else None
+            summaries = ipa.summarize(optimized) if summarize else None
+            for decl in optimized:
+                if isinstance(decl, tac.Proc):
+                    tac_doft.optimize_decl(decl, summaries)
+            size = sum(ipa.proc_size(decl) for decl in optimized
+                       if isinstance(decl, tac.Proc))
+            rows.append((pruned, size, sum(dynamic_counts(optimized).values())))
+        (_, size, instrs), (pruned, size_after, instrs_after) = rows
+        if any(pruned) or size_after != size or instrs_after != instrs:
+            procs, args, rets = pruned
+            print(f'{os.path.basename(name):30} {procs:5d} {args:5d} {rets:5d}'
+                  f' {size:6d} {size_after:6d} {instrs:8d} {instrs_after:8d}')
+
+
+def report_promote() -> None:
+    '''Globals promoted, and executed instructions of the optimized
+    programs with and without promotion'''
+    import promote
+    import tests
+    print('---------- GLOBAL PROMOTION -------------')
+    print(f'{"program":30} {"promoted":>8} {"instrs":>8} {"after":>8}')
+    for name, decls in tests.corpus():
+        if tests.expected_output(name, decls) is None or \
+           not any(isinstance(decl, tac.Gvar) for decl in decls) or \
+           not all(decl.body and decl.body[0].opcode == 'label'
+                   for decl in decls if isinstance(decl, tac.Proc)):
+            continue
+        rows = []
+        for promoting in (False, True):
+            optimized = copy.deepcopy(decls)
+            summaries = ipa.summarize(optimized)
+            promoted = promote.promote_globals(optimized, summaries) \
+                if promoting else 0
+            for decl in optimized:
+                if isinstance(decl, tac.Proc):
+                    tac_doft.optimize_decl(decl, summaries)
+            rows.append((promoted, sum(dynamic_counts(optimized).values())))
+        (_, instrs), (promoted, instrs_after) = rows
+        print(f'{os.path.basename(name):30} {promoted:8d} {instrs:8d}'
+              f' {instrs_after:8d}')
+
+
+def report_peval() -> None:
+    '''Calls evaluated at compile time, static size and executed
+    instructions of the optimized programs, for a large and a tiny budget'''
+    import tests
+    print('---------- PARTIAL EVALUATION -------------')
+    print(f'{"program":30} {"budget":>7} {"evaluated":>9} {"size":>6}'
+          f' {"instrs":>8}')
+    for name, decls in tests.corpus():
+        if tests.expected_output(name, decls) is None or \
+           not all(decl.body and decl.body[0].opcode == 'label'
+                   for decl in decls if isinstance(decl, tac.Proc)):
+            continue
+        for budget in (None, 100000, 50):
+            optimized = copy.deepcopy(decls)
+            evaluated = 0
+            if budget is not None:
+                evaluated = peval.partial_evaluate(optimized, budget=budget)
+            for decl in optimized:
+                if isinstance(decl, tac.Proc):
+                    tac_doft.optimize_decl(decl)
+            size = sum(ipa.proc_size(decl) for decl in optimized
+                       if isinstance(decl, tac.Proc))
+            instrs = sum(dynamic_counts(optimized).values())
+            print(f'{os.path.basename(name):30} {budget or "-":>7}'
+                  f' {evaluated:9d} {size:6d} {instrs:8d}')
+
+
+def benchmark_analyses(max_instrs: int) -> None:
+    print('---------- ANALYSES COMPUTED BY DSE + SSA + OUT OF SSA -------------')
+    names = ('liveness', 'dominators', 'loops', 'defuse')
+    print(f'{"instrs":>8} ' + ' '.join(f'{name:>10}' for name in names)
+          + f' {"time":>8}  (seconds)')
+    for n in sizes(max_instrs):
+        proc = synthetic_proc(n)
+        cfg = cfglib.infer(proc)
+        start = time.perf_counter()
+        tac_doft.DSE(cfg)
+        ssagen.pruned_ssagen(proc, cfg)
+        ssagen.destruct_ssa(proc, cfg)
+        t = time.perf_counter() - start
+        print(f'{n:8d} ' + ' '.join(f'{cfg.analyses.computed[name]:10d}'
+                                    for name in names) + f' {t:8.4f}')
+
+
+if __name__ == '__main__':
+    max_instrs = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    benchmark_dataflow(max_instrs)
+    benchmark_ssa(max_instrs)
+    benchmark_dce(max_instrs)
+    benchmark_copies(max_instrs)
+    report_sccp()
+    report_vrp()
+    report_gvn()
+    report_licm()
+    report_ivsr()
+    report_inline()
+    report_specialize()
+    report_summaries()
+    report_promote()
+    report_layout()
+    report_rotate()
+    report_unroll()
+    report_switch()
+    report_ifconvert()
+    report_peval()
+    benchmark_analyses(max_instrs)
@@ -3,9 +3,12 @@
 """
 Control Flow Graphs (CFG)
 """
+import functools
+import itertools
 import re
 from typing import List
 
+import dataflow
 import tac
 from io import StringIO
 
@@ -34,6 +37,13 @@ class Block:
         for instr in reversed(self.body):
             yield instr
 
+    def hoist_phis(self):
+        """Move the phi-functions back to the start of the block, where the
+        SSA form expects them, once a pass has rewritten some of them into
+        other instructions. The order of the instructions is otherwise kept."""
+        self.body = [instr for instr in self.body if instr.opcode == 'phi'] + \
+                    [instr for instr in self.body if instr.opcode != 'phi']
+
     def first_instr(self):
         return next(self.instrs())
 
@@ -69,8 +79,20 @@ def get_jump_dest(jinstr):
     # return None otherwise
 
 
+def get_jump_dests(jinstr):
+    """The list of the labels `jinstr' may jump to, without duplicates"""
+    if jinstr.opcode == 'jtab':
+        return list(dict.fromkeys(jinstr.arg2))
+    dest = get_jump_dest(jinstr)
+    return [dest] if dest else []
+
+
 class CFG:
-    """Control flow graph"""
+    """Control flow graph. Blocks are numbered with dense integer ids in the
+    order they are added, and the adjacency is stored as lists of ids, so
+    every traversal is deterministic. The methods taking labels are a thin
+    facade over the ones taking ids. Traversal orders are cached and the
+    cache is dropped whenever the graph is mutated through this API."""
 
     def __init__(self, proc_name, lab_entry, blocks: List[Block]):
         """
@@ -80,79 +102,226 @@ class CFG:
           (blocks will be identified by their labels)
         """
         self.proc_name = proc_name
-        self.lab_entry = lab_entry
-        self._blockmap = {bl.label: bl for bl in blocks}
-        self._fwd = {lab: set() for lab in self._blockmap}  # next()
-        self._bwd = {lab: set() for lab in self._blockmap}  # prev()
+        self._lab_entry = lab_entry
+        self._blocks = []       # id -> Block, None once removed
+        self._ids = dict()      # label -> id
+        self._succs = []        # id -> list of successor ids
+        self._preds = []        # id -> list of predecessor ids
+        self._orders = dict()   # cached traversal orders
+        self.analyses = AnalysisManager(self)
+        for bl in blocks:
+            self._new_id(bl)
         # now link up the blocks
         for bl in blocks:
-            for jinstr in bl.jumps:
-                dest = get_jump_dest(jinstr)
-                if dest:
-                    self.add_edge(bl.label, dest)
+            self._link(bl)
+
+    def _new_id(self, block):
+        assert block.label not in self._ids
+        self._ids[block.label] = len(self._blocks)
+        self._blocks.append(block)
+        self._succs.append([])
+        self._preds.append([])
+
+    def _link(self, block):
+        for jinstr in block.jumps:
+            for dest in get_jump_dests(jinstr):
+                self.add_edge(block.label, dest)
+
+    def _invalidate(self):
+        self._orders.clear()
+        self.analyses.invalidate()
+
+    @property
+    def lab_entry(self):
+        return self._lab_entry
+
+    @lab_entry.setter
+    def lab_entry(self, lab):
+        self._lab_entry = lab
+        self._invalidate()
 
     def __getitem__(self, lab):
         """
         Return the block with the input label `lab'.
         Recall that cfg.__getitem__(lab) can be written as cfg[lab].
         """
-        return self._blockmap[lab]
+        return self._blocks[self._ids[lab]]
+
+    def __contains__(self, lab):
+        return lab in self._ids
+
+    # -- id based interface
+
+    def num_ids(self):
+        """Upper bound (exclusive) on the ids of the blocks"""
+        return len(self._blocks)
+
+    def block_id(self, lab):
+        return self._ids[lab]
+
+    def block_label(self, bid):
+        return self._blocks[bid].label
+
+    def succ_ids(self, bid):
+        """List of the ids of the successors of block `bid' (do not mutate)"""
+        return self._succs[bid]
+
+    def pred_ids(self, bid):
+        """List of the ids of the predecessors of block `bid' (do not mutate)"""
+        return self._preds[bid]
+
+    def node_ids(self):
+        return (bid for bid, bl in enumerate(self._blocks) if bl is not None)
+
+    def postorder_ids(self, all_blocks=False):
+        """Postorder of the ids of the blocks in a depth-first search from the
+        entry. Blocks unreachable from the entry are appended at the end if
+        `all_blocks' is True, and left out otherwise."""
+        key = ('post', all_blocks)
+        if key not in self._orders:
+            self._orders[key] = self._dfs(all_blocks)[2]
+        return self._orders[key]
+
+    def rpo_ids(self, all_blocks=False):
+        """Reverse of postorder_ids()"""
+        key = ('rpo', all_blocks)
+        if key not in self._orders:
+            self._orders[key] = self.postorder_ids(all_blocks)[::-1]
+        return self._orders[key]
+
+    def dfs_numbers(self):
+        """Pair of lists (pre, post) mapping the id of every block reachable
+        from the entry to its preorder and postorder numbers in a
+        depth-first search from the entry; other ids are mapped to None"""
+        if 'numbers' not in self._orders:
+            pre, post, _ = self._dfs(False)
+            self._orders['numbers'] = (pre, post)
+        return self._orders['numbers']
+
+    def _dfs(self, all_blocks):
+        pre = [None] * len(self._blocks)
+        post = [None] * len(self._blocks)
+        order = []
+        roots = [self._ids[self._lab_entry]]
+        if all_blocks:
+            roots.extend(self.node_ids())
+        npre = 0
+        for root in roots:
+            if pre[root] is not None:
+                continue
+            pre[root] = npre
+            npre += 1
+            stack = [(root, iter(self._succs[root]))]
+            while stack:
+                bid, succs = stack[-1]
+                for succ in succs:
+                    if pre[succ] is None:
+                        pre[succ] = npre
+                        npre += 1
+                        stack.append((succ, iter(self._succs[succ])))
+                        break
+                else:
+                    stack.pop()
+                    post[bid] = len(order)
+                    order.append(bid)
+        return pre, post, order
+
+    # -- label based interface
 
     def successors(self, lab):
         """Returns iterator over immediate successor blocks"""
-        return iter(self._fwd[lab])
+        return (self._blocks[bid].label for bid in self._succs[self._ids[lab]])
 
     def out_degree(self, lab):
-        return len(self._fwd[lab])
+        return len(self._succs[self._ids[lab]])
 
     def predecessors(self, lab):
         """Returns iterator over immediate predecessor blocks"""
-        return iter(self._bwd[lab])
+        return (self._blocks[bid].label for bid in self._preds[self._ids[lab]])
 
     def in_degree(self, lab):
-        return len(self._bwd[lab])
+        return len(self._preds[self._ids[lab]])
 
     def nodes(self):
-        return iter(self._blockmap.values())
+        return (bl for bl in self._blocks if bl is not None)
+
+    def postorder(self, all_blocks=False):
+        """Labels of the blocks in postorder, see postorder_ids()"""
+        return [self._blocks[bid].label for bid in self.postorder_ids(all_blocks)]
+
+    def reverse_postorder(self, all_blocks=False):
+        return [self._blocks[bid].label for bid in self.rpo_ids(all_blocks)]
 
     def edges(self):
         """
         Returns an iterator over all the edges.
         Each edge is represented as 2-tuples of (source, target) labels.
         """
-        for lab_from in self._fwd:
-            for lab_to in self._fwd[lab_from]:
-                yield (lab_from, lab_to)
+        for bid in self.node_ids():
+            lab_from = self._blocks[bid].label
+            for succ in self._succs[bid]:
+                yield (lab_from, self._blocks[succ].label)
 
     def add_node(self, block):
-        assert block.label not in self._blockmap
-        self._blockmap[block.label] = block
-        self._fwd[block.label] = set()
-        self._bwd[block.label] = set()
-        for jinstr in block.jumps:
-            dest = get_jump_dest(jinstr)
-            if dest:
-                self.add_edge(block.label, dest)
+        self._new_id(block)
+        self._link(block)
+        self._invalidate()
 
     def remove_node(self, block):
-        assert block.label in self._blockmap
-        del self._blockmap[block.label]
-        for lab_to in self._fwd[block.label]:
-            self._bwd[lab_to].remove(block.label)
-        del self._fwd[block.label]
+        bid = self._ids.pop(block.label)
+        for succ in self._succs[bid]:
+            self._preds[succ].remove(bid)
+        for pred in self._preds[bid]:
+            self._succs[pred].remove(bid)
+        self._blocks[bid] = None
+        self._succs[bid], self._preds[bid] = [], []
+        self._invalidate()
 
     def add_edge(self, lab_from, lab_to):
-        self._fwd[lab_from].add(lab_to)
-        self._bwd[lab_to].add(lab_from)
+        src, dst = self._ids[lab_from], self._ids[lab_to]
+        if dst not in self._succs[src]:
+            self._succs[src].append(dst)
+            self._preds[dst].append(src)
+            self._invalidate()
 
     def remove_edge(self, lab_from, lab_to):
-        self._fwd[lab_from].remove(lab_to)
-        self._bwd[lab_to].remove(lab_from)
+        src, dst = self._ids[lab_from], self._ids[lab_to]
+        self._succs[src].remove(dst)
+        self._preds[dst].remove(src)
+        self._invalidate()
 
     def instrs(self):
-        for bl in self._blockmap.values():
+        for bl in self.nodes():
             yield from bl.instrs()
 
+    def fresh_label(self):
+        """Return a label that is not used by any block of the CFG"""
+        if not hasattr(self, '_fresh_labels'):
+            name = self.proc_name[1:]
+            self._fresh_labels = counter(transfn=lambda n: f'%.L{name}_{n}')
+        lab = next(self._fresh_labels)
+        while lab in self._ids:
+            lab = next(self._fresh_labels)
+        return lab
+
+    def fresh_temp(self, root):
+        """Return a temporary of the form `root'.N that is not used in the
+        CFG. The temporaries in use are cached until the end of the pass
+        (see `preserves'): a pass that renames temporaries must not call
+        this afterwards."""
+        if not hasattr(self, '_temps'):
+            self._temps = set()
+            for instr in self.instrs():
+                self._temps.update(instr.defs())
+                self._temps.update(DefUse.used_temps(instr))
+            self._temp_counts = dict()
+        n = self._temp_counts.get(root, 0)
+        while f'{root}.{n}' in self._temps:
+            n += 1
+        self._temp_counts[root] = n + 1
+        self._temps.add(f'{root}.{n}')
+        return f'{root}.{n}'
+
     def instr_pairs(self, labeled=False):
         """
         The order of visiting the sequences is unspecified. If `labeled' is
@@ -161,14 +330,14 @@ class CFG:
         """
         # iterate over the edges
         for lab_from, lab_to in self.edges():
-            i1 = self._blockmap[lab_from].last_instr()
-            i2 = self._blockmap[lab_to].first_instr()
+            i1 = self[lab_from].last_instr()
+            i2 = self[lab_to].first_instr()
             if labeled:
                 yield (lab_from, i1, lab_to, i2)
             else:
                 yield (i1, i2)
         # iterate over the instruction pairs inside a block
-        for bl in self._blockmap.values():
+        for bl in self.nodes():
             if labeled:
                 for i1, i2 in bl.instr_pairs():
                     yield (bl.label, i1, bl.label, i2)
@@ -179,7 +348,7 @@ class CFG:
         dotfile = f'{tacfile}.{self.proc_name[1:]}.dot'
         with open(dotfile, 'w') as f:
             print(f'digraph {self.proc_name[1:]} {{', file=f)
-            for bl in self._blockmap.values():
+            for bl in self.nodes():
                 node_text = str(bl).replace('\n', r'\l')
                 first_break = node_text.find(r'\l') + 2
                 node_label, node_text = node_text[:
@@ -193,17 +362,16 @@ class CFG:
                 node_text = node_label + node_text
                 print(
                     f'{bl.label[2:]}[shape="box",fontname="monospace",fontsize=8,label="{node_text}"];', file=f)
-            for lab_from, lab_tos in self._fwd.items():
-                for lab_to in lab_tos:
-                    print(f'{lab_from[2:]} -> {lab_to[2:]};', file=f)
+            for lab_from, lab_to in self.edges():
+                print(f'{lab_from[2:]} -> {lab_to[2:]};', file=f)
             print('}', file=f)
 
 # ------------------------------------------------------------------------------
 
 
-_enders = re.compile(r'jmp|jz|jnz|jl|jle|jnl|jnle|ret')
-_jumps = re.compile(r'jmp|jz|jnz|jl|jle|jnl|jnle')
-_jcc = re.compile(r'jz|jnz|jl|jle|jnl|jnle')
+_enders = re.compile(r'jmp|jz|jnz|jl|jle|jnl|jnle|jtab|ret')
+_jumps = re.compile(r'jmp|jz|jnz|jl|jle|jnl|jnle|jtab')
+_jcc = re.compile(r'jz|jnz|jl|jle|jnl|jnle|jtab')
 _jabs = re.compile(r'jmp|ret')
 _unconditional = re.compile(r'label|jmp|ret')
 
@@ -214,10 +382,25 @@ def apply_label_rewrite(jinstr, tab):
     elif jinstr.opcode == 'phi':
         jinstr.arg1 = tuple((tab.get(lab, lab), tmp)
                             for (lab, tmp) in jinstr.arg1.items())
+    elif jinstr.opcode == 'jtab':
+        jinstr.arg2 = [tab.get(lab, lab) for lab in jinstr.arg2]
     elif jinstr.opcode != 'ret':
         jinstr.arg2 = tab.get(jinstr.arg2, jinstr.arg2)
 
 
+def rewrite_uses(instr, tab):
+    """Rewrite the temporaries used (but not defined) by `instr' according
+    to the dictionary `tab'"""
+    if instr.opcode == 'phi':
+        for lab, tmp in instr.arg1.items():
+            instr.arg1[lab] = tab.get(tmp, tmp)
+        return
+    if tac.Instr._istemp(instr.arg1):
+        instr.arg1 = tab.get(instr.arg1, instr.arg1)
+    if tac.Instr._istemp(instr.arg2):
+        instr.arg2 = tab.get(instr.arg2, instr.arg2)
+
+
 class counter:
     """A simple counter"""
 
@@ -328,15 +511,91 @@ def infer(tac_proc):
             instr = tac_proc.body[cur]
             if not _enders.fullmatch(instr.opcode):
                 break
-            bl.jumps.append(instr)
+            # the jumps following a jmp or ret are never executed
+            if not bl.jumps or not _jabs.fullmatch(bl.jumps[-1].opcode):
+                bl.jumps.append(instr)
             cur += 1
         blocks.append(bl)
     return CFG(tac_proc.name, lab_entry, blocks)
 
+def split_edge(cfg, lab_from, lab_to):
+    """Insert a new empty block on the edge `lab_from' -> `lab_to' and return
+    its label. The phi-functions of `lab_to' are updated accordingly."""
+    lab = cfg.fresh_label()
+    for jinstr in cfg[lab_from].jumps:
+        if lab_to in get_jump_dests(jinstr):
+            apply_label_rewrite(jinstr, {lab_to: lab})
+    for instr in cfg[lab_to].body:
+        if instr.opcode == 'phi' and lab_from in instr.arg1:
+            instr.arg1[lab] = instr.arg1.pop(lab_from)
+    cfg.remove_edge(lab_from, lab_to)
+    cfg.add_node(Block(lab, jumps=[tac.Instr(None, 'jmp', (lab_to, None))]))
+    cfg.add_edge(lab_from, lab)
+    return lab
+
+
+def find_preheader(cfg, head, body):
+    """The block outside of the loop (`head', `body') that is the only way
+    into it and whose only successor is `head', or None"""
+    outside = [lab for lab in cfg.predecessors(head) if lab not in body]
+    if head != cfg.lab_entry and len(outside) == 1 and \
+       cfg.out_degree(outside[0]) == 1:
+        return outside[0]
+
+
+def insert_preheader(cfg, head, body):
+    """Make sure that the loop with header `head' and set of blocks `body'
+    is entered from a single block outside of the loop, whose only
+    successor is `head', and return the label of that block (the
+    preheader). When a new block is needed, the arguments of the
+    phi-functions of `head' coming from outside the loop are merged by
+    phi-functions in the preheader."""
+    pre = find_preheader(cfg, head, body)
+    if pre is not None:
+        return pre
+    outside = [lab for lab in cfg.predecessors(head) if lab not in body]
+    keys = outside + [cfg.proc_name] if head == cfg.lab_entry else outside
+    pre = cfg.fresh_label()
+    phis = []
+    for instr in cfg[head].body:
+        if instr.opcode != 'phi':
+            break
+        args = {lab: instr.arg1.pop(lab) for lab in keys if lab in instr.arg1}
+        if len(set(args.values())) == 1:
+            instr.arg1[pre] = next(iter(args.values()))
+        else:
+            root = instr.dest[:instr.dest.rindex('.')] if '.' in instr.dest \
+                else instr.dest
+            tmp = cfg.fresh_temp(root)
+            phis.append(tac.Instr(tmp, 'phi', (args, None)))
+            instr.arg1[pre] = tmp
+    for lab in outside:
+        for jinstr in cfg[lab].jumps:
+            if head in get_jump_dests(jinstr):
+                apply_label_rewrite(jinstr, {head: pre})
+        cfg.remove_edge(lab, head)
+    cfg.add_node(Block(pre, phis, [tac.Instr(None, 'jmp', (head, None))]))
+    for lab in outside:
+        cfg.add_edge(lab, pre)
+    if head == cfg.lab_entry:
+        cfg.lab_entry = pre
+    return pre
+
+
+def split_critical_edges(cfg):
+    """Split every edge going from a block with several successors to a
+    block with several predecessors"""
+    critical = [(lab_from, lab_to) for lab_from, lab_to in cfg.edges()
+                if cfg.out_degree(lab_from) > 1 and cfg.in_degree(lab_to) > 1]
+    for lab_from, lab_to in critical:
+        split_edge(cfg, lab_from, lab_to)
+
 # --------------------------------------------------------------------------------
 
 
-def linearize(tac_proc, cfg):
+def linearize(tac_proc, cfg, order=None):
+    """Replace the body of `tac_proc' by the blocks of `cfg', in the
+    given `order' of labels if any (see layout.block_order)"""
     seen = set()
     wl = [cfg.lab_entry]
     schedule = []
@@ -346,6 +605,11 @@ def linearize(tac_proc, cfg):
         schedule.append(tac.Instr(None, 'label', (bl.label, None)))
         for instr in bl.instrs():
             schedule.append(instr)
+    if order is not None:
+        for lab in order:
+            emit(cfg[lab])
+        tac_proc.body = schedule
+        return
     ret_wl = []
     while len(wl) > 0:
         cur = wl.pop()
@@ -370,51 +634,299 @@ def linearize(tac_proc, cfg):
 # ------------------------------------------------------------------------------
 
 
-def filter_liveset(lab, lset):
-    for x in lset:
-        if isinstance(x, tuple):
-            if x[0] == lab:
-                yield x[1]
-        else:
-            yield x
-
-
 def recompute_liveness(cfg, livein, liveout):
     """Perform liveness analysis on the given cfg, storing the results in `livein' and `liveout'.
-    Note: both `livein' and `liveout' are cleaned out before computing liveness."""
+    Note: both `livein' and `liveout' are cleaned out before computing liveness.
+    The livein set of a phi-function also contains the arguments of that
+    phi-function and of the phi-functions that follow it in the block."""
     livein.clear()
     liveout.clear()
-    # initialize livein with the use sets
-    for i in cfg.instrs():
-        livein[i] = set(i.uses())
-        liveout[i] = set()
-    dirty = True
-
-    def update_livein(i, j_livein):
-        nonlocal dirty
-        old_count = len(livein[i])
-        old_set = str(livein[i])
-        i_defs = set(i.defs())
-        for x in j_livein:
-            if ((isinstance(x, tuple) and x[1] in i_defs) or
-                    x in i_defs):
-                continue
-            livein[i].add(x)
-        if old_count != len(livein[i]):
-            dirty = True
-    while dirty:
-        dirty = False
-        for (li, i, lj, j) in cfg.instr_pairs(labeled=True):
-            if li == lj:
-                update_livein(i, livein[j])
+    live = cfg.analyses['liveness']
+    for bl in cfg.nodes():
+        phi_uses = set()
+        for instr, li, lo in reversed(live.instr_facts(bl.label)):
+            if instr.opcode == 'phi':
+                phi_uses.update(t for _, t in instr.uses())
+            livein[instr] = live.sets(li) | phi_uses
+            liveout[instr] = live.sets(lo)
+
+# ------------------------------------------------------------------------------
+
+
+class DominatorTree:
+    """Dominator tree of the blocks reachable from the entry of a CFG,
+    computed with the algorithm of Cooper, Harvey and Kennedy, together with
+    the dominance frontiers"""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        # computed on block ids, following the orders cached by the CFG
+        rpo = cfg.rpo_ids()
+        rank = [None] * cfg.num_ids()
+        for i, bid in enumerate(rpo):
+            rank[bid] = i
+        entry = rpo[0]
+        idom = [None] * cfg.num_ids()
+        idom[entry] = entry
+
+        def intersect(b1, b2):
+            while b1 != b2:
+                while rank[b1] > rank[b2]:
+                    b1 = idom[b1]
+                while rank[b2] > rank[b1]:
+                    b2 = idom[b2]
+            return b1
+        changed = True
+        while changed:
+            changed = False
+            for bid in rpo[1:]:
+                new_idom = None
+                for pred in cfg.pred_ids(bid):
+                    if idom[pred] is None:
+                        continue
+                    new_idom = pred if new_idom is None else \
+                        intersect(pred, new_idom)
+                if idom[bid] != new_idom:
+                    idom[bid] = new_idom
+                    changed = True
+        label = cfg.block_label
+        self.idom = {label(bid): label(idom[bid]) for bid in rpo}
+        self.children = {label(bid): [] for bid in rpo}
+        for bid in rpo[1:]:
+            self.children[label(idom[bid])].append(label(bid))
+        # preorder and postorder numbers for constant time dominance checks
+        self._pre, self._post = dict(), dict()
+        lab_entry = label(entry)
+        stack = [(lab_entry, iter(self.children[lab_entry]))]
+        self._pre[lab_entry] = 0
+        while stack:
+            lab, kids = stack[-1]
+            for kid in kids:
+                self._pre[kid] = len(self._pre)
+                stack.append((kid, iter(self.children[kid])))
+                break
             else:
-                update_livein(i, filter_liveset(li, livein[j]))
-    for li, i, lj, j in cfg.instr_pairs(labeled=True):
-        liveout[i].update(filter_liveset(li, livein[j]))
-    # fix the livein sets to remove tuples
-    for i, li in livein.items():
-        livein[i] = {x[1] if isinstance(x, tuple) else x
-                     for x in li}
+                stack.pop()
+                self._post[lab] = len(self._post)
+        # dominance frontiers; the entry has an extra incoming edge from the
+        # start of the procedure, coming from a virtual root (None)
+        frontier = {bid: set() for bid in rpo}
+        for bid in rpo:
+            preds = [p for p in cfg.pred_ids(bid) if idom[p] is not None]
+            if len(preds) + (bid == entry) < 2:
+                continue
+            stop = None if bid == entry else idom[bid]
+            for pred in preds:
+                runner = pred
+                while runner != stop:
+                    frontier[runner].add(bid)
+                    runner = None if runner == entry else idom[runner]
+        self.frontier = {label(bid): {label(df) for df in dfs}
+                         for bid, dfs in frontier.items()}
+
+    def __contains__(self, lab):
+        return lab in self.idom
+
+    def dominates(self, lab1, lab2):
+        """Does `lab1' dominate `lab2'? (every block dominates itself)"""
+        return self._pre[lab1] <= self._pre[lab2] and \
+            self._post[lab2] <= self._post[lab1]
+
+    def preorder(self):
+        """Iterator over the blocks in a preorder of the dominator tree"""
+        return iter(sorted(self._pre, key=self._pre.get))
+
+    def iterated_frontier(self, labs):
+        """The iterated dominance frontier of the set of blocks `labs'"""
+        result = set()
+        worklist = [lab for lab in labs if lab in self.frontier]
+        while worklist:
+            lab = worklist.pop()
+            for df in self.frontier[lab]:
+                if df not in result:
+                    result.add(df)
+                    worklist.append(df)
+        return result
+
+
+
+class LoopForest:
+    """Natural loops of a CFG. Back edges are the edges whose target
+    dominates their source; the back edges sharing a header form a single
+    loop. `body' maps every header to the set of labels of its loop,
+    `parent' maps it to the header of the innermost enclosing loop (or
+    None), and `depth' maps every block to the number of loops containing it
+    (0 outside of loops)."""
+
+    def __init__(self, cfg, domtree):
+        self.cfg = cfg
+        self.body = dict()
+        for lab_to in domtree.preorder():
+            for lab_from in cfg.predecessors(lab_to):
+                if lab_from not in domtree or \
+                   not domtree.dominates(lab_to, lab_from):
+                    continue
+                body = self.body.setdefault(lab_to, {lab_to})
+                worklist = [lab_from]
+                while worklist:
+                    lab = worklist.pop()
+                    if lab in body:
+                        continue
+                    body.add(lab)
+                    worklist.extend(p for p in cfg.predecessors(lab)
+                                    if p in domtree)
+        # loops are nested when their bodies are; sorting by size visits
+        # the outer loops before the inner ones
+        self.parent = dict()
+        self.depth = {bl.label: 0 for bl in cfg.nodes()}
+        self.innermost = dict()
+        for head in sorted(self.body, key=lambda h: len(self.body[h]),
+                           reverse=True):
+            self.parent[head] = self.innermost.get(head)
+            for lab in self.body[head]:
+                self.depth[lab] += 1
+                self.innermost[lab] = head
+
+    def headers(self):
+        """Loop headers, outer loops first"""
+        return sorted(self.body, key=lambda h: self.depth[h])
+
+    def back_edges(self, head):
+        return [lab for lab in self.cfg.predecessors(head)
+                if lab in self.body[head]]
+
+    def preheader(self, head):
+        """The preheader of the loop, or None (see insert_preheader)"""
+        return find_preheader(self.cfg, head, self.body[head])
+
+    def exits(self, head):
+        """Edges (lab_from, lab_to) leaving the loop of header `head'"""
+        return [(lab, succ) for lab in self.body[head]
+                for succ in self.cfg.successors(lab)
+                if succ not in self.body[head]]
+
+# ------------------------------------------------------------------------------
+
+
+class DefUse:
+    """Def-use index of a CFG in SSA form: `defs' maps each temporary to the
+    pair (label, instr) of its definition and `uses' maps each temporary to
+    a dict {id(instr): (label, instr)} of the instructions using it. Passes
+    keep the index up to date by going through add_instr, remove_instr and
+    rewrite, and by declaring that they preserve 'defuse'."""
+
+    def __init__(self, cfg):
+        self.defs = dict()
+        self.uses = dict()
+        for bl in cfg.nodes():
+            for instr in bl.instrs():
+                self.add_instr(bl.label, instr)
+
+    @staticmethod
+    def used_temps(instr):
+        """Iterator over the temporaries used by `instr', phi included"""
+        for t in instr.uses():
+            yield t[1] if isinstance(t, tuple) else t
+
+    def add_instr(self, lab, instr):
+        """Index `instr', which belongs to the block `lab'"""
+        for t in instr.defs():
+            self.defs[t] = (lab, instr)
+        for t in self.used_temps(instr):
+            self.uses.setdefault(t, dict())[id(instr)] = (lab, instr)
+
+    def remove_instr(self, instr):
+        """Forget about `instr'; it is up to the caller to take it out of
+        its block"""
+        for t in instr.defs():
+            if self.defs.get(t, (None, None))[1] is instr:
+                del self.defs[t]
+        for t in self.used_temps(instr):
+            self.uses.get(t, dict()).pop(id(instr), None)
+
+    def rewrite(self, lab, instr, rew):
+        """Apply instr.rewrite_temps(rew) and update the index"""
+        self.remove_instr(instr)
+        instr.rewrite_temps(rew)
+        self.add_instr(lab, instr)
+
+    def replace_uses(self, old, new):
+        """Replace every use of the temporary `old' by `new'"""
+        for lab, instr in list(self.uses.get(old, dict()).values()):
+            self.remove_instr(instr)
+            rewrite_uses(instr, {old: new})
+            self.add_instr(lab, instr)
+
+    def use_count(self, t):
+        return len(self.uses.get(t, ()))
+
+def spill_costs(cfg):
+    """Estimated cost of spilling every temporary: each definition and use
+    counts 10 ** (loop depth of its block)"""
+    depth = cfg.analyses['loops'].depth
+    costs = dict()
+    for bl in cfg.nodes():
+        weight = 10 ** depth[bl.label]
+        for instr in bl.instrs():
+            for t in itertools.chain(instr.defs(), DefUse.used_temps(instr)):
+                costs[t] = costs.get(t, 0) + weight
+    return costs
+
+# ------------------------------------------------------------------------------
+# analysis manager
+
+_analyses = {
+    'liveness': lambda cfg: dataflow.solve(dataflow.Liveness(cfg)),
+    'dominators': DominatorTree,
+    'loops': lambda cfg: LoopForest(cfg, cfg.analyses['dominators']),
+    'defuse': DefUse,
+}
+
+
+class AnalysisManager:
+    """Analyses of a CFG, computed lazily and cached. The cache is cleared
+    when the CFG is mutated through its API and, for the analyses that a
+    pass does not preserve (see `preserves'), after every pass. `computed'
+    counts how many times each analysis was computed."""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self._cache = dict()
+        self.computed = {name: 0 for name in _analyses}
+
+    def __getitem__(self, name):
+        if name not in self._cache:
+            self.computed[name] += 1
+            self._cache[name] = _analyses[name](self.cfg)
+        return self._cache[name]
+
+    def __contains__(self, name):
+        return name in self._cache
+
+    def invalidate(self, preserved=()):
+        """Drop the cached analyses, except those named in `preserved'"""
+        for name in list(self._cache):
+            if name not in preserved:
+                del self._cache[name]
+
+
+def preserves(*names):
+    """Decorator for the passes that take a CFG among their positional
+    arguments: once the pass is done, the analyses of that CFG other than
+    `names' are invalidated, and so are the temporaries in use cached by
+    `CFG.fresh_temp' (the pass may have renamed them)"""
+    def decorate(pass_fn):
+        @functools.wraps(pass_fn)
+        def run_pass(*args, **kwargs):
+            result = pass_fn(*args, **kwargs)
+            for arg in args:
+                if isinstance(arg, CFG):
+                    arg.analyses.invalidate(names)
+                    arg.__dict__.pop('_temps', None)
+            return result
+        run_pass.preserved = frozenset(names)
+        return run_pass
+    return decorate
 
 # ------------------------------------------------------------------------------
 
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+"""
+Bit-vector dataflow analysis
+
+Facts are sets drawn from a finite universe (temporaries, definitions,
+expressions, ...) and are represented as Python ints used as bitsets.
+Every block is summarized by a gen and a kill set; the block level
+equations are then solved with a worklist visited in reverse postorder
+(forward problems) or postorder (backward problems). Facts for the
+individual instructions are only computed on demand.
+"""
+
+import heapq
+
+import tac
+
+# ------------------------------------------------------------------------------
+
+
+class Universe:
+    """Bijection between the items of a finite set and bit positions"""
+
+    def __init__(self, items=()):
+        self._index = dict()
+        self._items = []
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        """Return the bit position of `item', allocating one if needed"""
+        pos = self._index.get(item)
+        if pos is None:
+            pos = self._index[item] = len(self._items)
+            self._items.append(item)
+        return pos
+
+    def bit(self, item):
+        return 1 << self.add(item)
+
+    def bits(self, items):
+        b = 0
+        for item in items:
+            b |= 1 << self.add(item)
+        return b
+
+    def items(self, bits):
+        """Iterator over the items whose bits are set in `bits'"""
+        while bits:
+            low = bits & -bits
+            yield self._items[low.bit_length() - 1]
+            bits ^= low
+
+    @property
+    def full(self):
+        return (1 << len(self._items)) - 1
+
+    def __len__(self):
+        return len(self._items)
+
+# ------------------------------------------------------------------------------
+
+
+class Problem:
+    """A bit-vector dataflow problem. Subclasses set `forward' and `may'
+    (union meet when True, intersection meet otherwise) and implement
+    `instr_gen_kill'."""
+
+    forward = True
+    may = True
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.universe = Universe()
+
+    def instr_gen_kill(self, instr):
+        """Return the pair (gen, kill) of bitsets for `instr'"""
+        raise NotImplementedError
+
+    def edge_gen(self, lab_from, lab_to):
+        """Facts generated on the edge `lab_from' -> `lab_to'"""
+        return 0
+
+    def boundary(self):
+        """Facts at the entry (forward) or at the exits (backward)"""
+        return 0
+
+    def transfer(self, instr, bits):
+        gen, kill = self.instr_gen_kill(instr)
+        return gen | (bits & ~kill)
+
+
+class Solution:
+    """Block level solution of a Problem, with per-instruction facts derived
+    on demand. For forward problems `block_in' is the meet over the
+    predecessors and `block_out' the result of the block transfer function;
+    for backward problems it is the other way around."""
+
+    def __init__(self, problem, block_in, block_out, iterations):
+        self.problem = problem
+        self.universe = problem.universe
+        self.block_in = block_in
+        self.block_out = block_out
+        self.iterations = iterations
+
+    def instr_facts(self, lab):
+        """Return the list of triples (instr, in, out) for the block `lab',
+        in program order"""
+        bl = self.problem.cfg[lab]
+        facts = []
+        if self.problem.forward:
+            bits = self.block_in[lab]
+            for instr in bl.instrs():
+                out = self.problem.transfer(instr, bits)
+                facts.append((instr, bits, out))
+                bits = out
+        else:
+            bits = self.block_out[lab]
+            for instr in bl.reversed_instrs():
+                inb = self.problem.transfer(instr, bits)
+                facts.append((instr, inb, bits))
+                bits = inb
+            facts.reverse()
+        return facts
+
+    def sets(self, bits):
+        return set(self.universe.items(bits))
+
+
+def solve(problem):
+    """Solve `problem' and return its Solution"""
+    cfg = problem.cfg
+    forward = problem.forward
+    # the blocks are handled by id, following the orders cached by the CFG
+    order = cfg.rpo_ids(True) if forward else cfg.postorder_ids(True)
+    n = cfg.num_ids()
+    rank = [0] * n
+    for i, bid in enumerate(order):
+        rank[bid] = i
+    labels = [None] * n
+    for bid in order:
+        labels[bid] = cfg.block_label(bid)
+
+    # summarize every block by its gen and kill sets
+    gen, kill = [0] * n, [0] * n
+    for bid in order:
+        bl = cfg[labels[bid]]
+        g, k = 0, 0
+        for instr in (bl.instrs() if forward else bl.reversed_instrs()):
+            ig, ik = problem.instr_gen_kill(instr)
+            g = ig | (g & ~ik)
+            k = (k & ~ig) | ik
+        gen[bid], kill[bid] = g, k
+
+    # `before' is the side where the meet happens, `after' the other one
+    if forward:
+        sources, dependents = cfg.pred_ids, cfg.succ_ids
+        edge_gen = lambda src, bid: problem.edge_gen(labels[src], labels[bid])
+    else:
+        sources, dependents = cfg.succ_ids, cfg.pred_ids
+        edge_gen = lambda src, bid: problem.edge_gen(labels[bid], labels[src])
+    entry = cfg.block_id(cfg.lab_entry)
+    top = 0 if problem.may else problem.universe.full
+    boundary = problem.boundary()
+    before = [0] * n
+    after = [gen[bid] | (top & ~kill[bid]) for bid in range(n)]
+
+    # blocks are visited in passes following the order; a block that must be
+    # revisited is handled later in the current pass if it comes after the
+    # current block in the order, and in the next pass otherwise
+    worklist = [(rank[bid], bid) for bid in order]
+    next_pass = []
+    pending = [False] * n
+    for bid in order:
+        pending[bid] = True
+    iterations = 0
+    while worklist or next_pass:
+        if not worklist:
+            worklist, next_pass = next_pass, worklist
+            heapq.heapify(worklist)
+        _, bid = heapq.heappop(worklist)
+        pending[bid] = False
+        iterations += 1
+        srcs = sources(bid)
+        if not srcs or (forward and bid == entry):
+            bits = boundary
+        else:
+            bits = None
+        for src in srcs:
+            fact = after[src] | edge_gen(src, bid)
+            if bits is None:
+                bits = fact
+            elif problem.may:
+                bits |= fact
+            else:
+                bits &= fact
+        before[bid] = bits
+        new = gen[bid] | (bits & ~kill[bid])
+        if new != after[bid]:
+            after[bid] = new
+            for dep in dependents(bid):
+                if not pending[dep]:
+                    pending[dep] = True
+                    if rank[dep] > rank[bid]:
+                        heapq.heappush(worklist, (rank[dep], dep))
+                    else:
+                        next_pass.append((rank[dep], dep))
+    before = {labels[bid]: before[bid] for bid in order}
+    after = {labels[bid]: after[bid] for bid in order}
+    if forward:
+        return Solution(problem, before, after, iterations)
+    return Solution(problem, after, before, iterations)
+
+# ------------------------------------------------------------------------------
+
+
+class Liveness(Problem):
+    """Live temporaries. Arguments of phi-functions are live on the
+    corresponding incoming edge only."""
+
+    forward = False
+    may = True
+
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        self._phi_uses = dict()
+        for bl in cfg.nodes():
+            for instr in bl.body:
+                if instr.opcode != 'phi':
+                    continue
+                for lab, tmp in instr.arg1.items():
+                    if tac.Instr._istemp(tmp):
+                        key = (lab, bl.label)
+                        self._phi_uses[key] = self._phi_uses.get(key, 0) | \
+                            self.universe.bit(tmp)
+
+    def instr_gen_kill(self, instr):
+        gen = 0
+        for x in instr.uses():
+            if not isinstance(x, tuple):
+                gen |= self.universe.bit(x)
+        return gen, self.universe.bits(instr.defs())
+
+    def edge_gen(self, lab_from, lab_to):
+        return self._phi_uses.get((lab_from, lab_to), 0)
+
+
+class ReachingDefinitions(Problem):
+    """Definitions (instructions) that may reach a program point"""
+
+    forward = True
+    may = True
+
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        self._defs_of = dict()
+        for instr in cfg.instrs():
+            for tmp in instr.defs():
+                self._defs_of[tmp] = self._defs_of.get(tmp, 0) | \
+                    self.universe.bit(instr)
+
+    def instr_gen_kill(self, instr):
+        kill = 0
+        for tmp in instr.defs():
+            kill |= self._defs_of[tmp]
+        if not kill:
+            return 0, 0
+        return self.universe.bit(instr), kill
+
+
+_pure_ops = frozenset(tac.binops) - {'div', 'mod'} | frozenset(tac.unops)
+
+
+def expr_key(instr):
+    """The expression computed by `instr', or None if it is not a candidate
+    for available expressions"""
+    if instr.opcode in _pure_ops:
+        return (instr.opcode, instr.arg1, instr.arg2)
+
+
+class AvailableExpressions(Problem):
+    """Expressions (opcode, arg1, arg2) computed on every path to a program
+    point and whose operands have not been redefined since"""
+
+    forward = True
+    may = False
+
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        self._exprs_of = dict()
+        for instr in cfg.instrs():
+            key = expr_key(instr)
+            if key is None:
+                continue
+            bit = self.universe.bit(key)
+            for arg in key[1:]:
+                if arg is not None:
+                    self._exprs_of[arg] = self._exprs_of.get(arg, 0) | bit
+
+    def instr_gen_kill(self, instr):
+        key = expr_key(instr)
+        kill = 0
+        if instr.dest:
+            kill = self._exprs_of.get(instr.dest, 0)
+        if instr.opcode == 'call':
+            # callees may write any global
+            for arg, bits in self._exprs_of.items():
+                if arg.startswith('@'):
+                    kill |= bits
+        gen = 0
+        if key is not None and instr.dest not in key[1:]:
+            gen = self.universe.bit(key)
+        return gen, kill
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+"""
+If-conversion
+
+Replaces the small conditional diamonds of a CFG out of SSA form by
+straight-line code. A head block ending in
+
+    j<cc> %c, A;  jmp B
+
+whose two sides (each either empty or a single block, possibly behind
+empty forwarding blocks) meet again at a join block J, and whose side
+blocks compute nothing but a few side-effect-free operations, becomes
+
+    <both sides, on fresh temporaries>;  <selects>;  jmp J
+
+where every temporary assigned on a side and live at J is selected by a
+`set<cc>' when its two values are the constants 1 and 0 (as in the
+materialization of a boolean expression: `const 0', a short-circuit tree,
+then `const 1'), and by a `cmov<cc>' otherwise. The conversion is repeated
+until no diamond is left, so that the short-circuit trees collapse from
+the inside out. A side block with other predecessors, such as the `const 1'
+shared by the branches of a `||', is copied and left in place. `cmov<cc>'
+reads its destination: the result must not be put in SSA form again.
+"""
+
+import cfg as cfglib
+import tac
+
+# ------------------------------------------------------------------------------
+
+_inverse = {'z': 'nz', 'nz': 'z', 'l': 'nl', 'nl': 'l',
+            'le': 'nle', 'nle': 'le'}
+
+# no division (it may trap) and no shift (the interpreter rejects negative
+# counts): the speculated code must run whichever side is taken
+_speculable = frozenset(['const', 'copy', 'add', 'sub', 'mul', 'and', 'or',
+                         'xor', 'neg', 'not']) | \
+    frozenset('set' + cc for cc in _inverse) | frozenset(tac.cmovs)
+
+
+def _side(cfg, lab, head):
+    """The side of the diamond of `head' starting at `lab', as the triple
+    (labels only reached through the side, label of its block with
+    instructions or None, label where it ends)"""
+    own, body = [], None
+    while lab not in (head, cfg.lab_entry) and lab not in own and \
+            cfg.in_degree(lab) == 1:
+        bl = cfg[lab]
+        if len(bl.jumps) != 1 or bl.jumps[0].opcode != 'jmp' or \
+           bl.body and body is not None:
+            break
+        if bl.body:
+            body = lab
+        own.append(lab)
+        lab = bl.jumps[0].arg1
+    return own, body, lab
+
+
+def _extend(cfg, side, head, join):
+    """`side' followed by a copy of the block where it ends, if that block
+    has instructions and goes to `join'; otherwise `side' itself"""
+    own, body, lab = side
+    bl = cfg[lab]
+    if body is None and lab not in (head, cfg.lab_entry) and bl.body and \
+       len(bl.jumps) == 1 and bl.jumps[0].opcode == 'jmp' and \
+       bl.jumps[0].arg1 == join:
+        return own, lab, join
+    return side
+
+
+def _known(cfg, lab, tmp):
+    """The constant held by `tmp' at the end of the block `lab', looking
+    back through the single predecessors, or None if unknown"""
+    seen = set()
+    while lab not in seen:
+        seen.add(lab)
+        for instr in reversed(cfg[lab].body):
+            if instr.dest == tmp:
+                return instr.arg1 if instr.opcode == 'const' else None
+        if cfg.in_degree(lab) != 1:
+            return None
+        lab = next(iter(cfg.predecessors(lab)))
+    return None
+
+
+def _speculable_block(bl, max_size):
+    return len(bl.body) <= max_size and \
+        all(instr.opcode in _speculable and tac.Instr._istemp(instr.dest)
+            for instr in bl.body)
+
+
+def convert(cfg, head, *, max_size=4):
+    """If-convert the diamond ending the block `head' of `cfg', whose side
+    blocks have at most `max_size' instructions. Returns True if it was
+    converted, and False if it does not have the shape described above."""
+    jumps = cfg[head].jumps
+    if len(jumps) != 2 or jumps[0].opcode not in tac.jumps or \
+       jumps[1].opcode != 'jmp' or jumps[0].arg2 == jumps[1].arg1:
+        return False
+    c, cc = jumps[0].arg1, jumps[0].opcode[1:]
+    side_a = _side(cfg, jumps[0].arg2, head)
+    side_b = _side(cfg, jumps[1].arg1, head)
+    # a side may end with a block shared with other paths, which is copied
+    side_a = _extend(cfg, side_a, head, side_b[2])
+    side_b = _extend(cfg, side_b, head, side_a[2])
+    (own_a, body_a, join), (own_b, body_b, join_b) = side_a, side_b
+    if join != join_b or \
+       any(instr.opcode == 'phi' for instr in cfg[join].body) or \
+       any(not _speculable_block(cfg[lab], max_size)
+           for lab in (body_a, body_b) if lab is not None):
+        return False
+    code = []
+
+    def materialize(val, tmp):
+        """A temporary holding the value that `val' gives to `tmp'"""
+        v = val.get(tmp, tmp)
+        if isinstance(v, int):
+            new = cfg.fresh_temp('%ifc')
+            code.append(tac.Instr(new, 'const', (v,)))
+            v = val[tmp] = new
+        return v
+
+    def speculate(lab):
+        """Append the block `lab' to `code' on fresh temporaries. Returns
+        the value (temporary or constant) of every temporary assigned."""
+        val = dict()
+        for instr in cfg[lab].body if lab is not None else ():
+            if instr.opcode == 'const':
+                val[instr.dest] = instr.arg1
+            elif instr.opcode == 'copy':
+                val[instr.dest] = val.get(instr.arg1, instr.arg1)
+            else:
+                args = [materialize(val, arg) for arg in
+                        (instr.arg1, instr.arg2) if arg is not None]
+                new = cfg.fresh_temp('%ifc')
+                if instr.opcode in tac.cmovs:
+                    code.append(tac.Instr(new, 'copy',
+                                          (materialize(val, instr.dest),)))
+                code.append(tac.Instr(new, instr.opcode, args))
+                val[instr.dest] = new
+        return val
+
+    val_a, val_b = speculate(body_a), speculate(body_b)
+    live = cfg.analyses['liveness']
+    pairs = [(tmp, val_a.get(tmp, tmp), val_b.get(tmp, tmp))
+             for tmp in dict.fromkeys([*val_a, *val_b])
+             if live.block_in[join] & live.universe.bit(tmp)]
+    pairs = [(tmp, a, b) for tmp, a, b in pairs if a != b]
+    # when a select overwrites what another one reads, they all go through
+    # fresh temporaries copied back at the end
+    hazard = any(tmp == c or any(tmp in (a, b) for t, a, b in pairs
+                                 if t != tmp)
+                 for tmp, _, _ in pairs)
+    copies = []
+    for tmp, a, b in pairs:
+        dest = tmp
+        if hazard:
+            dest = cfg.fresh_temp('%ifc')
+            copies.append(tac.Instr(tmp, 'copy', (dest,)))
+        ka = a if isinstance(a, int) else \
+            _known(cfg, head, tmp) if a == tmp else None
+        kb = b if isinstance(b, int) else \
+            _known(cfg, head, tmp) if b == tmp else None
+        if ka is not None and kb is not None and \
+           {tac.twoc(ka), tac.twoc(kb)} == {0, 1}:
+            setcc = 'set' + (cc if tac.twoc(ka) == 1 else _inverse[cc])
+            code.append(tac.Instr(dest, setcc, (c,)))
+            continue
+        base, src, cond = (a, b, _inverse[cc]) if a == tmp else (b, a, cc)
+        src = materialize({tmp: src}, tmp)
+        if base != dest:
+            code.append(tac.Instr(dest, 'const' if isinstance(base, int)
+                                  else 'copy', (base,)))
+        code.append(tac.Instr(dest, 'cmov' + cond, (c, src)))
+    code.extend(copies)
+    for lab in own_a + own_b:
+        cfg.remove_node(cfg[lab])
+    for lab in list(cfg.successors(head)):
+        cfg.remove_edge(head, lab)
+    cfg[head].body.extend(code)
+    cfg[head].jumps = [tac.Instr(None, 'jmp', (join,))]
+    cfg.add_edge(head, join)
+    return True
+
+
+@cfglib.preserves()
+def if_convert(cfg, **kwargs):
+    """If-convert the diamonds of `cfg', which must be out of SSA form,
+    innermost first (see `convert', which takes the keyword arguments).
+    Returns the number of diamonds converted."""
+    converted, changed = 0, True
+    while changed:
+        changed = False
+        for lab in cfg.postorder():
+            if lab in cfg and convert(cfg, lab, **kwargs):
+                converted += 1
+                changed = True
+    return converted
+
+
+def if_convert_decls(decls, **kwargs):
+    """If-convert every procedure of the program `decls', which must be out
+    of SSA form. Returns the number of diamonds converted."""
+    converted = 0
+    for decl in decls:
+        if isinstance(decl, tac.Proc):
+            cfg = cfglib.infer(decl)
+            converted += if_convert(cfg, **kwargs)
+            cfglib.linearize(decl, cfg)
+    return converted
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    ap = argparse.ArgumentParser(description='If-conversion. TAC->TAC')
+    ap.add_argument('fname', metavar='FILE', type=str,
+                    help='The TAC file (.tac or .tac.json) to process')
+    ap.add_argument('-o', '--output', dest='output', type=str)
+    opts = ap.parse_args()
+    decls = tac.load_tac(opts.fname)
+    print(f'// {if_convert_decls(decls)} diamonds converted')
+    if opts.output:
+        with open(opts.output, 'w') as fp:
+            json.dump([decl.js_obj for decl in decls], fp)
+    else:
+        for decl in decls:
+            print(decl)
@@ -0,0 +1,662 @@
+#!/usr/bin/env python3
+
+"""
+Interprocedural analyses and optimizations
+
+The call graph of a TAC program, summaries of the effects of procedures,
+the removal of dead procedures, arguments and results, a procedure inliner,
+tail recursion elimination, and the specialization of procedures for
+constant arguments. These work on linear TAC before SSA construction. The
+inliner clones the body of the callee at the call site with its
+temporaries and labels renamed, the `param' instructions become copies
+into the (renamed) arguments of the callee, and every `ret' becomes a copy
+into the result of the call followed by a jump to a join label placed
+after the clone.
+"""
+
+import copy
+
+import cfg as cfglib
+import ssagen
+import tac
+import tac_doft
+
+# ------------------------------------------------------------------------------
+
+
+def proc_size(proc):
+    """Number of instructions of `proc', labels and nops excluded"""
+    return sum(1 for instr in proc.body if instr.opcode not in ('label', 'nop'))
+
+
+def call_sites(proc):
+    """Iterator over the pairs (index, params) of the calls of `proc' to
+    other procedures, where `params' maps each argument number to the index
+    of the `param' instruction that passes it"""
+    params = dict()
+    for i, instr in enumerate(proc.body):
+        if instr.opcode == 'param':
+            params[instr.arg1] = i
+        elif instr.opcode == 'call':
+            if not instr.arg1.startswith('@__bx_print'):
+                yield i, params
+            params = dict()
+        elif instr.opcode == 'label':
+            params = dict()
+
+
+def fold(instr, consts):
+    """The value of `instr' if its operands are the known constants of
+    `consts', or None"""
+    args = [consts.get(arg) for arg in (instr.arg1, instr.arg2)
+            if arg is not None]
+    if None in args:
+        return None
+    try:
+        if instr.opcode in tac.binops:
+            value = tac.binops[instr.opcode](*map(tac.twoc, args))
+        elif instr.opcode in tac.unops:
+            value = tac.unops[instr.opcode](*map(tac.twoc, args))
+        else:
+            return None
+    except Exception:
+        return None
+    return tac.untwoc(value)
+
+
+def constant_args(proc):
+    """Iterator over the triples (index, params, args) of the calls of
+    `proc' as in `call_sites', where `args' maps each argument number to the
+    value of the argument when it is a constant known in the block of the
+    call (possibly computed by folding, through temporaries only), and to
+    None otherwise"""
+    consts, params, args = dict(), dict(), dict()
+    for i, instr in enumerate(proc.body):
+        if instr.opcode == 'label':
+            consts, params, args = dict(), dict(), dict()
+        elif instr.opcode == 'param':
+            params[instr.arg1] = i
+            args[instr.arg1] = consts.get(instr.arg2)
+        elif instr.opcode == 'call':
+            if not instr.arg1.startswith('@__bx_print'):
+                yield i, params, args
+            params, args = dict(), dict()
+        if not tac.Instr._istemp(instr.dest):
+            # a global may be written by the calls in between
+            continue
+        if instr.opcode == 'const':
+            consts[instr.dest] = instr.arg1
+        elif instr.opcode == 'copy' and instr.arg1 in consts:
+            consts[instr.dest] = consts[instr.arg1]
+        elif instr.dest:
+            value = fold(instr, consts)
+            if value is None:
+                consts.pop(instr.dest, None)
+            else:
+                consts[instr.dest] = value
+
+
+class CallGraph:
+    """The procedures of a TAC program with the calls between them. Calls to
+    the runtime are ignored."""
+
+    def __init__(self, decls):
+        self.procs = {decl.name: decl for decl in decls
+                      if isinstance(decl, tac.Proc)}
+        self.callees = {name: set() for name in self.procs}
+        self.callers = {name: set() for name in self.procs}
+        for name, proc in self.procs.items():
+            for i, _ in call_sites(proc):
+                callee = proc.body[i].arg1
+                if callee in self.procs:
+                    self.callees[name].add(callee)
+                    self.callers[callee].add(name)
+        self._scc = dict()
+        self.sccs = self._tarjan()
+
+    def _tarjan(self):
+        """Strongly connected components, callees before callers"""
+        index, low, stack, on_stack = dict(), dict(), [], set()
+        sccs = []
+        for root in self.procs:
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(sorted(self.callees[root])))]
+            while work:
+                name, it = work[-1]
+                for callee in it:
+                    if callee not in index:
+                        index[callee] = low[callee] = len(index)
+                        stack.append(callee)
+                        on_stack.add(callee)
+                        work.append((callee, iter(sorted(self.callees[callee]))))
+                        break
+                    if callee in on_stack:
+                        low[name] = min(low[name], index[callee])
+                else:
+                    work.pop()
+                    if work:
+                        low[work[-1][0]] = min(low[work[-1][0]], low[name])
+                    if low[name] == index[name]:
+                        scc = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            scc.append(member)
+                            self._scc[member] = len(sccs)
+                            if member == name:
+                                break
+                        sccs.append(scc)
+        return sccs
+
+    def bottom_up(self):
+        """Iterator over the procedures, callees before their callers"""
+        for scc in self.sccs:
+            yield from scc
+
+    def recursive(self, caller, callee):
+        """True if a call from `caller' to `callee' is part of a cycle"""
+        return self._scc[caller] == self._scc[callee]
+
+    def reachable(self, root='@main'):
+        """The set of procedures that can be called starting from `root'"""
+        seen, stack = {root}, [root]
+        while stack:
+            for callee in self.callees.get(stack.pop(), ()):
+                if callee not in seen:
+                    seen.add(callee)
+                    stack.append(callee)
+        return seen
+
+# ------------------------------------------------------------------------------
+
+
+class Summary:
+    """What a call to a procedure may do, callees included:
+    - `reads' and `writes', the sets of globals read and written;
+    - `prints', whether it prints anything;
+    - `total', whether it always returns normally, that is, it has no
+      loops, no recursion, and no div or mod;
+    - `unused_args', the numbers of the arguments it never uses;
+    - `result_used', whether the result is used at some call site."""
+
+    def __init__(self):
+        self.reads = set()
+        self.writes = set()
+        self.prints = False
+        self.total = True
+        self.unused_args = ()
+        self.result_used = False
+
+    @property
+    def pure(self):
+        """No effect other than computing its result"""
+        return not self.writes and not self.prints
+
+    @property
+    def removable(self):
+        """A call whose result is unused can be deleted"""
+        return self.pure and self.total
+
+    def __repr__(self):
+        return (f'Summary(reads={sorted(self.reads)}, '
+                f'writes={sorted(self.writes)}, prints={self.prints}, '
+                f'total={self.total}, unused_args={self.unused_args}, '
+                f'result_used={self.result_used})')
+
+
+def _used_temps(proc):
+    """The temporaries and globals read by the instructions of `proc'"""
+    used = set()
+    for instr in proc.body:
+        for x in (instr.arg1, instr.arg2):
+            if isinstance(x, str) and not (instr.opcode == 'call' and
+                                           x == instr.arg1):
+                used.add(x)
+        if instr.opcode == 'phi':
+            used.update(instr.arg1.values())
+    return used
+
+
+def summarize(decls):
+    """Return the Summary of every procedure of the program `decls',
+    computed on the call graph callees first, a recursive cycle sharing a
+    single summary"""
+    graph = CallGraph(decls)
+    every_global = {decl.name for decl in decls if isinstance(decl, tac.Gvar)}
+    summaries = dict()
+    for scc in graph.sccs:
+        summary = Summary()
+        members = set(scc)
+        if len(scc) > 1 or scc[0] in graph.callees[scc[0]]:
+            summary.total = False
+        for name in scc:
+            proc = graph.procs[name]
+            labels = dict()
+            for i, instr in enumerate(proc.body):
+                if instr.opcode == 'label':
+                    labels[instr.arg1] = i
+                elif instr.opcode in ('div', 'mod'):
+                    summary.total = False
+                elif instr.opcode == 'jmp' or instr.opcode in tac.jumps:
+                    # a jump backwards in the code may close a loop
+                    target = instr.arg1 if instr.opcode == 'jmp' else instr.arg2
+                    if target in labels:
+                        summary.total = False
+                elif instr.opcode == 'jtab':
+                    if any(target in labels for target in instr.arg2):
+                        summary.total = False
+                if instr.opcode == 'call':
+                    if instr.arg1.startswith('@__bx_print'):
+                        summary.prints = True
+                    elif instr.arg1 in members:
+                        pass
+                    elif instr.arg1 in summaries:
+                        callee = summaries[instr.arg1]
+                        summary.reads |= callee.reads
+                        summary.writes |= callee.writes
+                        summary.prints |= callee.prints
+                        summary.total &= callee.total
+                    else:
+                        summary.reads |= every_global
+                        summary.writes |= every_global
+                        summary.prints = True
+                        summary.total = False
+                    continue
+                if tac.Instr._isglobal(instr.dest):
+                    summary.writes.add(instr.dest)
+                summary.reads.update(x for x in (instr.arg1, instr.arg2)
+                                     if tac.Instr._isglobal(x))
+        for name in scc:
+            proc = graph.procs[name]
+            summaries[name] = copy.copy(summary)
+            used = _used_temps(proc)
+            summaries[name].unused_args = tuple(
+                num for num, t in enumerate(proc.t_args, 1) if t not in used)
+    for name, proc in graph.procs.items():
+        used = _used_temps(proc)
+        for i, _ in call_sites(proc):
+            call = proc.body[i]
+            if call.dest in used and call.arg1 in summaries:
+                summaries[call.arg1].result_used = True
+    if '@main' in summaries:
+        summaries['@main'].result_used = True
+    return summaries
+
+
+def prune(decls):
+    """Remove from the program `decls' the procedures that cannot be called
+    from `@main', the arguments that procedures never use, and the results
+    that are never used. An argument is only dropped if all the calls pass
+    it with a `param' of the same block. Returns the triple (procedures,
+    arguments, results) of the numbers of things removed."""
+    graph = CallGraph(decls)
+    removed_procs = 0
+    if '@main' in graph.procs:
+        reachable = graph.reachable('@main')
+        removed_procs = len(graph.procs) - len(reachable)
+        decls[:] = [decl for decl in decls
+                    if not isinstance(decl, tac.Proc) or decl.name in reachable]
+        graph = CallGraph(decls)
+    summaries = summarize(decls)
+    procs = graph.procs
+    sites = {name: [] for name in procs}
+    complete = {name: True for name in procs}
+    for caller in procs.values():
+        for i, params in call_sites(caller):
+            callee = procs.get(caller.body[i].arg1)
+            if callee is None:
+                continue
+            if set(params) != set(range(1, len(callee.t_args) + 1)):
+                complete[callee.name] = False
+            sites[callee.name].append((caller, i, params))
+    removed_args, removed_results = 0, 0
+    for name, proc in procs.items():
+        summary = summaries[name]
+        if name == '@main':
+            continue
+        if not summary.result_used:
+            for instr in proc.body:
+                if instr.opcode == 'ret' and instr.arg1 is not None:
+                    instr.arg1 = None
+                    removed_results += 1
+            for caller, i, _ in sites[name]:
+                caller.body[i].dest = None
+        dead = set(summary.unused_args)
+        if not dead or not complete[name]:
+            continue
+        proc.t_args = tuple(t for num, t in enumerate(proc.t_args, 1)
+                            if num not in dead)
+        removed_args += len(dead)
+        for caller, i, params in sites[name]:
+            call = caller.body[i]
+            call.arg2 = len(proc.t_args)
+            kept = [num for num in sorted(params) if num not in dead]
+            for num in kept:
+                caller.body[params[num]].arg1 = kept.index(num) + 1
+            for num in dead:
+                caller.body[params[num]] = tac.Instr(None, 'nop', ())
+    # the nops stand for the params that were removed, so that the indexes
+    # of the call sites stay valid while editing
+    for proc in procs.values():
+        proc.body = [instr for instr in proc.body if instr.opcode != 'nop']
+    return removed_procs, removed_args, removed_results
+
+
+def profile(decls):
+    """Run the program and return the number of calls along every edge
+    (caller, callee) of the call graph"""
+    gvars, procs, calls = dict(), dict(), dict()
+    for decl in decls:
+        if isinstance(decl, tac.Gvar):
+            gvars[decl.name] = decl
+        else:
+            procs[decl.name] = decl
+    tac.execute(gvars, procs, '@main', [], calls=calls)
+    return calls
+
+
+def _rename(instr, temp, label):
+    """Return a copy of `instr' where the temporaries are renamed by `temp'
+    and the labels by `label'"""
+    kind = tac.opcode_kinds[instr.opcode]
+    args = []
+    for arg, k in zip((instr.arg1, instr.arg2), kind[1:]):
+        if k == 'L':
+            arg = label(arg)
+        elif k == 'F':
+            arg = {label(lab): temp(t) for lab, t in arg.items()}
+        elif k == 'T':
+            arg = [label(lab) for lab in arg]
+        else:
+            arg = temp(arg)
+        args.append(arg)
+    return tac.Instr(temp(instr.dest), instr.opcode, args)
+
+
+def proc_names(proc):
+    """The temporaries and labels appearing in `proc'"""
+    names = set(proc.t_args)
+    for instr in proc.body:
+        for x in (instr.dest, instr.arg1, instr.arg2):
+            if isinstance(x, str):
+                names.add(x)
+    return names
+
+
+def inline_call(caller, index, params, callee, tag):
+    """Inline the call at `caller.body[index]', whose arguments are passed by
+    the `param' instructions at the indexes `params', with the body of
+    `callee'. The temporaries and labels of the clone are prefixed with
+    `tag'. The caller is updated in place and the number of instructions
+    inserted in place of the call is returned."""
+    temp = lambda t: f'%{tag}_{t[1:]}' if tac.Instr._istemp(t) else t
+    label = lambda lab: f'%.L{tag}_{lab[3:]}'
+    call = caller.body[index]
+    join = f'%.L{tag}_ret'
+    for num, i in params.items():
+        caller.body[i] = tac.Instr(temp(callee.t_args[num - 1]), 'copy',
+                                   (caller.body[i].arg2, None))
+    clone = []
+    reachable = True
+    for instr in callee.body:
+        # the instructions between an unconditional jump and the next label
+        # are dead, and would no longer end a block once rets are replaced
+        if instr.opcode == 'label':
+            reachable = True
+        elif not reachable:
+            continue
+        elif instr.opcode in ('jmp', 'ret'):
+            reachable = False
+        if instr.opcode == 'ret':
+            if call.dest and instr.arg1 is not None:
+                clone.append(tac.Instr(call.dest, 'copy', (temp(instr.arg1), None)))
+            clone.append(tac.Instr(None, 'jmp', (join, None)))
+        else:
+            clone.append(_rename(instr, temp, label))
+    clone.append(tac.Instr(None, 'label', (join, None)))
+    caller.body[index:index + 1] = clone
+    return len(clone)
+
+
+def inline(decls, *, small_size=8, max_size=40, profile=None,
+           hot_calls=100, hot_size=120, max_growth=4):
+    """Inline the calls of the program `decls' following a size/benefit
+    heuristic, callees first. A call is never inlined if it is part of a
+    recursive cycle, if its callee is already in SSA form, or if its
+    arguments are not all passed by `param' instructions of the same block.
+
+    Callees of at most `small_size' instructions cost about as much as the
+    call sequence itself and are always inlined. Without a `profile' (as
+    returned by `profile'), the callees of at most `max_size' instructions
+    are inlined. With a profile, the edges executed fewer than `hot_calls'
+    times only get the small callees, and the hot ones get the callees of
+    at most `hot_size' instructions. A caller never grows beyond
+    `max_growth' times its original size.
+
+    Returns the number of calls inlined."""
+    graph = CallGraph(decls)
+    procs = graph.procs
+    inlined, tag = 0, 0
+    for name in graph.bottom_up():
+        caller = procs[name]
+        if any(instr.opcode == 'phi' for instr in caller.body):
+            continue
+        budget = max_growth * max(proc_size(caller), small_size)
+        names = proc_names(caller)
+        sites = list(call_sites(caller))
+        # from the last site to the first, so that the indexes stay valid
+        for index, params in reversed(sites):
+            callee = procs.get(caller.body[index].arg1)
+            if callee is None or graph.recursive(name, callee.name) or \
+               set(params) != set(range(1, len(callee.t_args) + 1)) or \
+               any(instr.opcode == 'phi' for instr in callee.body):
+                continue
+            size = proc_size(callee)
+            if size > small_size:
+                if profile is None:
+                    wanted = size <= max_size
+                else:
+                    hot = profile.get((name, callee.name), 0) >= hot_calls
+                    wanted = hot and size <= hot_size
+                if not wanted or proc_size(caller) + size > budget:
+                    continue
+            while any(x.startswith(f'%i{tag}_') or x.startswith(f'%.Li{tag}_')
+                      for x in names):
+                tag += 1
+            inline_call(caller, index, params, callee, f'i{tag}')
+            inlined, tag = inlined + 1, tag + 1
+    return inlined
+
+
+def _returns(body, i, labels, results):
+    """True if control reaching `body[i]' returns one of the temporaries
+    `results' (or nothing) without doing anything else on the way"""
+    seen = set()
+    while i < len(body) and i not in seen:
+        seen.add(i)
+        instr = body[i]
+        if instr.opcode in ('label', 'nop'):
+            i += 1
+        elif instr.opcode == 'jmp':
+            i = labels[instr.arg1]
+        elif instr.opcode == 'copy' and instr.arg1 in results:
+            results = results | {instr.dest}
+            i += 1
+        elif instr.opcode == 'ret':
+            return instr.arg1 is None or instr.arg1 in results
+        else:
+            return False
+    return i >= len(body)
+
+
+def tail_recursion(proc):
+    """Turn the self-recursive calls of `proc' in tail position into copies
+    of the new arguments followed by a jump back to the start of the body,
+    which becomes a loop. The arguments are first copied to fresh
+    temporaries where the `param' instructions were, since they may be
+    computed from the old ones. Works on linear TAC before SSA
+    construction. Returns the number of calls removed."""
+    body = proc.body
+    if any(instr.opcode == 'phi' for instr in body):
+        return 0
+    labels = {instr.arg1: i for i, instr in enumerate(body)
+              if instr.opcode == 'label'}
+    sites = [(i, params) for i, params in call_sites(proc)
+             if body[i].arg1 == proc.name and
+             set(params) == set(range(1, len(proc.t_args) + 1)) and
+             _returns(body, i + 1, labels, {body[i].dest} - {None})]
+    if not sites:
+        return 0
+    names = proc_names(proc)
+    fresh = lambda x: next(y for y in (f'{x}{n}' for n in range(len(names) + 1))
+                           if y not in names)
+    loop = fresh('%.Ltail')
+    new_args = [fresh(f'%tail_{t[1:]}_') for t in proc.t_args]
+    for i, params in reversed(sites):
+        for num, j in params.items():
+            body[j] = tac.Instr(new_args[num - 1], 'copy', (body[j].arg2, None))
+        body[i:i + 1] = [tac.Instr(t, 'copy', (new, None))
+                         for t, new in zip(proc.t_args, new_args)] + \
+            [tac.Instr(None, 'jmp', (loop, None))]
+    # the entry block itself is kept free of predecessors
+    start = 1 if body and body[0].opcode == 'label' else 0
+    body.insert(start, tac.Instr(None, 'label', (loop, None)))
+    return len(sites)
+
+
+def _specialized_clone(callee, known, name):
+    """A copy of `callee' named `name' where the arguments of `known' (a
+    tuple of pairs (argument number, value)) are constants defined at the
+    entry instead, simplified by constant propagation"""
+    known = dict(known)
+    body = [tac.Instr(instr.dest, instr.opcode, (instr.arg1, instr.arg2))
+            for instr in callee.body]
+    consts = [tac.Instr(t, 'const', (known[num], None))
+              for num, t in enumerate(callee.t_args, 1) if num in known]
+    t_args = [t for num, t in enumerate(callee.t_args, 1) if num not in known]
+    clone = tac.Proc(name, t_args, body[:1] + consts + body[1:])
+    cfg = cfglib.infer(clone)
+    ssagen.pruned_ssagen(clone, cfg)
+    tac_doft.SCCP(cfg)
+    tac_doft.DCE(cfg)
+    ssagen.destruct_ssa(clone, cfg)
+    cfglib.linearize(clone, cfg)
+    assert all(instr.opcode != 'phi' for instr in clone.body), \
+        f'{name}: phi-function left out of SSA'
+    return clone
+
+
+def _redirect(caller, index, params, clone, known):
+    """Make the call at `caller.body[index]' call `clone', without passing
+    the arguments whose numbers are in `known'"""
+    call = caller.body[index]
+    kept = [num for num in sorted(params) if num not in known]
+    for num in kept:
+        param = caller.body[params[num]]
+        caller.body[params[num]] = tac.Instr(None, 'param',
+                                             (kept.index(num) + 1, param.arg2))
+    caller.body[index] = tac.Instr(call.dest, 'call', (clone, len(kept)))
+    for i in sorted((params[num] for num in known), reverse=True):
+        del caller.body[i]
+
+
+def specialize(decls, *, max_clones=4, max_growth=0.5, profile=None):
+    """Clone the procedures called with constant arguments into variants
+    `@f__k' where these arguments are constants, simplified by SCCP, and
+    redirect the matching calls to them. The call sites are grouped by
+    callee and known arguments, and the groups with the most calls (or the
+    most executed calls, according to `profile') are specialized first.
+    Every procedure gets at most `max_clones' clones, and the clones add up
+    to at most `max_growth' times the size of the program. The procedures
+    that can no longer be called from `@main' are dropped.
+
+    Returns the list of the clones created, as tuples (clone, callee, known
+    arguments, number of calls redirected, size)."""
+    graph = CallGraph(decls)
+    procs = graph.procs
+    groups = dict()
+    for caller in procs.values():
+        if any(instr.opcode == 'phi' for instr in caller.body):
+            continue
+        for index, params, args in constant_args(caller):
+            callee = procs.get(caller.body[index].arg1)
+            if callee is None or callee.name == '@main' or \
+               not callee.body or callee.body[0].opcode != 'label' or \
+               set(params) != set(range(1, len(callee.t_args) + 1)) or \
+               any(instr.opcode == 'phi' for instr in callee.body):
+                continue
+            known = tuple((num, value) for num, value in sorted(args.items())
+                          if value is not None)
+            if known:
+                groups.setdefault((callee.name, known), []) \
+                    .append((caller.name, index, params))
+
+    def weight(group):
+        (name, _), sites = group
+        if profile is None:
+            return len(sites)
+        return sum(profile.get((caller, name), 0) for caller, _, _ in sites)
+
+    budget = max_growth * sum(proc_size(proc) for proc in procs.values())
+    clones, redirects = [], dict()
+    names = set(procs)
+    for (name, known), sites in sorted(groups.items(), key=weight,
+                                       reverse=True):
+        if sum(1 for clone in clones if clone[1] == name) >= max_clones:
+            continue
+        n = 0
+        while f'{name}__{n}' in names:
+            n += 1
+        clone = _specialized_clone(procs[name], known, f'{name}__{n}')
+        size = proc_size(clone)
+        if size > budget:
+            continue
+        budget -= size
+        names.add(clone.name)
+        decls.append(clone)
+        clones.append((clone.name, name, known, len(sites), size))
+        for caller, index, params in sites:
+            redirects.setdefault(caller, []).append((index, params, clone.name,
+                                                     dict(known)))
+    # from the last call to the first, so that the indexes stay valid
+    for caller, sites in redirects.items():
+        for index, params, clone, known in sorted(sites, key=lambda s: s[0],
+                                                  reverse=True):
+            _redirect(procs[caller], index, params, clone, known)
+    if clones and '@main' in procs:
+        reachable = CallGraph(decls).reachable('@main')
+        decls[:] = [decl for decl in decls
+                    if not isinstance(decl, tac.Proc) or decl.name in reachable]
+    return clones
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    ap = argparse.ArgumentParser(description='Procedure inlining. TAC->TAC')
+    ap.add_argument('fname', metavar='FILE', type=str,
+                    help='The TAC file (.tac or .tac.json) to process')
+    ap.add_argument('--profile', dest='profile', action='store_true',
+                    default=False,
+                    help='Run the program first and inline the hot calls')
+    ap.add_argument('-o', '--output', dest='output', type=str)
+    opts = ap.parse_args()
+    decls = tac.load_tac(opts.fname)
+    removed = sum(tail_recursion(decl) for decl in decls
+                  if isinstance(decl, tac.Proc))
+    print(f'// {removed} tail calls removed')
+    for clone, callee, known, calls, size in specialize(decls):
+        args = ', '.join(f'#{num}={value}' for num, value in known)
+        print(f'// {clone}: {callee} with {args}, {calls} calls, {size} instrs')
+    counts = profile(decls) if opts.profile else None
+    print(f'// {inline(decls, profile=counts)} calls inlined')
+    if opts.output:
+        with open(opts.output, 'w') as fp:
+            json.dump([decl.js_obj for decl in decls], fp)
+    else:
+        for decl in decls:
+            print(decl)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+"""
+Block layout
+
+Orders the blocks of a CFG so that the frequent edges become fallthroughs.
+Edges are weighted either by a profile (the edge counts of a run of the
+interpreter) or statically by loop depth, every loop counting `loop_weight'
+times as much as the code around it. Blocks are then linked into chains
+along the heaviest edges first, so that the bodies of the loops end up
+contiguous; the chains are placed starting from the one of the entry,
+following the heaviest edges leaving the placed blocks, and the cold
+chains (never executed in the profile, or made of return blocks only) go
+last. Finally the jumps to the next instruction are removed, inverting
+the conditional jumps whose target comes next.
+"""
+
+import contextlib
+import copy
+import heapq
+import io
+
+import cfg as cfglib
+import tac
+
+# ------------------------------------------------------------------------------
+
+_inverse = {'jz': 'jnz', 'jnz': 'jz', 'jl': 'jnl', 'jnl': 'jl',
+            'jle': 'jnle', 'jnle': 'jle'}
+
+
+def static_weights(cfg, loop_weight=10):
+    """Estimated frequency of every edge of `cfg': a block runs
+    `loop_weight' times more often than the loop around it, and divides its
+    frequency evenly among its successors"""
+    loops = cfg.analyses['loops']
+    weights = dict()
+    for bl in cfg.nodes():
+        succs = set(cfg.successors(bl.label))
+        freq = loop_weight ** loops.depth[bl.label]
+        for succ in succs:
+            w = freq / len(succs)
+            if loops.depth[succ] < loops.depth[bl.label]:
+                w /= loop_weight    # leaving a loop
+            weights[bl.label, succ] = w
+    return weights
+
+
+def block_order(cfg, weights, counts=None):
+    """The labels of the blocks reachable in `cfg', ordered by chaining the
+    edges by decreasing `weights'. `counts', if given, maps every label to
+    the number of executions of its block, the cold ones being placed
+    last."""
+    rpo = cfg.reverse_postorder()
+    rank = {lab: i for i, lab in enumerate(rpo)}
+    entry = cfg.lab_entry
+    chain_of = {lab: [lab] for lab in rpo}
+    edges = sorted((e for e in cfg.edges() if e[0] in rank and e[1] in rank),
+                   key=lambda e: (-weights.get(e, 0), rank[e[0]], rank[e[1]]))
+    for u, v in edges:
+        cu, cv = chain_of[u], chain_of[v]
+        if v == entry or cu is cv or cu[-1] != u or cv[0] != v:
+            continue
+        cu.extend(cv)
+        for lab in cv:
+            chain_of[lab] = cu
+
+    def cold(chain):
+        if counts is not None:
+            return all(counts.get(lab, 0) == 0 for lab in chain)
+        return all(cfg.out_degree(lab) == 0 for lab in chain)
+
+    order, cold_chains, placed = [], [], set()
+    heap = [(0, 0, entry)]
+    while heap:
+        _, _, head = heapq.heappop(heap)
+        chain = chain_of[head]
+        if id(chain) in placed:
+            continue
+        placed.add(id(chain))
+        if head != entry and cold(chain):
+            cold_chains.append(chain)
+            continue
+        order.extend(chain)
+        for u in chain:
+            for v in cfg.successors(u):
+                if id(chain_of[v]) not in placed:
+                    head = chain_of[v][0]
+                    heapq.heappush(heap, (-weights.get((u, v), 0),
+                                          rank[head], head))
+    # and the blocks only reachable from the cold ones
+    for lab in rpo:
+        if id(chain_of[lab]) not in placed:
+            placed.add(id(chain_of[lab]))
+            cold_chains.append(chain_of[lab])
+    for chain in cold_chains:
+        order.extend(chain)
+    return order
+
+
+def remove_jumps(tac_proc):
+    """Remove the jumps of `tac_proc' to one of the labels that follow them,
+    until there are none left. A conditional jump followed by `jmp' is
+    inverted when its own target follows. The blocks starting with
+    phi-functions are still entered by a jump, as the interpreter only
+    resolves them after jumps. Returns the number of jumps removed."""
+    body = tac_proc.body
+    phis = {instr.arg1 for instr, nxt in zip(body, body[1:])
+            if instr.opcode == 'label' and nxt.opcode == 'phi'}
+
+    def next_labels(i):
+        """The labels of the run of labels starting at `body[i]'"""
+        labels = set()
+        while i < len(body) and body[i].opcode == 'label':
+            labels.add(body[i].arg1)
+            i += 1
+        return labels - phis
+
+    removed, modified = 0, True
+    while modified:
+        modified, new_body = False, []
+        i = 0
+        while i < len(body):
+            instr = body[i]
+            nxt = body[i + 1] if i + 1 < len(body) else None
+            if instr.opcode == 'jmp' and instr.arg1 in next_labels(i + 1):
+                modified = True
+                removed += 1
+                i += 1
+                continue
+            if instr.opcode in _inverse and nxt is not None and \
+               nxt.opcode == 'jmp' and instr.arg2 in next_labels(i + 2):
+                new_body.append(tac.Instr(None, _inverse[instr.opcode],
+                                          (instr.arg1, nxt.arg1)))
+                modified = True
+                removed += 1
+                i += 2
+                continue
+            new_body.append(instr)
+            i += 1
+        body = tac_proc.body = new_body
+    return removed
+
+
+def layout(tac_proc, cfg, weights=None, counts=None):
+    """Linearize `cfg' into `tac_proc' following `block_order' with the
+    edge `weights' (static ones by default), then remove the jumps to the
+    next label. Returns the number of jumps removed."""
+    if weights is None:
+        weights = static_weights(cfg)
+    cfglib.linearize(tac_proc, cfg, block_order(cfg, weights, counts))
+    return remove_jumps(tac_proc)
+
+
+def profile_edges(decls):
+    """Run the program and return, for every procedure, the number of
+    times every edge (label from, label to) was followed"""
+    gvars, procs = dict(), dict()
+    for decl in decls:
+        if isinstance(decl, tac.Gvar):
+            gvars[decl.name] = copy.deepcopy(decl)
+        else:
+            procs[decl.name] = decl
+    edges = dict()
+    with contextlib.redirect_stdout(io.StringIO()):
+        tac.execute(gvars, procs, '@main', [], edges=edges)
+    profile = {name: dict() for name in procs}
+    for (name, lab_from, lab_to), n in edges.items():
+        profile[name][lab_from, lab_to] = n
+    return profile
+
+
+def layout_decls(decls, *, profile=False):
+    """Lay out every procedure of the program `decls', which must be out of
+    SSA form. With `profile', the edges are weighted by their counts in a
+    run of the program. Returns the number of jumps removed."""
+    procs = [decl for decl in decls if isinstance(decl, tac.Proc)]
+    for proc in procs:
+        # inferring a CFG names the labels in order: the CFG inferred again
+        # below has the same labels as the profiled code
+        cfglib.infer(proc)
+    profiled = profile_edges(decls) if profile else None
+    removed = 0
+    for proc in procs:
+        cfg = cfglib.infer(proc)
+        if profiled is None:
+            removed += layout(proc, cfg)
+            continue
+        weights = profiled[proc.name]
+        counts = {cfg.lab_entry: 1}
+        for (_, lab_to), n in weights.items():
+            counts[lab_to] = counts.get(lab_to, 0) + n
+        removed += layout(proc, cfg, weights, counts)
+    return removed
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    ap = argparse.ArgumentParser(description='Block layout. TAC->TAC')
+    ap.add_argument('fname', metavar='FILE', type=str,
+                    help='The TAC file (.tac or .tac.json) to process')
+    ap.add_argument('--profile', dest='profile', action='store_true',
+                    default=False,
+                    help='Run the program first and weight the edges by count')
+    ap.add_argument('-o', '--output', dest='output', type=str)
+    opts = ap.parse_args()
+    decls = tac.load_tac(opts.fname)
+    print(f'// {layout_decls(decls, profile=opts.profile)} jumps removed')
+    if opts.output:
+        with open(opts.output, 'w') as fp:
+            json.dump([decl.js_obj for decl in decls], fp)
+    else:
+        for decl in decls:
+            print(decl)
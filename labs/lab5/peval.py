@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+"""
+Compile-time partial evaluation of closed TAC programs
+
+BX programs read no input, so the TAC interpreter can run them at compile
+time. The whole program is run first: if `@main' finishes within the
+instruction budget, it is replaced by the sequence of prints it performs.
+Otherwise every call whose arguments are known constants and whose callee
+does not touch any global variable is run on its own, and replaced by the
+prints it performs followed by a `const' for its result. Anything that
+does not finish within the budget (or fails) is left untouched.
+
+Works on linear TAC before SSA construction.
+"""
+
+import contextlib
+import copy
+import io
+
+import ipa
+import tac
+
+# ------------------------------------------------------------------------------
+
+
+def run(gvars, procs, name, args, budget):
+    """Run the procedure `name' on `args' with at most `budget' instructions.
+    Return the pair (result, printed lines), or None if it did not finish."""
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            result = tac.execute(gvars, procs, name, args, fuel=[budget])
+    except Exception:
+        return None
+    lines = output.getvalue().splitlines()
+    # the interpreter comments on procedures that end without a ret
+    if any(line.startswith('//') for line in lines):
+        return None
+    return result, lines
+
+
+def print_instrs(lines, fresh):
+    """The instructions printing `lines' again, as printed by the
+    interpreter. `fresh' returns a new temporary at every call."""
+    instrs = []
+    for line in lines:
+        if line in ('true', 'false'):
+            proc, value = '@__bx_print_bool', int(line == 'true')
+        else:
+            proc, value = '@__bx_print_int', int(line)
+        t = fresh()
+        instrs.extend([tac.Instr(t, 'const', (value, None)),
+                       tac.Instr(None, 'param', (1, t)),
+                       tac.Instr(None, 'call', (proc, 1))])
+    return instrs
+
+
+def closed_procs(graph):
+    """The procedures that neither read nor write a global variable, and
+    only call such procedures or the runtime"""
+    closed = set()
+    for scc in graph.sccs:
+        members = set(scc)
+        for name in scc:
+            for instr in graph.procs[name].body:
+                if instr.opcode == 'call':
+                    callee = instr.arg1
+                    if callee not in closed and callee not in members and \
+                       not callee.startswith('@__bx_print'):
+                        break
+                elif any(isinstance(x, str) and x.startswith('@')
+                         for x in (instr.dest, instr.arg1, instr.arg2)):
+                    break
+            else:
+                continue
+            break
+        else:
+            closed |= members
+    return closed
+
+
+def _fresh_temps(proc):
+    names = ipa.proc_names(proc)
+    n = 0
+    while True:
+        if f'%pe{n}' not in names:
+            yield f'%pe{n}'
+        n += 1
+
+
+def evaluate_calls(proc, procs, closed, budget, max_prints):
+    """Replace the calls of `proc' to procedures of `closed' whose arguments
+    are all known constants by their prints and result. The constants (and
+    the arithmetic on them) are only tracked inside blocks, and in
+    temporaries. Returns the number of calls replaced."""
+    fresh = _fresh_temps(proc)
+    body, proc.body = proc.body, []
+    consts, params = dict(), dict()
+    replaced = 0
+    for instr in body:
+        if instr.opcode == 'label':
+            consts, params = dict(), dict()
+        elif instr.opcode == 'param':
+            params[instr.arg1] = (len(proc.body), consts.get(instr.arg2))
+        elif instr.opcode == 'call':
+            sites, params = params, dict()
+            callee = procs.get(instr.arg1)
+            if instr.arg1 not in closed or \
+               set(sites) != set(range(1, len(callee.t_args) + 1)) or \
+               any(value is None for _, value in sites.values()):
+                done = None
+            else:
+                args = [tac.twoc(sites[num][1]) for num in sorted(sites)]
+                done = run(dict(), procs, instr.arg1, args, budget)
+            if done is not None and len(done[1]) <= max_prints and \
+               (done[0] is not None or not instr.dest):
+                result, lines = done
+                for i in sorted((i for i, _ in sites.values()), reverse=True):
+                    del proc.body[i]
+                proc.body.extend(print_instrs(lines, lambda: next(fresh)))
+                if instr.dest:
+                    value = tac.untwoc(result)
+                    proc.body.append(tac.Instr(instr.dest, 'const', (value, None)))
+                    consts[instr.dest] = value
+                replaced += 1
+                continue
+        proc.body.append(instr)
+        if not tac.Instr._istemp(instr.dest):
+            # a global may be written by the calls left in the code
+            continue
+        if instr.opcode == 'const':
+            consts[instr.dest] = instr.arg1
+        elif instr.opcode == 'copy' and instr.arg1 in consts:
+            consts[instr.dest] = consts[instr.arg1]
+        elif instr.dest:
+            value = ipa.fold(instr, consts)
+            if value is None:
+                consts.pop(instr.dest, None)
+            else:
+                consts[instr.dest] = value
+    return replaced
+
+
+def partial_evaluate(decls, *, budget=100000, max_prints=1000):
+    """Partially evaluate the program `decls' in place, running every
+    procedure call for at most `budget' instructions and precomputing at
+    most `max_prints' prints for each. The procedures that can no longer be
+    called from `@main' are dropped. Returns the number of calls replaced,
+    the run of `@main' included."""
+    graph = ipa.CallGraph(decls)
+    procs = graph.procs
+    main = procs.get('@main')
+    if main is not None:
+        gvars = {decl.name: copy.deepcopy(decl) for decl in decls
+                 if isinstance(decl, tac.Gvar)}
+        done = run(gvars, procs, '@main', [], budget)
+        if done is not None and len(done[1]) <= max_prints:
+            fresh = _fresh_temps(main)
+            main.body = [tac.Instr(None, 'label', ('%.Lentry', None))] + \
+                print_instrs(done[1], lambda: next(fresh)) + \
+                [tac.Instr(None, 'ret', (None, None))]
+            decls[:] = [decl for decl in decls
+                        if not isinstance(decl, tac.Proc) or decl is main]
+            return 1
+    closed = closed_procs(graph)
+    replaced = sum(evaluate_calls(proc, procs, closed, budget, max_prints)
+                   for proc in procs.values())
+    if main is not None and replaced:
+        reachable = ipa.CallGraph(decls).reachable('@main')
+        decls[:] = [decl for decl in decls
+                    if not isinstance(decl, tac.Proc) or decl.name in reachable]
+    return replaced
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    ap = argparse.ArgumentParser(description='Partial evaluation. TAC->TAC')
+    ap.add_argument('fname', metavar='FILE', type=str,
+                    help='The TAC file (.tac or .tac.json) to process')
+    ap.add_argument('--budget', dest='budget', type=int, default=100000,
+                    help='Instructions that each evaluated call may execute')
+    ap.add_argument('-o', '--output', dest='output', type=str)
+    opts = ap.parse_args()
+    decls = tac.load_tac(opts.fname)
+    print(f'// {partial_evaluate(decls, budget=opts.budget)} calls evaluated')
+    if opts.output:
+        with open(opts.output, 'w') as fp:
+            json.dump([decl.js_obj for decl in decls], fp)
+    else:
+        for decl in decls:
+            print(decl)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+"""
+Promotion of global variables to temporaries
+
+Inside a procedure, a global variable can live in a temporary: it is
+loaded once at the entry of the procedure, and its accesses become
+accesses to the temporary. Using the summaries of `ipa.summarize', the
+temporary is stored back before the calls that may read or write the
+global, reloaded after the calls that may write it, and stored back at
+every `ret' if the procedure writes it. The globals that no procedure
+writes are constants: their reads become `const' instructions.
+
+A global is only promoted when the accesses it saves outweigh the loads
+and stores inserted, the ones inside loops counting `loop_weight' times.
+Works on linear TAC before SSA construction.
+"""
+
+import cfg as cfglib
+import ipa
+import tac
+
+# ------------------------------------------------------------------------------
+
+
+def _loop_depths(body):
+    """The number of loops around every instruction of `body', a loop
+    being the instructions between a label and a jump back to it"""
+    labels = dict()
+    depths = [0] * len(body)
+    for i, instr in enumerate(body):
+        if instr.opcode == 'label':
+            labels[instr.arg1] = i
+        elif instr.opcode in ('jmp', 'jtab') or instr.opcode in tac.jumps:
+            for target in cfglib.get_jump_dests(instr):
+                if target in labels:
+                    for j in range(labels[target], i + 1):
+                        depths[j] += 1
+    return depths
+
+
+def _globals_of(instr, gvars):
+    """The pairs (field, global) of the operands of `instr' that are
+    global variables"""
+    kind = tac.opcode_kinds[instr.opcode]
+    for field, k in zip(('dest', 'arg1', 'arg2'), kind):
+        g = getattr(instr, field)
+        if k in 'VO' and g in gvars:
+            yield field, g
+
+
+def _fresh_temp(name, names):
+    t = f'%g_{name[1:]}'
+    n = 0
+    while t in names:
+        t = f'%g_{name[1:]}_{n}'
+        n += 1
+    names.add(t)
+    return t
+
+
+def promote_proc(proc, gvars, constants, summaries, *, loop_weight=10):
+    """Promote the global variables of `proc' that are worth it, and replace
+    the reads of the ones of `constants', never written, by constants.
+    `gvars' maps the names of the globals to their declaration. Returns
+    the number of globals promoted or replaced."""
+    body = proc.body
+    if not body or body[0].opcode != 'label':
+        return 0
+    entry = body[0].arg1
+    if any((instr.opcode in ('jmp', 'jtab') or instr.opcode in tac.jumps) and
+           entry in cfglib.get_jump_dests(instr) for instr in body):
+        return 0    # the loads would be executed again
+
+    def effects(instr):
+        """The pair (reads, writes) of globals of the call `instr'"""
+        if instr.arg1.startswith('@__bx_print'):
+            return (), ()
+        summary = summaries.get(instr.arg1)
+        if summary is None:
+            return gvars, gvars
+        return summary.reads, summary.writes
+
+    depths = _loop_depths(body)
+    weight = [loop_weight ** d for d in depths]
+    saved, written = dict(), set()
+    # a read following another one in the same block, with no write in
+    # between, is saved by GVN anyway
+    loaded = set()
+    for i, instr in enumerate(body):
+        if instr.opcode == 'label':
+            loaded.clear()
+        elif instr.opcode == 'call':
+            loaded.difference_update(effects(instr)[1])
+        for field, g in _globals_of(instr, gvars):
+            if field == 'dest':
+                written.add(g)
+                loaded.discard(g)
+            elif g in loaded:
+                continue
+            else:
+                loaded.add(g)
+            saved[g] = saved.get(g, 0) + weight[i]
+
+    exits = [i for i, instr in enumerate(body) if instr.opcode == 'ret']
+    if body[-1].opcode not in ('ret', 'jmp'):
+        exits.append(len(body))    # falls off the end
+    promoted = []
+    for g in sorted(set(saved) - constants):
+        cost = 1
+        for i, instr in enumerate(body):
+            if instr.opcode == 'call':
+                reads, writes = effects(instr)
+                cost += weight[i] * ((g in written and
+                                      (g in reads or g in writes)) +
+                                     (g in writes))
+        if g in written and proc.name != '@main':
+            cost += sum(weight[min(i, len(body) - 1)] for i in exits)
+        if cost < saved[g]:
+            promoted.append(g)
+    replaced = set(saved) & constants
+    if not promoted and not replaced:
+        return 0
+
+    names = ipa.proc_names(proc)
+    temps = {g: _fresh_temp(g, names) for g in promoted + sorted(replaced)}
+
+    def stores(gs):
+        return [tac.Instr(g, 'copy', (temps[g], None)) for g in gs]
+
+    def loads(gs):
+        return [tac.Instr(temps[g], 'copy', (g, None)) for g in gs]
+
+    stored = [g for g in promoted if g in written]
+    new_body = [body[0]] + loads(promoted)
+    for instr in body[1:]:
+        dest = instr.dest
+        for field, g in _globals_of(instr, gvars):
+            if g in replaced:
+                value = int(gvars[g].value)
+                if instr.opcode == 'copy':
+                    instr.opcode, instr.arg1 = 'const', value
+                    continue
+                new_body.append(tac.Instr(temps[g], 'const', (value, None)))
+            if g in temps:
+                setattr(instr, field, temps[g])
+        if instr.opcode == 'call':
+            reads, writes = effects(instr)
+            new_body.extend(stores(g for g in stored
+                                   if g in reads or g in writes))
+            new_body.append(instr)
+            # the result of the call is assigned after the callee returns
+            new_body.extend(loads(g for g in promoted
+                                  if g in writes and g != dest))
+            continue
+        if instr.opcode == 'ret' and proc.name != '@main':
+            new_body.extend(stores(stored))
+        new_body.append(instr)
+    if body[-1].opcode not in ('ret', 'jmp') and proc.name != '@main':
+        new_body.extend(stores(stored))
+    proc.body = new_body
+    return len(promoted) + len(replaced)
+
+
+def promote_globals(decls, summaries=None, *, loop_weight=10):
+    """Promote the global variables in every procedure of the program
+    `decls', with the procedure summaries `summaries' (computed if not
+    given). Returns the number of pairs (procedure, global) promoted."""
+    if summaries is None:
+        summaries = ipa.summarize(decls)
+    gvars = {decl.name: decl for decl in decls if isinstance(decl, tac.Gvar)}
+    written = set()
+    for summary in summaries.values():
+        written |= summary.writes
+    constants = {g for g, decl in gvars.items()
+                 if g not in written and isinstance(decl.value, int)}
+    return sum(promote_proc(decl, gvars, constants, summaries,
+                            loop_weight=loop_weight)
+               for decl in decls if isinstance(decl, tac.Proc))
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    ap = argparse.ArgumentParser(description='Global promotion. TAC->TAC')
+    ap.add_argument('fname', metavar='FILE', type=str,
+                    help='The TAC file (.tac or .tac.json) to process')
+    ap.add_argument('-o', '--output', dest='output', type=str)
+    opts = ap.parse_args()
+    decls = tac.load_tac(opts.fname)
+    print(f'// {promote_globals(decls)} globals promoted')
+    if opts.output:
+        with open(opts.output, 'w') as fp:
+            json.dump([decl.js_obj for decl in decls], fp)
+    else:
+        for decl in decls:
+            print(decl)
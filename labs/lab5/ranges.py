@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+"""
+Value-range analysis
+
+Computes on SSA form an interval [lo, hi] of signed 64-bit values for every
+temporary, seeded by the constants and refined along the edges leaving the
+conditional jumps: on the edges of `jl %d' the interval of %d is cut at 0,
+and when %d = sub %x, %y does not overflow, so are those of %x and %y (and
+of the temporaries they are copies of). The refinements hold in the blocks
+that the edge leads to, and are merged at the joins. Operations that may
+wrap around give the full interval. The loop bounds come from the tests of
+the loops: the intervals growing around a loop are widened at its
+phi-functions to the limits of the type after a few rounds, then narrowed
+again by the tests (one descending round per `narrowings').
+
+`VRP' uses the ranges to decide the conditional jumps, fold the
+instructions with a single possible value, and replace the signed divisions
+and remainders of non-negative values by powers of two with `shr' and
+`and'.
+"""
+
+import cfg as cfglib
+import tac
+
+# ------------------------------------------------------------------------------
+
+MIN, MAX = -(1 << 63), (1 << 63) - 1
+FULL = (MIN, MAX)
+
+_negate = {'l': 'nl', 'nl': 'l', 'le': 'nle', 'nle': 'le'}
+_signs = {'l': (MIN, -1), 'le': (MIN, 0), 'nl': (0, MAX), 'nle': (1, MAX)}
+
+
+def _clip(lo, hi):
+    """The interval [lo, hi], or FULL if some of its values wrap around"""
+    return (lo, hi) if MIN <= lo and hi <= MAX else FULL
+
+
+def _hull(r, s):
+    return (min(r[0], s[0]), max(r[1], s[1]))
+
+
+def _meet(r, s):
+    """Intersection of two intervals, None if empty"""
+    lo, hi = max(r[0], s[0]), min(r[1], s[1])
+    return (lo, hi) if lo <= hi else None
+
+
+def restrict(r, cc, taken):
+    """The values of the interval `r' for which `j<cc>' is `taken' (or
+    not), None if there are none"""
+    if cc in ('z', 'nz'):
+        if (cc == 'z') == taken:
+            return _meet(r, (0, 0))
+        lo, hi = r
+        lo, hi = lo + (lo == 0), hi - (hi == 0)
+        return (lo, hi) if lo <= hi else None
+    return _meet(r, _signs[cc if taken else _negate[cc]])
+
+
+def _trunc_div(x, y):
+    q = abs(x) // abs(y)
+    return q if (x < 0) == (y < 0) else -q
+
+
+def _nonzero(r):
+    """The negative and the positive parts of the interval `r'"""
+    return [p for p in ((r[0], min(r[1], -1)), (max(r[0], 1), r[1]))
+            if p[0] <= p[1]]
+
+
+def _corners(fn, a, b):
+    values = [fn(x, y) for x in a for y in b]
+    return _clip(min(values), max(values))
+
+
+def transfer(opcode, args):
+    """Interval of the result of `opcode' on operands in the intervals
+    `args'"""
+    if opcode in tac.unops:
+        a, = args
+        if opcode == 'neg':
+            return _clip(-a[1], -a[0])
+        if opcode == 'not':
+            return (~a[1], ~a[0])
+        cc = opcode[3:]
+        return (0 if restrict(a, cc, False) else 1,
+                1 if restrict(a, cc, True) else 0)
+    a, b = args
+    if opcode == 'add':
+        return _clip(a[0] + b[0], a[1] + b[1])
+    if opcode == 'sub':
+        return _clip(a[0] - b[1], a[1] - b[0])
+    if opcode == 'mul':
+        return _corners(lambda x, y: x * y, a, b)
+    if opcode in ('div', 'mod'):
+        # dividing by 0 traps: only the other divisors matter
+        parts = _nonzero(b)
+        if not parts:
+            return FULL
+        if opcode == 'div':
+            ranges = [_corners(_trunc_div, a, p) for p in parts]
+            return (min(r[0] for r in ranges), max(r[1] for r in ranges))
+        m = max(abs(y) for p in parts for y in p) - 1
+        lo = 0 if a[0] >= 0 else max(a[0], -m)
+        hi = 0 if a[1] <= 0 else min(a[1], m)
+        return (lo, hi)
+    if opcode == 'and':
+        if a[0] >= 0 or b[0] >= 0:
+            return (0, min(r[1] for r in (a, b) if r[0] >= 0))
+        return FULL
+    if opcode in ('or', 'xor'):
+        if a[0] >= 0 and b[0] >= 0:
+            return (0, (1 << max(a[1], b[1]).bit_length()) - 1)
+        return FULL
+    if opcode in ('shl', 'shr') and 0 <= b[0] and b[1] < 64:
+        if opcode == 'shl':
+            return _corners(lambda x, k: x << k, a, b)
+        return _corners(lambda x, k: x >> k, a, b)
+    return FULL
+
+
+class Ranges:
+    """The intervals of the temporaries of a CFG in SSA form. `value' maps
+    every temporary defined in a reachable block to its interval, and `edges'
+    maps every edge that may be followed (with the pseudo-edge from the
+    name of the procedure to its entry) to the refined intervals holding
+    along it."""
+
+    def __init__(self, cfg, *, widen_after=2, narrowings=2):
+        self.cfg = cfg
+        self.defs = cfg.analyses['defuse'].defs
+        self.value = dict()
+        self.edges = {(cfg.proc_name, cfg.lab_entry): dict()}
+        self.facts = dict()
+        self._rounds = dict()
+        self._widen_after = widen_after
+        order = cfg.reverse_postorder()
+        while self._round(order, ascending=True):
+            pass
+        for _ in range(narrowings):
+            self._round(order, ascending=False)
+
+    def at(self, lab, t):
+        """The interval of `t' in the block `lab', or None if `t' has no
+        value there"""
+        if not tac.Instr._istemp(t) or t not in self.defs:
+            # arguments and globals
+            return self.facts.get(lab, dict()).get(t, FULL)
+        r = self.value.get(t)
+        fact = self.facts.get(lab, dict()).get(t)
+        return r if r is None or fact is None else _meet(r, fact)
+
+    def reachable(self, lab):
+        return lab in self.facts
+
+    def _update(self, t, r, ascending, widen):
+        """Grow (when `ascending') or shrink the interval of `t' towards `r',
+        widening it if `widen' and it keeps growing. Returns True if it
+        changed."""
+        old = self.value.get(t)
+        if r is None or r == old:
+            return False
+        if old is not None and ascending:
+            r = _hull(old, r)
+            if r == old:
+                return False
+            self._rounds[t] = self._rounds.get(t, 0) + 1
+            if widen and self._rounds[t] > self._widen_after:
+                r = (MIN if r[0] < old[0] else r[0],
+                     MAX if r[1] > old[1] else r[1])
+        elif old is not None:
+            r = _meet(old, r)
+            if r is None or r == old:
+                return False
+        self.value[t] = r
+        return True
+
+    def _eval(self, lab, ins):
+        if ins.opcode == 'phi':
+            r = None
+            for lab_from, t in ins.arg1.items():
+                facts = self.edges.get((lab_from, lab))
+                if facts is None:
+                    continue
+                s = self.at(lab_from, t)
+                if s is not None and t in facts:
+                    s = _meet(s, facts[t])
+                if s is not None:
+                    r = s if r is None else _hull(r, s)
+            return r
+        if ins.opcode == 'const':
+            return (tac.untwoc(tac.twoc(ins.arg1)),) * 2
+        if ins.opcode != 'copy' and ins.opcode not in tac.binops and \
+           ins.opcode not in tac.unops:
+            return FULL
+        args = [self.at(lab, t) for t in (ins.arg1, ins.arg2) if t is not None]
+        if any(a is None for a in args):
+            return None
+        return args[0] if ins.opcode == 'copy' else transfer(ins.opcode, args)
+
+    def _refine(self, facts, lab, t, r):
+        """Record in `facts' that `t', and the temporaries it is a copy of,
+        are in the interval `r' in the block `lab'. Returns False if they
+        cannot be."""
+        while t is not None:
+            s = self.at(lab, t)
+            s = r if s is None else _meet(s, r)
+            if s is None:
+                return False
+            facts[t] = s
+            _, d = self.defs.get(t, (None, None))
+            t = d.arg1 if d is not None and d.opcode == 'copy' and \
+                tac.Instr._istemp(d.arg1) else None
+        return True
+
+    def _edge_facts(self, lab, succ):
+        """The intervals refined along the edge from `lab' to `succ', or None
+        if the edge cannot be followed"""
+        facts = dict(self.facts[lab])
+        jumps = self.cfg[lab].jumps
+        if len(jumps) != 2 or jumps[0].opcode not in tac.jumps or \
+           jumps[1].opcode != 'jmp' or jumps[0].arg2 == jumps[1].arg1:
+            return facts
+        c = jumps[0].arg1
+        rc = self.at(lab, c)
+        if rc is None:
+            return None
+        rc = restrict(rc, jumps[0].opcode[1:], succ == jumps[0].arg2)
+        if rc is None or not self._refine(facts, lab, c, rc):
+            return None
+        _, d = self.defs.get(c, (None, None))
+        if d is not None and d.opcode == 'sub':
+            rx, ry = self.at(lab, d.arg1), self.at(lab, d.arg2)
+            if rx is not None and ry is not None and \
+               transfer('sub', (rx, ry)) != FULL:
+                # %x - %y is in rc, and so is %x in %y + rc
+                if not self._refine(facts, lab, d.arg1,
+                                    (ry[0] + rc[0], ry[1] + rc[1])) or \
+                   not self._refine(facts, lab, d.arg2,
+                                    (rx[0] - rc[1], rx[1] - rc[0])):
+                    return None
+        return facts
+
+    def _round(self, order, ascending):
+        """Evaluate every reachable block once. Returns True if something
+        changed."""
+        changed = False
+        for lab in order:
+            incoming = [self.edges[e] for e in
+                        ((p, lab) for p in self._preds(lab))
+                        if e in self.edges]
+            if not incoming:
+                changed |= self.facts.pop(lab, None) is not None
+                continue
+            facts = dict(incoming[0])
+            for other in incoming[1:]:
+                facts = {t: _hull(r, other[t]) for t, r in facts.items()
+                         if t in other}
+            changed |= self.facts.get(lab) != facts
+            self.facts[lab] = facts
+            for ins in self.cfg[lab].body:
+                if tac.Instr._istemp(ins.dest):
+                    # the phis are where the loops close: widening them
+                    # is enough to stop
+                    changed |= self._update(ins.dest, self._eval(lab, ins),
+                                            ascending, ins.opcode == 'phi')
+            for succ in self.cfg.successors(lab):
+                edge_facts = self._edge_facts(lab, succ)
+                if edge_facts is None:
+                    changed |= self.edges.pop((lab, succ), None) is not None
+                elif self.edges.get((lab, succ)) != edge_facts:
+                    self.edges[lab, succ] = edge_facts
+                    changed = True
+        return changed
+
+    def _preds(self, lab):
+        preds = list(self.cfg.predecessors(lab))
+        if lab == self.cfg.lab_entry:
+            preds.append(self.cfg.proc_name)
+        return preds
+
+
+def _log2(r):
+    """k if the interval `r' is the single value 2 ** k, else None"""
+    if r is not None and r[0] == r[1] > 0 and r[0] & (r[0] - 1) == 0:
+        return r[0].bit_length() - 1
+    return None
+
+
+@cfglib.preserves()
+def VRP(cfg, **kwargs):
+    """
+    Value-range propagation on SSA form (see `Ranges', which takes the
+    keyword arguments). The instructions with a single possible value
+    become `const', the conditional jumps that always or never jump are
+    decided, and the blocks that are never reached are deleted. With a
+    non-negative dividend, `div' and `mod' by a power of two become `shr'
+    and `and', and `mod' by a larger divisor disappears. Returns the number
+    of instructions rewritten or removed.
+    """
+    ranges = Ranges(cfg, **kwargs)
+    rewritten = 0
+
+    def const(k):
+        t = cfg.fresh_temp('%vrp')
+        body.append(tac.Instr(t, 'const', (k, None)))
+        return t
+
+    for lab in cfg.reverse_postorder():
+        if not ranges.reachable(lab):
+            continue
+        block = cfg[lab]
+        body = []
+        for ins in block.body:
+            r = ranges.value.get(ins.dest) if tac.Instr._istemp(ins.dest) \
+                else None
+            if ins.opcode in ('div', 'mod') and \
+               restrict(ranges.at(lab, ins.arg2) or FULL, 'z', True):
+                # may divide by 0: the trap stays
+                r = None
+            if r is not None and r[0] == r[1] and \
+               ins.opcode not in ('const', 'call'):
+                ins.opcode, ins.arg1, ins.arg2 = 'const', r[0], None
+                rewritten += 1
+            elif ins.opcode in ('div', 'mod'):
+                rx, ry = ranges.at(lab, ins.arg1), ranges.at(lab, ins.arg2)
+                k = _log2(ry)
+                if rx is None or rx[0] < 0 or ry[0] <= 0:
+                    pass
+                elif ins.opcode == 'mod' and rx[1] < ry[0]:
+                    ins.opcode, ins.arg2 = 'copy', None
+                    rewritten += 1
+                elif k is not None and ins.opcode == 'mod':
+                    ins.opcode, ins.arg2 = 'and', const((1 << k) - 1)
+                    rewritten += 1
+                elif k is not None:
+                    ins.opcode, ins.arg2 = 'shr', const(k)
+                    rewritten += 1
+            body.append(ins)
+        # the single-valued phis are now consts
+        block.body = body
+        block.hoist_phis()
+        jumps = block.jumps
+        if len(jumps) == 2 and jumps[0].opcode in tac.jumps and \
+           jumps[1].opcode == 'jmp':
+            follow = [cfglib.get_jump_dest(j) for j in jumps
+                      if (lab, cfglib.get_jump_dest(j)) in ranges.edges]
+            if len(follow) == 1:
+                block.jumps = [tac.Instr(None, 'jmp', (follow[0], None))]
+                rewritten += 1
+        dests = {d for j in block.jumps for d in cfglib.get_jump_dests(j)}
+        for succ in list(cfg.successors(lab)):
+            if succ not in dests:
+                cfg.remove_edge(lab, succ)
+    dead = [block for block in cfg.nodes() if not ranges.reachable(block.label)]
+    for block in dead:
+        rewritten += sum(1 for _ in block.instrs())
+        cfg.remove_node(block)
+    # phi arguments coming from edges that are gone
+    for block in cfg.nodes():
+        preds = set(cfg.predecessors(block.label))
+        if block.label == cfg.lab_entry:
+            preds.add(cfg.proc_name)
+        for ins in block.body:
+            if ins.opcode == 'phi':
+                for lab_from in list(ins.arg1):
+                    if lab_from not in preds:
+                        del ins.arg1[lab_from]
+    return rewritten
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import ssagen
+    ap = argparse.ArgumentParser(description='Value-range propagation. TAC->TAC')
+    ap.add_argument('fname', metavar='FILE', type=str,
+                    help='The TAC file (.tac or .tac.json) to process')
+    ap.add_argument('-o', '--output', dest='output', type=str)
+    opts = ap.parse_args()
+    decls = tac.load_tac(opts.fname)
+    rewritten = 0
+    for decl in decls:
+        if isinstance(decl, tac.Proc):
+            cfg = cfglib.infer(decl)
+            ssagen.pruned_ssagen(decl, cfg)
+            rewritten += VRP(cfg)
+            ssagen.destruct_ssa(decl, cfg)
+            cfglib.linearize(decl, cfg)
+    print(f'// {rewritten} instructions rewritten')
+    if opts.output:
+        with open(opts.output, 'w') as fp:
+            json.dump([decl.js_obj for decl in decls], fp)
+    else:
+        for decl in decls:
+            print(decl)
@@ -7,9 +7,9 @@ import re, random, os
 # ------------------------------------------------------------------------------
 # liveness
 
-_arg1_use = re.compile(r'add|sub|mul|div|mod|neg|and|or|xor|not|shl|shr|copy|ret|jz|jnz|jl|jle|jnl|jnle')
+_arg1_use = re.compile(r'add|sub|mul|div|mod|neg|and|or|xor|not|shl|shr|copy|ret|jz|jnz|jl|jle|jnl|jnle|jtab|set(z|nz|l|le|nl|nle)')
 _arg2_use = re.compile(r'add|sub|mul|div|mod|and|or|xor|shl|shr|param')
-_dest_def = re.compile(r'add|sub|mul|div|mod|neg|and|or|xor|not|shl|shr|const|copy|phi|call')
+_dest_def = re.compile(r'add|sub|mul|div|mod|neg|and|or|xor|not|shl|shr|const|copy|phi|call|set(z|nz|l|le|nl|nle)')
 
 def use_set(instr):
     s = set()
@@ -51,6 +51,7 @@ def tmp_version(tmp):
     try: return tmp[tmp.rindex('.')+1:]
     except ValueError: return ''
 
+@cfglib.preserves('dominators', 'loops')
 def crude_ssagen(tlv, cfg):
     livein, liveout = dict(), dict()
     cfglib.recompute_liveness(cfg, livein, liveout)
@@ -78,6 +79,198 @@ def crude_ssagen(tlv, cfg):
             for lab_prev, root in instr.arg1.items():
                 instr.arg1[lab_prev] = ver_maps[lab_prev].get(root, root)
 
+# ------------------------------------------------------------------------------
+# pruned SSA gen
+
+@cfglib.preserves('dominators', 'loops')
+def pruned_ssagen(tlv, cfg):
+    """Convert `cfg' to minimal pruned SSA form: phi-functions are only placed
+    at the iterated dominance frontiers of the definitions of a temporary,
+    and only where that temporary is live. Every version of a temporary %x
+    is named %x.N with a counter per temporary, and renaming follows a walk
+    of the dominator tree. Blocks unreachable from the entry are left as
+    they are."""
+    domtree = cfg.analyses['dominators']
+    live = cfg.analyses['liveness']
+    def_blocks = {t: {cfg.lab_entry} for t in tlv.t_args}
+    for lab in domtree.preorder():
+        for instr in cfg[lab].instrs():
+            for t in instr.defs():
+                def_blocks.setdefault(t, set()).add(lab)
+    # phi placement
+    phis = dict()       # (label, temp) -> phi instruction
+    for t, labs in def_blocks.items():
+        bit = live.universe.bit(t)
+        for lab in domtree.iterated_frontier(labs):
+            if live.block_in[lab] & bit:
+                phis[lab, t] = tac.Instr(t, 'phi', ({}, None))
+    for (lab, t), phi in sorted(phis.items(), key=lambda kv: kv[0][1],
+                                reverse=True):
+        cfg[lab].body.insert(0, phi)
+    # the temporary of every phi, which may already have a version suffix
+    phi_temps = {id(phi): t for (lab, t), phi in phis.items()}
+    # renaming
+    counts = dict()
+    stacks = {t: [t] for t in def_blocks}
+
+    def new_version(t):
+        n = counts.get(t, 0)
+        counts[t] = n + 1
+        stacks[t].append(f'{t}.{n}')
+        return stacks[t][-1]
+
+    def current(t):
+        stack = stacks.get(t)
+        return stack[-1] if stack else t
+
+    def phi_args(lab_from, lab_to):
+        for instr in cfg[lab_to].body:
+            if instr.opcode != 'phi': break
+            if id(instr) in phi_temps:
+                instr.arg1[lab_from] = current(phi_temps[id(instr)])
+
+    if cfg.in_degree(cfg.lab_entry) > 0:
+        phi_args(cfg.proc_name, cfg.lab_entry)
+    walk = [(cfg.lab_entry, False)]
+    while walk:
+        lab, done = walk.pop()
+        bl = cfg[lab]
+        if done:
+            for instr in bl.instrs():
+                for t in instr.defs():
+                    stacks[tmp_root(t)].pop()
+            continue
+        for instr in bl.instrs():
+            if instr.opcode != 'phi':
+                rewrite_use_temps_nonphi(instr, current)
+            for t in instr.defs():
+                instr.dest = new_version(t)
+        for succ in cfg.successors(lab):
+            phi_args(lab, succ)
+        walk.append((lab, True))
+        walk.extend((kid, False) for kid in reversed(domtree.children[lab]))
+
+# ------------------------------------------------------------------------------
+# SSA destruction
+
+def sequentialize(copies, scratch):
+    """Order the parallel copy `copies', a list of pairs (dest, src) with
+    distinct destinations, as a list of sequential copies. Cycles are broken
+    by going through the temporary `scratch'."""
+    pending = {d: s for d, s in copies if d != s}
+    uses = dict()
+    for s in pending.values():
+        uses[s] = uses.get(s, 0) + 1
+    seq = []
+    while pending:
+        ready = [d for d in pending if uses.get(d, 0) == 0]
+        if not ready:
+            # only cycles are left: save one of the destinations
+            d = next(iter(pending))
+            seq.append((scratch, d))
+            for dd, s in pending.items():
+                if s == d: pending[dd] = scratch
+            uses[scratch], uses[d] = uses[d], 0
+            continue
+        for d in ready:
+            s = pending.pop(d)
+            seq.append((d, s))
+            uses[s] -= 1
+    return seq
+
+def fresh_temp(cfg, base):
+    """Return a temporary of the form `base', `base'1, ... unused in `cfg'"""
+    temps = {t for i in cfg.instrs() for t in i.defs()}
+    temps.update(t for i in cfg.instrs() for t in i.uses()
+                 if not isinstance(t, tuple))
+    tmp, n = base, 0
+    while tmp in temps:
+        n += 1
+        tmp = f'{base}{n}'
+    return tmp
+
+@cfglib.preserves('dominators', 'loops')
+def destruct_ssa(tlv, cfg):
+    """Replace the phi-functions of `cfg' by copies on the incoming edges.
+    Critical edges are split, the parallel copies of every edge are
+    sequentialized, and the copies are coalesced afterwards."""
+    entry = cfg[cfg.lab_entry]
+    if entry.body and entry.body[0].opcode == 'phi':
+        # the pseudo-edge from the start of the procedure gets a block too
+        lab = cfg.fresh_label()
+        cfg.add_node(cfglib.Block(lab, jumps=[tac.Instr(None, 'jmp', (entry.label, None))]))
+        for instr in entry.body:
+            if instr.opcode == 'phi' and cfg.proc_name in instr.arg1:
+                instr.arg1[lab] = instr.arg1.pop(cfg.proc_name)
+        cfg.lab_entry = lab
+    cfglib.split_critical_edges(cfg)
+    scratch = fresh_temp(cfg, '%swap')
+    for bl in list(cfg.nodes()):
+        phis = [i for i in bl.body if i.opcode == 'phi']
+        if not phis: continue
+        # the phis must come first: slicing them off would drop other code
+        assert all(i.opcode == 'phi' for i in bl.body[:len(phis)]), \
+            f'{bl.label}: phi-function after a non-phi instruction'
+        bl.body = bl.body[len(phis):]
+        for lab_prev in list(cfg.predecessors(bl.label)):
+            copies = [(phi.dest, phi.arg1[lab_prev]) for phi in phis
+                      if lab_prev in phi.arg1]
+            seq = [tac.Instr(d, 'copy', (s, None))
+                   for d, s in sequentialize(copies, scratch)]
+            if cfg.out_degree(lab_prev) == 1:
+                prev = cfg[lab_prev]
+                prev.body.extend(seq)
+                prev.jumps = [tac.Instr(None, 'jmp', (bl.label, None))]
+            else:
+                bl.body[:0] = seq
+    cfg.analyses.invalidate(('dominators', 'loops'))
+    coalesce_copies(tlv, cfg)
+
+@cfglib.preserves('dominators', 'loops')
+def coalesce_copies(tlv, cfg):
+    """Merge the source and the destination of copies whenever they do not
+    interfere, and delete the copies that become trivial"""
+    livein, liveout = dict(), dict()
+    cfglib.recompute_liveness(cfg, livein, liveout)
+    interference = dict()
+    def interfere(x, y):
+        if x != y:
+            interference.setdefault(x, set()).add(y)
+            interference.setdefault(y, set()).add(x)
+    for i in cfg.instrs():
+        for d in i.defs():
+            for t in liveout[i]:
+                if not (i.opcode == 'copy' and t == i.arg1):
+                    interfere(d, t)
+    # the arguments are all defined at the start of the procedure
+    entry_live = set(tlv.t_args) | livein[cfg[cfg.lab_entry].first_instr()]
+    for a in tlv.t_args:
+        for t in entry_live: interfere(a, t)
+    parent = dict()
+    def find(t):
+        while parent.get(t, t) != t:
+            t = parent[t]
+        return t
+    for i in cfg.instrs():
+        if i.opcode != 'copy' or not tac.Instr._istemp(i.arg1) \
+           or not tac.Instr._istemp(i.dest):
+            continue
+        d, s = find(i.dest), find(i.arg1)
+        if d == s or s in interference.get(d, ()): continue
+        if d in tlv.t_args:
+            if s in tlv.t_args: continue
+            d, s = s, d
+        # merge d into s
+        parent[d] = s
+        for t in interference.pop(d, ()):
+            interference[t].discard(d)
+            interfere(s, t)
+    for bl in cfg.nodes():
+        for i in bl.instrs():
+            i.rewrite_temps(find)
+        bl.body = [i for i in bl.body
+                   if not (i.opcode == 'copy' and i.dest == i.arg1)]
+
 # ------------------------------------------------------------------------------
 
 def make_dotfiles(cfg, procname, fname, verbosity):
@@ -98,12 +291,15 @@ if __name__ == '__main__':
     ap.add_argument('file', metavar='FILE', type=str, nargs=1, help='A TAC file')
     ap.add_argument('-v', dest='verbosity', default=0, action='count',
                     help='increase verbosity')
+    ap.add_argument('--crude', dest='crude', action='store_true', default=False,
+                    help='put a phi for every live temporary at every block')
     args = ap.parse_args()
     gvars, procs = dict(), dict()
     for tlv in tac.load_tac(args.file[0]):
         if isinstance(tlv, tac.Proc):
             cfg = cfglib.infer(tlv)
-            crude_ssagen(tlv, cfg)
+            if args.crude: crude_ssagen(tlv, cfg)
+            else: pruned_ssagen(tlv, cfg)
             make_dotfiles(cfg, tlv.name[1:], args.file[0], args.verbosity)
             if args.verbosity >= 2:
                 cfglib.linearize(tlv, cfg)
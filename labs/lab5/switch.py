@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+"""
+Lowering of the else-if chains over one scrutinee
+
+A chain is a sequence of blocks that each compare the same temporary %x
+with a constant (`sub' then `jz' or `jnz') and otherwise go on to the next
+block of the chain, which has no other predecessor and computes nothing
+but the test. The first block may compute other things before its test.
+A chain with `min_cases' distinct constants or more is replaced by a
+single dispatch: when the constants are dense enough, a jump table
+
+    %k = sub %x, lo;  jtab %k, [...];  jmp default
+
+and otherwise a balanced binary search tree of `jz'/`jl' tests on the
+differences %x - k, which takes a logarithmic number of tests. Works on
+the CFG before SSA construction.
+"""
+
+import cfg as cfglib
+import tac
+
+# ------------------------------------------------------------------------------
+
+_pure = ('const', 'copy', 'sub')
+
+
+def _test(block):
+    """The triple (scrutinee, constant, label if equal, label otherwise) of
+    the equality test ending `block', or None. The scrutinee is a temporary
+    holding the same value at the end of the block as where it is
+    compared."""
+    jumps = block.jumps
+    if len(jumps) != 2 or jumps[0].opcode not in ('jz', 'jnz') or \
+       jumps[1].opcode != 'jmp' or jumps[0].arg2 == jumps[1].arg1:
+        return None
+    env = dict()
+
+    def value(t):
+        return env[t] if t in env else ('var', t)
+
+    for instr in block.body:
+        d = instr.dest
+        if d is None:
+            continue
+        # the values computed from the old value of `d' are lost
+        for t, v in list(env.items()):
+            if v is not None and d in v[1:]:
+                env[t] = None
+        if instr.opcode == 'const':
+            env[d] = ('const', tac.untwoc(tac.twoc(instr.arg1)))
+        elif instr.opcode == 'copy' and tac.Instr._istemp(instr.arg1):
+            env[d] = value(instr.arg1)
+        elif instr.opcode == 'sub' and tac.Instr._istemp(instr.arg1) and \
+                tac.Instr._istemp(instr.arg2):
+            a, b = value(instr.arg1), value(instr.arg2)
+            if a is not None and b is not None and a[0] == 'var' and \
+               b[0] == 'const':
+                env[d] = ('sub', a[1], b[1])
+            elif a is not None and b is not None and a[0] == 'const' and \
+                    b[0] == 'var':
+                env[d] = ('sub', b[1], a[1])
+            else:
+                env[d] = None
+        else:
+            env[d] = ('var', d)
+    v = value(jumps[0].arg1)
+    if v is None or v[0] == 'const':
+        return None
+    x, k = (v[1], 0) if v[0] == 'var' else (v[1], v[2])
+    if not tac.Instr._istemp(x):
+        return None
+    if jumps[0].opcode == 'jz':
+        return x, k, jumps[0].arg2, jumps[1].arg1
+    return x, k, jumps[1].arg1, jumps[0].arg2
+
+
+def find_chains(cfg):
+    """The else-if chains of `cfg', as lists of labels of blocks"""
+    live = cfg.analyses['liveness']
+    chains, seen = [], set()
+    for lab in cfg.reverse_postorder():
+        test = _test(cfg[lab])
+        if lab in seen or test is None:
+            continue
+        chain = [lab]
+        seen.add(lab)
+        while True:
+            nxt = _test(cfg[chain[-1]])[3]
+            block = cfg[nxt]
+            test = _test(block)
+            defs = [instr.dest for instr in block.body]
+            if nxt in seen or nxt == cfg.lab_entry or test is None or \
+               test[0] != _test(cfg[lab])[0] or cfg.in_degree(nxt) != 1 or \
+               any(instr.opcode not in _pure for instr in block.body) or \
+               live.block_out[nxt] & live.universe.bits(defs):
+                break
+            chain.append(nxt)
+            seen.add(nxt)
+        chains.append(chain)
+    return chains
+
+
+def lower_chain(cfg, chain, *, min_cases=4, min_density=0.5, max_table=1024):
+    """Replace the tests of the else-if `chain' of `cfg' by a jump table or a
+    binary search. Returns the kind of dispatch ('table' or 'search'), or
+    None if the chain is left alone."""
+    cases = dict()
+    for lab in chain:
+        x, k, lab_eq, lab_ne = _test(cfg[lab])
+        cases.setdefault(k, lab_eq)     # later tests of k are never reached
+    default = lab_ne
+    keys = sorted(cases)
+    lo, hi = keys[0], keys[-1]
+    if len(keys) < min_cases or hi - lo >= 1 << 62:
+        return None
+    head = cfg[chain[0]]
+    for lab in list(cfg.successors(head.label)):
+        cfg.remove_edge(head.label, lab)
+    for lab in chain[1:]:
+        cfg.remove_node(cfg[lab])
+
+    def jump(lab_from, jumps):
+        cfg[lab_from].jumps = jumps
+        for jinstr in jumps:
+            for lab in cfglib.get_jump_dests(jinstr):
+                cfg.add_edge(lab_from, lab)
+
+    size = hi - lo + 1
+    if size <= max_table and len(keys) >= min_density * size:
+        k = x
+        if lo != 0:
+            c, k = cfg.fresh_temp('%switch'), cfg.fresh_temp('%switch')
+            head.body.extend([tac.Instr(c, 'const', (lo, None)),
+                              tac.Instr(k, 'sub', (x, c))])
+        table = [cases.get(lo + i, default) for i in range(size)]
+        jump(head.label, [tac.Instr(None, 'jtab', (k, table)),
+                          tac.Instr(None, 'jmp', (default, None))])
+        return 'table'
+
+    def search(lab, keys):
+        """Fill the block `lab' with the test of the middle key of `keys'
+        and the blocks of the searches among the smaller and larger ones"""
+        mid = len(keys) // 2
+        c, d = cfg.fresh_temp('%switch'), cfg.fresh_temp('%switch')
+        cfg[lab].body.extend([tac.Instr(c, 'const', (keys[mid], None)),
+                              tac.Instr(d, 'sub', (x, c))])
+        jumps = [tac.Instr(None, 'jz', (d, cases[keys[mid]]))]
+        subtrees = []
+        for part in (keys[:mid], keys[mid + 1:]):
+            if not part:
+                subtrees.append(default)
+                continue
+            sub = cfg.fresh_label()
+            cfg.add_node(cfglib.Block(sub))
+            search(sub, part)
+            subtrees.append(sub)
+        if subtrees[0] != subtrees[1]:
+            jumps.append(tac.Instr(None, 'jl', (d, subtrees[0])))
+        jumps.append(tac.Instr(None, 'jmp', (subtrees[1], None)))
+        jump(lab, jumps)
+
+    search(head.label, keys)
+    return 'search'
+
+
+@cfglib.preserves()
+def lower_switches(cfg, **kwargs):
+    """Lower every else-if chain of `cfg' (see `lower_chain', which takes
+    the keyword arguments). Returns the number of chains lowered."""
+    return sum(lower_chain(cfg, chain, **kwargs) is not None
+               for chain in find_chains(cfg))
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    ap = argparse.ArgumentParser(description='Else-if chain lowering. TAC->TAC')
+    ap.add_argument('fname', metavar='FILE', type=str,
+                    help='The TAC file (.tac or .tac.json) to process')
+    ap.add_argument('-o', '--output', dest='output', type=str)
+    opts = ap.parse_args()
+    decls = tac.load_tac(opts.fname)
+    lowered = 0
+    for decl in decls:
+        if isinstance(decl, tac.Proc):
+            cfg = cfglib.infer(decl)
+            lowered += lower_switches(cfg)
+            cfglib.linearize(decl, cfg)
+    print(f'// {lowered} else-if chains lowered')
+    if opts.output:
+        with open(opts.output, 'w') as fp:
+            json.dump([decl.js_obj for decl in decls], fp)
+    else:
+        for decl in decls:
+            print(decl)
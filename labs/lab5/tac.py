@@ -15,10 +15,20 @@ opcode_kinds = {
     'jmp': 'NLN',
     'jz': 'NVL', 'jnz': 'NVL', 'jl': 'NVL', 'jle': 'NVL',
     'jnl': 'NVL', 'jnle': 'NVL',
+    # jtab %k, [L0, ..., Ln-1] jumps to Lk if %k < n (unsigned), and
+    # falls through otherwise
+    'jtab': 'NVT',
     'add': 'VVV', 'sub': 'VVV', 'mul': 'VVV', 'div': 'VVV',
     'mod': 'VVV', 'neg': 'VVN', 'and': 'VVV', 'or': 'VVV',
     'xor': 'VVV', 'not': 'VVN', 'shl': 'VVV', 'shr': 'VVV',
     'const': 'VIN', 'copy': 'VVN',
+    # %d = set<cc> %a is 1 if j<cc> %a would jump, and 0 otherwise
+    'setz': 'VVN', 'setnz': 'VVN', 'setl': 'VVN', 'setle': 'VVN',
+    'setnl': 'VVN', 'setnle': 'VVN',
+    # %d = cmov<cc> %c, %a copies %a to %d if j<cc> %c would jump, and
+    # leaves %d unchanged otherwise (so %d is also used)
+    'cmovz': 'VVV', 'cmovnz': 'VVV', 'cmovl': 'VVV', 'cmovle': 'VVV',
+    'cmovnl': 'VVV', 'cmovnle': 'VVV',
     'label': 'NLN',
     'param': 'NIV', 'call': 'OGI', 'ret': 'NON',
     'phi': 'VFN',
@@ -70,6 +80,11 @@ class Instr:
         return (isinstance(thing, dict) and \
                 all(Instr._isvar(x) for x in thing.values()))
 
+    @staticmethod
+    def _istable(thing):
+        return (isinstance(thing, list) and len(thing) > 0 and \
+                all(Instr._islabel(x) for x in thing))
+
     @staticmethod
     def _isvalid(thing, k):
         if k == 'N': return thing == None
@@ -78,6 +93,7 @@ class Instr:
         if k == 'L': return Instr._islabel(thing)
         if k == 'G': return Instr._isglobal(thing)
         if k == 'F': return Instr._isphiargs(thing)
+        if k == 'T': return Instr._istable(thing)
         if k == 'O': return thing == None or Instr._isvar(thing)
         return ValueError(f'Unknown argument kind: {k}')
 
@@ -104,6 +120,8 @@ class Instr:
             result.write(f'  {self.dest} = phi(')
             result.write(', '.join(f'{lab}:{tmp}' for lab, tmp in self.arg1.items()))
             result.write(');')
+        elif self.opcode == 'jtab':
+            result.write(f'  jtab {self.arg1}, [{", ".join(self.arg2)}];')
         else:
             result.write('  ')
             if self.dest != None:
@@ -133,6 +151,7 @@ class Instr:
         argument of a phi-function."""
         if self._istemp(self.arg1): yield self.arg1
         if self._istemp(self.arg2): yield self.arg2
+        if self.opcode in cmovs and self._istemp(self.dest): yield self.dest
         if self.opcode == 'phi':
             for l, t in self.arg1.items():
                 if self._istemp(t): yield (l, t)
@@ -408,6 +427,12 @@ jumps = {
     'jnl':  (lambda k: untwoc(k) >= 0),
     'jnle': (lambda k: untwoc(k) > 0),
 }
+unops.update({'set' + j[1:]: (lambda cc: lambda u: int(cc(u)))(cc)
+              for j, cc in jumps.items()})
+cmovs = {'cmov' + j[1:]: cc for j, cc in jumps.items()}
+
+class OutOfFuel(RuntimeError):
+    """Raised by `execute' when its instruction budget is exhausted"""
 
 class TempMap(dict):
     """Mapping temporaries to values"""
@@ -451,6 +476,16 @@ def execute(gvars, procs, proc_name, args, **kwargs):
     show_instr = kwargs.get('show_instr', False)
     only_decimal = kwargs.get('only_decimal', True)
     depth = kwargs.get('depth', 0)
+    # dynamic instruction counts per opcode, if requested
+    counts = kwargs.get('counts', None)
+    # dynamic call counts per (caller, callee) edge, if requested
+    calls = kwargs.get('calls', None)
+    # instruction budget shared by all the calls, a list [n] if requested
+    fuel = kwargs.get('fuel', None)
+    # dynamic counts per (proc, label from, label to) edge, if requested
+    edges = kwargs.get('edges', None)
+    # taken jumps per opcode, if requested
+    taken = kwargs.get('taken', None)
     indent = '  ' * depth
 
     values = TempMap(gvars)
@@ -483,10 +518,18 @@ def execute(gvars, procs, proc_name, args, **kwargs):
         pc += 1
 
         if show_instr: print(f'// {indent}[{pc+1: 4d}] {instr}')
+        if counts is not None:
+            counts[instr.opcode] = counts.get(instr.opcode, 0) + 1
+        if fuel is not None:
+            fuel[0] -= 1
+            if fuel[0] < 0: raise OutOfFuel(f'out of fuel in {proc_name}')
         if instr.opcode == 'nop':
             pass
         elif instr.opcode == 'label':
             lab_prev, lab_cur = lab_cur, instr.arg1
+            if edges is not None and lab_prev != proc_name:
+                edge = (proc_name, lab_prev, lab_cur)
+                edges[edge] = edges.get(edge, 0) + 1
         elif instr.opcode == 'phi':
             for lab, tmp in instr.arg1.items():
                 if lab == lab_prev:
@@ -502,6 +545,11 @@ def execute(gvars, procs, proc_name, args, **kwargs):
             lab_prev, lab_cur = lab_cur, instr.arg1
             oldvalues = values.copy()
             pc = labels[lab_cur]
+            if edges is not None:
+                edge = (proc_name, lab_prev, lab_cur)
+                edges[edge] = edges.get(edge, 0) + 1
+            if taken is not None:
+                taken['jmp'] = taken.get('jmp', 0) + 1
         elif instr.opcode in jumps:
             k = values[instr.arg1]
             if instr.arg2 not in labels:
@@ -510,6 +558,24 @@ def execute(gvars, procs, proc_name, args, **kwargs):
                 lab_prev, lab_cur = lab_cur, instr.arg2
                 oldvalues = values.copy()
                 pc = labels[lab_cur]
+                if edges is not None:
+                    edge = (proc_name, lab_prev, lab_cur)
+                    edges[edge] = edges.get(edge, 0) + 1
+                if taken is not None:
+                    taken[instr.opcode] = taken.get(instr.opcode, 0) + 1
+        elif instr.opcode == 'jtab':
+            k = values[instr.arg1]
+            if k < len(instr.arg2):
+                if instr.arg2[k] not in labels:
+                    raise RuntimeError(f'Unknown jump destination {instr.arg2[k]}')
+                lab_prev, lab_cur = lab_cur, instr.arg2[k]
+                oldvalues = values.copy()
+                pc = labels[lab_cur]
+                if edges is not None:
+                    edge = (proc_name, lab_prev, lab_cur)
+                    edges[edge] = edges.get(edge, 0) + 1
+                if taken is not None:
+                    taken['jtab'] = taken.get('jtab', 0) + 1
         elif instr.opcode == 'const':
             if not isinstance(instr.arg1, int):
                 print(f'Missing or bad argument: {instr.arg1}')
@@ -542,6 +608,9 @@ def execute(gvars, procs, proc_name, args, **kwargs):
                 if len(params) < instr.arg2:
                     raise RuntimeError(f'Bad number of arguments to {instr.arg1}(): '
                                        f'expected {instr.arg2}, got {len(params)}')
+                if calls is not None:
+                    edge = (proc_name, instr.arg1)
+                    calls[edge] = calls.get(edge, 0) + 1
                 kwargs['depth'] = depth + 1
                 result = execute(gvars, procs, instr.arg1, params, **kwargs)
                 if instr.dest:
@@ -562,6 +631,9 @@ def execute(gvars, procs, proc_name, args, **kwargs):
                 print(f'Unary operator {instr.opcode} has two arguments!')
                 raise RuntimeError
             values[instr.dest] = unops[instr.opcode](u)
+        elif instr.opcode in cmovs:
+            if cmovs[instr.opcode](values[instr.arg1]):
+                values[instr.dest] = values[instr.arg2]
         else:
             print(f'Unknown opcode {instr.opcode}')
             raise RuntimeError
@@ -604,6 +676,9 @@ if __name__ == '__main__':
     ap.add_argument('--trace-all', dest='trace_all',
                     action='store_true', default=False,
                     help='Turn on all the trace-* options')
+    ap.add_argument('--count-instrs', dest='count_instrs',
+                    action='store_true', default=False,
+                    help='Print the number of instructions executed')
     ap.add_argument('--no-exec', dest='execute', action='store_false',
                     default=True,
                     help='Do not run the interpreter')
@@ -628,7 +703,13 @@ if __name__ == '__main__':
             if isinstance(tlv, Proc): procs[tlv.name] = tlv
             else: gvars[tlv.name] = tlv
         if args.execute:
+            if args.count_instrs: kwargs['counts'] = dict()
             execute(gvars, procs, '@main', (), **kwargs)
+            if args.count_instrs:
+                counts = kwargs['counts']
+                print(f'// {sum(counts.values())} instructions executed')
+                for opcode, count in sorted(counts.items()):
+                    print(f'//   {opcode}: {count}')
         elif args.verbosity > 0:
             for gvar in gvars.values(): print(gvar)
             for proc in procs.values(): print(proc)
@@ -5,88 +5,724 @@ from typing import List, Union
 from cfg import *
 from ssagen import *
 from tac import *
-import copy
+import layout
+import ranges
+import switch
+import unroll
 
 
-def DSE(cfg: CFG) -> CFG:
+def removable_call(ins, summaries) -> bool:
+    """True if `ins' is a call that can be deleted when its result is not
+    used, according to the procedure summaries of `ipa.summarize'"""
+    if summaries is None or ins.opcode != 'call':
+        return False
+    summary = summaries.get(ins.arg1)
+    return summary is not None and summary.removable
+
+
+def call_params(body, i) -> list:
+    """Indexes of the `param' instructions passing the arguments of the
+    call at `body[i]'"""
+    params = []
+    for j in range(i - 1, -1, -1):
+        if body[j].opcode == 'call':
+            break
+        if body[j].opcode == 'param':
+            params.append(j)
+    return params
+
+
+@preserves('dominators', 'loops')
+def DSE(cfg: CFG, summaries=None) -> CFG:
     """
-    Global Dead Store Elimination
+    Global Dead Store Elimination. The blocks are updated in place, and
+    liveness is recomputed after every round that removed something.
+    With `summaries', the calls to removable procedures whose result is
+    dead are deleted along with their params.
     """
     modified = True
     while modified:
         modified = False
-        livein, liveout = dict(), dict()
-        recompute_liveness(cfg, livein, liveout)
-
-        block_list = []
-        for block_label, block in cfg._blockmap.items():
+        live = cfg.analyses['liveness']
+        for block in cfg.nodes():
             new_block_instrs = []
-            for ins in block.body:
+            facts = live.instr_facts(block.label)[:len(block.body)]
+            for ins, _, out in facts:
+                if removable_call(ins, summaries) and \
+                   not (ins.dest and out & live.universe.bit(ins.dest)):
+                    for j in call_params(new_block_instrs,
+                                         len(new_block_instrs)):
+                        del new_block_instrs[j]
+                    modified = True
+                    continue
                 if ins.opcode not in ('div', 'mod', 'call'):
                     # Check if dead store
-                    if ins.dest and ins.dest not in liveout[ins] and ins.dest.startswith('%'):
+                    if ins.dest and ins.dest.startswith('%') and \
+                       not out & live.universe.bit(ins.dest):
                         modified = True
                         continue
                 new_block_instrs.append(ins)
-            block_list.append(
-                Block(block.label, new_block_instrs, block.jumps))
-        cfg = CFG(cfg.proc_name, cfg.lab_entry, block_list)
+            block.body = new_block_instrs
+        cfg.analyses.invalidate(('dominators', 'loops'))
     return cfg
 
 
+@preserves('dominators', 'loops', 'defuse')
+def DCE(cfg: CFG, summaries=None) -> int:
+    """
+    Dead Code Elimination on SSA form, driven by the use counts of the
+    def-use index: an instruction whose result is never used is deleted,
+    which may in turn leave its operands unused. Instructions with side
+    effects (div, mod, call) are kept, except with `summaries' the calls
+    to removable procedures, deleted with their params. Returns the number
+    of instructions deleted.
+    """
+    du = cfg.analyses['defuse']
+    worklist = [t for t in du.defs if du.use_count(t) == 0]
+    dead = dict()   # label -> ids of the dead instructions of the block
+
+    def kill(lab, ins):
+        du.remove_instr(ins)
+        dead.setdefault(lab, set()).add(id(ins))
+        worklist.extend(du.used_temps(ins))
+
+    def kill_call(lab, ins):
+        body = cfg[lab].body
+        i = next(i for i, other in enumerate(body) if other is ins)
+        for j in call_params(body, i):
+            if id(body[j]) not in dead.get(lab, ()):
+                kill(lab, body[j])
+        kill(lab, ins)
+
+    for block in cfg.nodes():
+        for ins in block.body:
+            if removable_call(ins, summaries) and not ins.dest:
+                kill_call(block.label, ins)
+    while worklist:
+        t = worklist.pop()
+        if t not in du.defs or du.use_count(t) > 0:
+            continue
+        lab, ins = du.defs[t]
+        if removable_call(ins, summaries):
+            kill_call(lab, ins)
+            continue
+        if ins.opcode in ('div', 'mod', 'call'):
+            continue
+        kill(lab, ins)
+    for lab, ids in dead.items():
+        block = cfg[lab]
+        block.body = [ins for ins in block.body if id(ins) not in ids]
+    return sum(len(ids) for ids in dead.values())
+
+
+@preserves('dominators', 'loops')
 def GCP(tlv, cfg: CFG) -> CFG:
     """
-    Global Copy Propagation. This is a one-shot procedure.
-    """
-    new_body = []
-    crude_ssagen(tlv, cfg)
-    cfg_copy = copy.deepcopy(cfg)
-
-    # iterate over all instructions
-    for index, instr in enumerate(cfg_copy.instrs()):
-        # look for copy instructions
-        if instr.opcode == "copy":
-            to_replace = instr.dest
-            to_use = instr.arg1
-            new_blocks = []
-
-            # iterate over all blocks
-            for block in cfg._blockmap.values():
-                inst_list = []
-                for instru in block.body:
-
-                    # change the old temp name by the new one in phi functions
-                    if instru.opcode == "phi":
-                        new_arg = dict()
-                        for label, temp in instru.arg1.items():
-                            new_arg[label] = temp if temp != to_replace else to_use
-                        inst_list.append(Instr(
-                            to_use if instru.dest == to_replace else instru.dest, instru.opcode, [new_arg]))
-
-                    # change the old temp name by the new one in other instructions and discard the original copy instruction
-                    elif instru.opcode != "copy" or instru.arg1 != to_use or instru.dest != to_replace:
-                        inst_list.append(Instr(to_use if instru.dest == to_replace else instru.dest, instru.opcode, [
-                                         (to_use if arg == to_replace else arg) for arg in [instru.arg1, instru.arg2]]))
-
-                # create new block with new instructions
-                new_block = Block(block.label, inst_list, block.jumps)
-                new_blocks.append(new_block)
-
-            # update cfg
-            cfg = CFG(cfg.proc_name, cfg.lab_entry, new_blocks)
+    Global Copy Propagation. The CFG is converted to SSA form, where every
+    copy %x = copy %y can be propagated everywhere since the definition of
+    %y dominates all the uses of %x. The copies form a forest that is
+    resolved once with union-find, then every use is rewritten and the
+    copies are deleted, in place.
+    """
+    pruned_ssagen(tlv, cfg)
+    parent = dict()
+    for ins in cfg.instrs():
+        if ins.opcode == 'copy' and Instr._istemp(ins.dest) \
+           and Instr._istemp(ins.arg1):
+            parent[ins.dest] = ins.arg1
 
+    def find(t):
+        root = t
+        seen = set()
+        while root in parent and root not in seen:
+            seen.add(root)
+            root = parent[root]
+        # path compression
+        while t != root and t in parent:
+            parent[t], t = root, parent[t]
+        return root
+    rename = {t: find(t) for t in parent}
+    for block in cfg.nodes():
+        body = []
+        for ins in block.body:
+            if ins.opcode == 'copy' and ins.dest in rename:
+                # copies are only kept on cycles, in unreachable code
+                if rename[ins.dest] != ins.dest:
+                    continue
+            rewrite_uses(ins, rename)
+            body.append(ins)
+        block.body = body
+        for ins in block.jumps:
+            rewrite_uses(ins, rename)
     return cfg
 
 
-def optimize_decl(tac_proc: Union[Gvar, Proc]):
+# lattice value of the temporaries that are not constant; temporaries that
+# have no value yet (top) are absent from the value map
+_bottom = object()
+
+
+def _fold(ins, args):
+    """Value of `ins' given the lattice values of its arguments"""
+    if ins.opcode == 'const':
+        return tac.twoc(ins.arg1)
+    if ins.opcode == 'copy':
+        return args[0]
+    if ins.opcode not in tac.binops and ins.opcode not in tac.unops:
+        return _bottom
+    if any(arg is _bottom for arg in args):
+        return _bottom
+    if any(arg is None for arg in args):
+        return None
+    if ins.opcode in ('div', 'mod') and args[1] == 0:
+        return _bottom
+    if ins.opcode in ('shl', 'shr') and not 0 <= tac.untwoc(args[1]) < 64:
+        return _bottom
+    if ins.opcode in tac.unops:
+        return tac.unops[ins.opcode](args[0])
+    return tac.binops[ins.opcode](*args)
+
+
+@preserves()
+def SCCP(cfg: CFG) -> tuple:
+    """
+    Sparse Conditional Constant Propagation on SSA form (Wegman and
+    Zadeck). Values are propagated along the def-use chains and only
+    through the edges found to be executable. Instructions computing a
+    constant are rewritten to `const', conditional jumps on constants are
+    decided, and blocks that are never reached are deleted. Returns the
+    pair (instructions removed, blocks removed).
+    """
+    du = cfg.analyses['defuse']
+    value = dict()
+    # the procedure is entered through a pseudo-edge from its name
+    executable = {(cfg.proc_name, cfg.lab_entry)}
+    visited = set()
+    flow = [(cfg.proc_name, cfg.lab_entry)]
+    ssa = []
+
+    def get(t):
+        if t in value:
+            return value[t]
+        if t not in du.defs:
+            # arguments and globals
+            return _bottom
+        return None
+
+    def lower(t, v):
+        old = value.get(t)
+        if old is _bottom or v is None or (old is not None and old == v):
+            return
+        value[t] = v if old is None else _bottom
+        ssa.append(t)
+
+    def visit(lab, ins):
+        if not Instr._istemp(ins.dest):
+            return
+        if ins.opcode == 'phi':
+            v = None
+            for lab_from, t in ins.arg1.items():
+                if (lab_from, lab) not in executable:
+                    continue
+                w = get(t)
+                if w is None:
+                    continue
+                if v is None:
+                    v = w
+                elif v is _bottom or w is _bottom or v != w:
+                    v = _bottom
+        else:
+            v = _fold(ins, [get(t) for t in (ins.arg1, ins.arg2)
+                            if Instr._istemp(t) or Instr._isglobal(t)])
+        lower(ins.dest, v)
+
+    def decide(j):
+        """Is the conditional jump `j' taken (True, False), or unknown?"""
+        c = get(j.arg1)
+        if c is None or c is _bottom:
+            return c
+        if j.opcode == 'jtab':
+            return c < len(j.arg2)
+        return tac.jumps[j.opcode](c)
+
+    def visit_jumps(lab):
+        for j in cfg[lab].jumps:
+            if j.opcode == 'ret':
+                break
+            if j.opcode == 'jmp':
+                mark(lab, j.arg1)
+                break
+            taken = decide(j)
+            if taken is None:
+                break
+            if taken is True and j.opcode == 'jtab':
+                mark(lab, j.arg2[get(j.arg1)])
+            elif taken is not False:
+                for dest in get_jump_dests(j):
+                    mark(lab, dest)
+            if taken is True:
+                break
+
+    def mark(lab_from, lab_to):
+        if (lab_from, lab_to) not in executable:
+            executable.add((lab_from, lab_to))
+            flow.append((lab_from, lab_to))
+
+    while flow or ssa:
+        while flow:
+            _, lab = flow.pop()
+            block = cfg[lab]
+            if lab in visited:
+                for ins in block.body:
+                    if ins.opcode == 'phi':
+                        visit(lab, ins)
+                continue
+            visited.add(lab)
+            for ins in block.body:
+                visit(lab, ins)
+            visit_jumps(lab)
+        while ssa:
+            t = ssa.pop()
+            for lab, ins in list(du.uses.get(t, dict()).values()):
+                if lab not in visited:
+                    continue
+                if ins.opcode in tac.jumps or ins.opcode == 'jtab':
+                    visit_jumps(lab)
+                else:
+                    visit(lab, ins)
+
+    # rewrite
+    instrs_removed = 0
+    for lab in visited:
+        block = cfg[lab]
+        for ins in block.body:
+            v = value.get(ins.dest)
+            if v is not None and v is not _bottom and \
+               ins.opcode not in ('const', 'call'):
+                ins.opcode, ins.arg1, ins.arg2 = 'const', tac.untwoc(v), None
+        # the constant phis are now consts
+        block.hoist_phis()
+        jumps = []
+        for j in block.jumps:
+            if j.opcode in tac.jumps or j.opcode == 'jtab':
+                taken = decide(j)
+                if taken is False:
+                    continue
+                if taken is True:
+                    dest = j.arg2[get(j.arg1)] if j.opcode == 'jtab' \
+                        else j.arg2
+                    j = Instr(None, 'jmp', (dest, None))
+            jumps.append(j)
+            if j.opcode in ('jmp', 'ret'):
+                break
+        instrs_removed += len(block.jumps) - len(jumps)
+        block.jumps = jumps
+        dests = {dest for j in jumps for dest in get_jump_dests(j)}
+        for succ in list(cfg.successors(lab)):
+            if succ not in dests:
+                cfg.remove_edge(lab, succ)
+    dead = [block for block in cfg.nodes() if block.label not in visited]
+    for block in dead:
+        instrs_removed += sum(1 for _ in block.instrs())
+        cfg.remove_node(block)
+    # phi arguments coming from edges that are gone
+    for block in cfg.nodes():
+        preds = set(cfg.predecessors(block.label))
+        if block.label == cfg.lab_entry:
+            preds.add(cfg.proc_name)
+        for ins in block.body:
+            if ins.opcode == 'phi':
+                for lab_from in list(ins.arg1):
+                    if lab_from not in preds:
+                        del ins.arg1[lab_from]
+    return instrs_removed, len(dead)
+
+
+_commutative = frozenset(('add', 'mul', 'and', 'or', 'xor'))
+
+
+@preserves('dominators', 'loops')
+def GVN(cfg: CFG, summaries=None) -> int:
+    """
+    Global Value Numbering on SSA form. The dominator tree is walked with a
+    scoped hash table from expressions to the temporary holding their
+    value, so an expression is only reused when its first computation
+    dominates it. The operands of commutative operations are sorted.
+    Calls, div and mod, and the other instructions reading globals are
+    left alone. The copies of a global are only reused inside a block, up
+    to the next write of that global or call that may write it (any call
+    without `summaries'). A redundant instruction becomes a copy of the
+    dominating value, and all the uses are renamed to it. Returns the
+    number of redundant instructions.
+    """
+    domtree = cfg.analyses['dominators']
+    leader = dict()
+    # the reads of a global are numbered by block and by writes
+    writes = dict()
+
+    def vn(t):
+        return leader.get(t, t)
+
+    def key(lab, ins):
+        if ins.opcode == 'const':
+            return ('const', tac.twoc(ins.arg1))
+        if ins.opcode == 'phi':
+            return ('phi', lab) + tuple(sorted((l, vn(t))
+                                               for l, t in ins.arg1.items()))
+        if ins.opcode == 'copy' and Instr._isglobal(ins.arg1):
+            return ('global', ins.arg1, lab, writes.get(ins.arg1, 0),
+                    writes.get(None, 0))
+        if ins.opcode not in tac.binops and ins.opcode not in tac.unops \
+           or ins.opcode in ('div', 'mod') \
+           or Instr._isglobal(ins.arg1) or Instr._isglobal(ins.arg2):
+            return None
+        args = [vn(t) for t in (ins.arg1, ins.arg2) if t is not None]
+        if ins.opcode in _commutative:
+            args.sort()
+        return (ins.opcode, *args)
+
+    table = dict()
+    redundant = 0
+    walk = [(cfg.lab_entry, None)]
+    while walk:
+        lab, scope = walk.pop()
+        if scope is not None:
+            # leaving the subtree of `lab'
+            for k in scope:
+                del table[k]
+            continue
+        scope = []
+        block = cfg[lab]
+        for ins in block.body:
+            k = None
+            if Instr._isglobal(ins.dest):
+                writes[ins.dest] = writes.get(ins.dest, 0) + 1
+            elif ins.opcode == 'call' and \
+                    not ins.arg1.startswith('@__bx_print'):
+                summary = summaries.get(ins.arg1) if summaries else None
+                # None stands for all the globals
+                for g in summary.writes if summary else (None,):
+                    writes[g] = writes.get(g, 0) + 1
+            if ins.opcode == 'copy' and Instr._istemp(ins.arg1):
+                leader[ins.dest] = vn(ins.arg1)
+            elif Instr._istemp(ins.dest):
+                k = key(lab, ins)
+            if k in table:
+                leader[ins.dest] = table[k]
+                redundant += 1
+                ins.opcode, ins.arg1, ins.arg2 = 'copy', table[k], None
+            elif k is not None:
+                table[k] = ins.dest
+                scope.append(k)
+        # the redundant phis are now copies
+        block.hoist_phis()
+        walk.append((lab, scope))
+        walk.extend((kid, None) for kid in reversed(domtree.children[lab]))
+    for ins in cfg.instrs():
+        rewrite_uses(ins, leader)
+    return redundant
+
+
+# pure instructions that cannot trap (the interpreter fails on negative
+# shift amounts, so shifts are left out)
+_hoistable = (frozenset(tac.binops) - {'div', 'mod', 'shl', 'shr'}) | \
+    frozenset(tac.unops) | {'const', 'copy'}
+
+
+@preserves('dominators', 'loops')
+def LICM(cfg: CFG) -> int:
+    """
+    Loop-Invariant Code Motion on SSA form. Every loop gets a preheader,
+    then the instructions of `_hoistable' whose operands are all defined
+    outside of the loop are moved to the preheader. Inner loops are done
+    first, so code can move out of several loops. Returns the number of
+    instructions moved.
+    """
+    loops = cfg.analyses['loops']
+    for head in loops.headers():
+        insert_preheader(cfg, head, loops.body[head])
+    loops = cfg.analyses['loops']
+    def_block = dict()
+    for block in cfg.nodes():
+        for ins in block.body:
+            for t in ins.defs():
+                def_block[t] = block.label
+    rpo = cfg.reverse_postorder()
+    hoisted = 0
+    for head in sorted(loops.body, key=loops.depth.get, reverse=True):
+        body = loops.body[head]
+        pre = cfg[loops.preheader(head)]
+        for lab in rpo:
+            if lab not in body:
+                continue
+            block = cfg[lab]
+            keep = []
+            for ins in block.body:
+                if ins.opcode in _hoistable and Instr._istemp(ins.dest) and \
+                   not Instr._isglobal(ins.arg1) and \
+                   all(def_block.get(t) not in body
+                       for t in DefUse.used_temps(ins)):
+                    pre.body.append(ins)
+                    def_block[ins.dest] = pre.label
+                    hoisted += 1
+                else:
+                    keep.append(ins)
+            block.body = keep
+    return hoisted
+
+
+_ordered = ('jl', 'jle', 'jnl', 'jnle')
+
+
+@preserves('dominators', 'loops')
+def IVSR(cfg: CFG) -> int:
+    """
+    Induction-Variable Strength Reduction on SSA form. A basic induction
+    variable is a phi-function %i of a loop header whose arguments coming
+    from inside the loop are all the same %n = add %i, %c (or add %c, %i,
+    or sub %i, %c) with %c loop-invariant. Every derived induction
+    variable %j = mul %i, %k (or mul %k, %i) in the loop, with %k
+    loop-invariant, is replaced by a new phi-function %j' of the header,
+    started at init * %k in the preheader and updated by %c * %k next to
+    %n. When the exit test of the header, or of the only latch of a
+    rotated loop, compares %i or %n with a constant and the values
+    involved are constants that cannot overflow, the test is rewritten to
+    compare %j' or its update with the scaled bound instead. The basic
+    induction variables that are then only used to update themselves are
+    deleted. Returns the number of multiplications removed.
+    """
+    loops = cfg.analyses['loops']
+    for head in loops.headers():
+        insert_preheader(cfg, head, loops.body[head])
+    loops = cfg.analyses['loops']
+    du = cfg.analyses['defuse']
+    reduced = 0
+
+    def add(lab, ins, pos=None):
+        block = cfg[lab]
+        if pos is None:
+            block.body.append(ins)
+        else:
+            block.body.insert(pos, ins)
+        du.add_instr(lab, ins)
+
+    def root(t):
+        return t[:t.rindex('.')] if '.' in t else t
+
+    def const_value(t):
+        ins = du.defs.get(t, (None, None))[1]
+        if ins is not None and ins.opcode == 'const':
+            return tac.untwoc(tac.twoc(ins.arg1))
+
+    def replace_test(head, pre, iv, jp, jn, k):
+        """Rewrite the exit test `sub %i, n' (or `sub %n, n') of the header,
+        or else of the only latch, into `sub %j, n*k' (or `sub %j.next,
+        n*k'), when every value involved is a constant and there is no
+        overflow"""
+        phi, latches, step, lab_inc, inc = iv
+        body = loops.body[head]
+        kv, c, init = const_value(k), const_value(step), \
+            const_value(phi.arg1[pre])
+        lab_test = head
+        if cfg[head].jumps[0].opcode not in _ordered and len(latches) == 1:
+            lab_test = latches[0]    # rotated loop
+        jumps = cfg[lab_test].jumps
+        if kv is None or kv <= 0 or c is None or init is None or \
+           len(jumps) != 2 or jumps[0].opcode not in _ordered:
+            return False
+        jcc = jumps[0]
+        lab_t, test = du.defs.get(jcc.arg1, (None, None))
+        if lab_t != lab_test or test.opcode != 'sub' or \
+           du.use_count(test.dest) != 1:
+            return False
+        scaled = {phi.dest: jp}
+        if lab_test == lab_inc:
+            order = [ins for ins in cfg[lab_inc].body if ins is inc or
+                     ins is test]
+            if order[0] is inc:
+                scaled[inc.dest] = jn
+        if test.arg1 in scaled:
+            n, sign, tested = const_value(test.arg2), 1, test.arg1
+        elif test.arg2 in scaled:
+            n, sign, tested = const_value(test.arg1), -1, test.arg2
+        else:
+            return False
+        if n is None:
+            return False
+        # x = sign * (%i - n) moves by dx every iteration; the loop must
+        # run while x is on the side of 0 it starts from and move towards 0
+        dx = sign * (c if inc.opcode == 'add' else -c)
+        lower = (jcc.opcode in ('jl', 'jle')) == (jcc.arg2 in body)
+        if (lower and dx <= 0) or (not lower and dx >= 0):
+            return False
+        x0 = sign * (init - n)
+        if (abs(n) + abs(x0) + abs(c)) * kv >= 1 << 62:
+            return False
+        nk = cfg.fresh_temp(root(test.dest))
+        add(pre, Instr(nk, 'const', (n * kv, None)))
+        du.remove_instr(test)
+        j = scaled[tested]
+        test.arg1, test.arg2 = (j, nk) if sign == 1 else (nk, j)
+        du.add_instr(lab_test, test)
+        return True
+
+    for head in sorted(loops.body, key=loops.depth.get, reverse=True):
+        body = loops.body[head]
+        pre = loops.preheader(head)
+        derived = dict()
+
+        def invariant(t):
+            return Instr._istemp(t) and du.defs.get(t, (pre,))[0] not in body
+
+        basic = []
+        for phi in cfg[head].body:
+            if phi.opcode != 'phi':
+                break
+            latches = [lab for lab in phi.arg1 if lab != pre]
+            nexts = {phi.arg1[lab] for lab in latches}
+            if pre not in phi.arg1 or len(nexts) != 1:
+                continue
+            lab_inc, inc = du.defs.get(next(iter(nexts)), (None, None))
+            if lab_inc not in body or inc.opcode not in ('add', 'sub'):
+                continue
+            if inc.arg1 == phi.dest and invariant(inc.arg2):
+                step = inc.arg2
+            elif inc.opcode == 'add' and inc.arg2 == phi.dest and \
+                    invariant(inc.arg1):
+                step = inc.arg1
+            else:
+                continue
+            basic.append((phi, latches, step, lab_inc, inc))
+
+        for phi, latches, step, lab_inc, inc in basic:
+            muls = [(lab, ins) for lab, ins in du.uses.get(phi.dest, {}).values()
+                    if lab in body and ins.opcode == 'mul']
+            for lab, mul in muls:
+                k = mul.arg2 if mul.arg1 == phi.dest else mul.arg1
+                if not invariant(k):
+                    continue
+                j0, s, jp, jn = (cfg.fresh_temp(root(mul.dest))
+                                 for _ in range(4))
+                add(pre, Instr(j0, 'mul', (phi.arg1[pre], k)))
+                add(pre, Instr(s, 'mul', (step, k)))
+                args = {lab_latch: jn for lab_latch in latches}
+                args[pre] = j0
+                add(head, Instr(jp, 'phi', (args, None)), 0)
+                pos = next(n for n, ins in enumerate(cfg[lab_inc].body)
+                           if ins is inc)
+                add(lab_inc, Instr(jn, inc.opcode, (jp, s)), pos + 1)
+                du.replace_uses(mul.dest, jp)
+                du.remove_instr(mul)
+                cfg[lab].body.remove(mul)
+                derived.setdefault(phi.dest, []).append((jp, jn, k))
+                reduced += 1
+
+        # linear function test replacement: the exit test of the header
+        # is moved from a basic induction variable to a derived one
+        for iv in basic:
+            for jp, jn, k in derived.get(iv[0].dest, ()):
+                if replace_test(head, pre, iv, jp, jn, k):
+                    break
+
+        # basic induction variables that only update themselves
+        for phi, latches, step, lab_inc, inc in basic:
+            if du.use_count(phi.dest) == 1 and du.use_count(inc.dest) == 1:
+                for lab, ins in ((head, phi), (lab_inc, inc)):
+                    du.remove_instr(ins)
+                    cfg[lab].body.remove(ins)
+    return reduced
+
+
+def _loop_test(cfg: CFG, head, body) -> list:
+    """The labels of the blocks from `head' to the first block of the loop
+    `body' with an exit, following the blocks with a single successor. Empty
+    if there is no such block."""
+    chain = [head]
+    while True:
+        succs = set(cfg.successors(chain[-1]))
+        if len(succs) != 1:
+            break
+        succ = succs.pop()
+        if succ not in body or succ in chain:
+            return []
+        chain.append(succ)
+    succs = set(cfg.successors(chain[-1]))
+    if not (succs & body) or succs <= body:
+        return []
+    return chain
+
+
+@preserves()
+def rotate_loops(cfg: CFG, max_size=10) -> int:
+    """
+    Loop rotation, before SSA construction. The test of a while loop is at
+    its header, which the body jumps back to: the blocks from the header to
+    the test (see `_loop_test') are copied at the end of every latch in
+    place of its `jmp', so that each iteration ends with the conditional
+    back edge. The original test remains as the guard of the loop. Loops
+    whose test has more than `max_size' instructions, or with a latch not
+    ending with `jmp', are left alone. Returns the number of loops rotated.
+    """
+    heads = cfg.analyses['loops'].headers()
+    rotated = 0
+    for head in reversed(heads):    # inner loops first
+        loops = cfg.analyses['loops']
+        if head not in loops.body:
+            continue
+        body = loops.body[head]
+        chain = _loop_test(cfg, head, body)
+        latches = loops.back_edges(head)
+        if not chain or any(lab in chain for lab in latches) or \
+           sum(len(cfg[lab].body) for lab in chain) > max_size or \
+           any(cfg[lab].jumps[0].opcode != 'jmp' for lab in latches):
+            continue
+        test = cfg[chain[-1]]
+        for lab in latches:
+            block = cfg[lab]
+            for lab_chain in chain:
+                block.body.extend(Instr(ins.dest, ins.opcode,
+                                        (ins.arg1, ins.arg2))
+                                  for ins in cfg[lab_chain].body)
+            block.jumps = [Instr(ins.dest, ins.opcode, (ins.arg1, ins.arg2))
+                           for ins in test.jumps]
+            for succ in list(cfg.successors(lab)):
+                cfg.remove_edge(lab, succ)
+            for succ in list(cfg.successors(test.label)):
+                cfg.add_edge(lab, succ)
+        rotated += 1
+    return rotated
+
+
+def optimize_decl(tac_proc: Union[Gvar, Proc], summaries=None, *,
+                  rotate=True, unroll_loops=True):
     """
-    Optimize a declaration. First perform DSE as many times as necessary,
-    then GCP. 
+    Optimize a declaration. First unroll the small counted loops (unless
+    `unroll_loops' is false, see unroll.py) and rotate the loops (unless
+    `rotate' is false), perform DSE as many times as necessary and lower
+    the else-if chains (see switch.py), then GCP, and finally SCCP, VRP
+    (see ranges.py), GVN, LICM, IVSR and DCE on the resulting SSA form.
+    The procedure summaries of `ipa.summarize', if given, let DSE, GVN and
+    DCE see through the calls. The result is translated out of SSA form,
+    and its blocks are laid out following the loops (see layout.py).
     """
     cfg = infer(tac_proc)
-    cfg = DSE(cfg)
+    if unroll_loops:
+        unroll.unroll_loops(cfg)
+    if rotate:
+        rotate_loops(cfg)
+    cfg = DSE(cfg, summaries)
+    switch.lower_switches(cfg)
     cfg = GCP(tac_proc, cfg)
-    linearize(tac_proc, cfg)
+    SCCP(cfg)
+    ranges.VRP(cfg)
+    GVN(cfg, summaries)
+    LICM(cfg)
+    IVSR(cfg)
+    DCE(cfg, summaries)
+    # the layout removes jumps: the phis would no longer know where they
+    # are entered from
+    destruct_ssa(tac_proc, cfg)
+    layout.layout(tac_proc, cfg)
 
 
 def execute(tac_list: List):
@@ -116,11 +752,16 @@ if __name__ == "__main__":
     except ValueError as e:
         print(e)
         sys.exit(1)
-    # Optimize the declarations
+    # Optimize the declarations, with the summaries of the whole program
+    import ipa
+    import promote
+    ipa.prune(tac_list)
+    summaries = ipa.summarize(tac_list)
+    promote.promote_globals(tac_list, summaries)
     new_tac_list = []
     for decl in tac_list:
         if isinstance(decl, Proc):
-            optimize_decl(decl)
+            optimize_decl(decl, summaries)
         new_tac_list.append(decl)
 
     # Write the output file if requested
@@ -0,0 +1,485 @@
+'''Check that the TAC optimizations preserve the behaviour of the
+programs. The corpus is made of the .tac.json files of this directory
+and of the BX examples of lab4, compiled to TAC with the lab4 frontend.
+
+Usage:
+    python3 tests.py'''
+
+import contextlib
+import copy
+import io
+import os
+import subprocess
+import sys
+import threading
+
+import cfg as cfglib
+import dataflow
+import ifconvert
+import ipa
+import layout
+import peval
+import promote
+import ranges
+import ssagen
+import switch
+import tac
+import tac_doft
+import unroll
+
+sys.path.append('../lab4')
+
+bx_path = '../lab4/examples/'
+bx_files = sorted(os.path.join(dp, f)
+                  for dp, _, fn in os.walk(bx_path) for f in fn
+                  if f.endswith('.bx') and 'regression' not in dp)
+tac_files = sorted(f for f in os.listdir('.') if f.endswith('.tac.json'))
+
+# the lab4 frontend spells some of the conditional jumps differently
+lab4_jumps = {'je': 'jz', 'jne': 'jnz', 'jg': 'jnle', 'jge': 'jnl'}
+
+
+def bx_to_tac(bx_file: str) -> list:
+    '''Compile a BX file to a list of tac.Gvar and tac.Proc'''
+    from ast2tac import Prog
+    from bx2front import bxfront
+    decls = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        tjs = Prog(bxfront(bx_file)).js_obj
+    for js_obj in tjs:
+        if 'var' in js_obj:
+            decls.append(tac.Gvar.load(js_obj))
+            continue
+        body = [tac.Instr(None, 'label', ('%.Lentry', None))]
+        for instr in js_obj['body']:
+            opcode = lab4_jumps.get(instr['opcode'], instr['opcode'])
+            body.append(tac.Instr(instr['result'], opcode, instr['args']))
+        decls.append(tac.Proc(js_obj['proc'], js_obj['args'], body))
+    return decls
+
+
+def corpus():
+    '''Iterator over pairs (name, list of TAC declarations)'''
+    for tac_file in tac_files:
+        yield tac_file, tac.load_tac(tac_file)
+    for bx_file in bx_files:
+        yield bx_file, bx_to_tac(bx_file)
+
+
+def run(decls: list) -> str:
+    '''Run the TAC program and return its output'''
+    gvars, procs = dict(), dict()
+    for decl in copy.deepcopy(decls):
+        if isinstance(decl, tac.Gvar):
+            gvars[decl.name] = decl
+        else:
+            procs[decl.name] = decl
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        tac.execute(gvars, procs, '@main', [])
+    return output.getvalue()
+
+
+_expected = dict()
+
+
+def expected_output(name: str, decls: list):
+    '''Output of the original program, or None if it fails to run. The
+    result is computed only once per program.'''
+    if name not in _expected:
+        try:
+            _expected[name] = run(decls)
+        except Exception:
+            _expected[name] = None  # the original program is already broken
+    return _expected[name]
+
+
+def check_pass(title: str, optimize) -> None:
+    '''Apply `optimize' to every program of the corpus and compare the
+    output with the one of the original program'''
+    print(f'---------- TEST {title} -------------')
+    errors = 0
+    for name, decls in corpus():
+        expected = expected_output(name, decls)
+        if expected is None:
+            continue
+        try:
+            optimized = copy.deepcopy(decls)
+            optimize(optimized)
+            result = 'PASS' if run(optimized) == expected else 'FAIL'
+        except Exception as e:
+            result = f'FAIL {e!r}'
+        if result != 'PASS':
+            errors += 1
+        print(f'{name}\n{result}')
+    print()
+    print(errors, ' ERRORS')
+
+
+def run_native(decls: list) -> str:
+    '''Compile the TAC program with the lab4 x64 backend and run it'''
+    from tac2x64 import compile_tac
+    with contextlib.redirect_stdout(io.StringIO()):
+        compile_tac([decl.js_obj for decl in decls], 'to_del.s')
+    cmd = ['gcc', '-o', 'to_del', '../lab4/bx_runtime.c', 'to_del.s']
+    subprocess.run(cmd, stderr=subprocess.DEVNULL, check=True)
+    output = subprocess.run(['timeout', '2', './to_del'], stdout=subprocess.PIPE,
+                            check=True).stdout
+    os.remove('to_del.s')
+    os.remove('to_del')
+    return output.decode()
+
+
+def run_c(decls: list) -> str:
+    '''Compile the TAC program with the lab4 C backend and gcc, and run it'''
+    from tac2c import compile_tac
+    with contextlib.redirect_stdout(io.StringIO()):
+        compile_tac([decl.js_obj for decl in decls], 'to_del.c')
+    cmd = ['gcc', '-O2', '-o', 'to_del_c', '../lab4/bx_runtime.c', 'to_del.c']
+    subprocess.run(cmd, stderr=subprocess.DEVNULL, check=True)
+    output = subprocess.run(['timeout', '2', './to_del_c'],
+                            stdout=subprocess.PIPE, check=True).stdout
+    os.remove('to_del.c')
+    os.remove('to_del_c')
+    return output.decode()
+
+
+def check_native(title: str, optimize, backend=run_native) -> None:
+    '''Same as check_pass, but the optimized program is compiled with the
+    lab4 x64 backend (or run by `backend', e.g. run_c)'''
+    print(f'---------- TEST {title} -------------')
+    errors = 0
+    for name, decls in corpus():
+        expected = expected_output(name, decls)
+        if expected is None:
+            continue
+        try:
+            optimized = copy.deepcopy(decls)
+            optimize(optimized)
+            result = 'PASS' if backend(optimized) == expected else 'FAIL'
+        except Exception as e:
+            result = f'FAIL {e!r}'
+        if result != 'PASS':
+            errors += 1
+        print(f'{name}\n{result}')
+    print()
+    print(errors, ' ERRORS')
+
+
+def naive_forward(cfg, transfer, meet, boundary, top) -> dict:
+    '''Naive solver of a forward dataflow problem on sets: recompute every
+    block in turn until nothing changes. Returns the map from every
+    instruction to the pair of sets (before, after).'''
+    blocks = list(cfg.nodes())
+    preds = {bl.label: list(cfg.predecessors(bl.label)) for bl in blocks}
+    out = {bl.label: set(top) for bl in blocks}
+    facts = dict()
+    changed = True
+    while changed:
+        changed = False
+        for bl in blocks:
+            ins = [out[lab] for lab in preds[bl.label]]
+            if not ins or bl.label == cfg.lab_entry:
+                ins.append(boundary)
+            cur = set(ins[0])
+            for s in ins[1:]:
+                cur = meet(cur, s)
+            for instr in bl.instrs():
+                nxt = transfer(instr, cur)
+                facts[instr] = (cur, nxt)
+                cur = nxt
+            if cur != out[bl.label]:
+                out[bl.label] = cur
+                changed = True
+    return facts
+
+
+def naive_reaching(cfg) -> dict:
+    def transfer(instr, defs):
+        dests = set(instr.defs())
+        if not dests:
+            return defs
+        return {d for d in defs if not dests & set(d.defs())} | {instr}
+    return naive_forward(cfg, transfer, set.union, set(), set())
+
+
+def naive_available(cfg) -> dict:
+    exprs = {dataflow.expr_key(instr) for instr in cfg.instrs()} - {None}
+
+    def transfer(instr, avail):
+        key = dataflow.expr_key(instr)
+        avail = {e for e in avail
+                 if (instr.dest is None or instr.dest not in e[1:]) and
+                 not (instr.opcode == 'call' and
+                      any(isinstance(a, str) and a.startswith('@')
+                          for a in e[1:]))}
+        if key is not None and instr.dest not in key[1:]:
+            avail.add(key)
+        return avail
+    return naive_forward(cfg, transfer, set.intersection, set(), exprs)
+
+
+def check_analysis(title: str, problem, naive, ssa=False) -> None:
+    '''Solve the dataflow `problem' on every procedure of the corpus (in
+    SSA form if `ssa') and compare the facts before and after every
+    instruction with those of the set-based solver `naive' '''
+    print(f'---------- TEST {title} -------------')
+    errors = 0
+    for name, decls in corpus():
+        if expected_output(name, decls) is None:
+            continue
+        result = 'PASS'
+        try:
+            for decl in decls:
+                if not isinstance(decl, tac.Proc):
+                    continue
+                cfg = cfglib.infer(decl)
+                if ssa:
+                    ssagen.pruned_ssagen(decl, cfg)
+                solution = dataflow.solve(problem(cfg))
+                expected = naive(cfg)
+                for bl in cfg.nodes():
+                    for instr, inb, outb in solution.instr_facts(bl.label):
+                        if (solution.sets(inb), solution.sets(outb)) != \
+                           expected[instr]:
+                            result = f'FAIL {decl.name} {bl.label}: {instr}'
+        except Exception as e:
+            result = f'FAIL {e!r}'
+        if result != 'PASS':
+            errors += 1
+        print(f'{name}\n{result}')
+    print()
+    print(errors, ' ERRORS')
+
+
+def doft(decls: list) -> None:
+    for decl in decls:
+        if isinstance(decl, tac.Proc):
+            tac_doft.optimize_decl(decl)
+
+
+def summarized(decls: list) -> None:
+    '''Prune the program with the procedure summaries, then optimize every
+    procedure knowing the summaries of its callees'''
+    ipa.prune(decls)
+    summaries = ipa.summarize(decls)
+    for decl in decls:
+        if isinstance(decl, tac.Proc):
+            tac_doft.optimize_decl(decl, summaries)
+
+
+def ssa_pipeline(*passes):
+    '''Translate every procedure to SSA, apply `passes' to its CFG, and
+    translate back out of SSA'''
+    def optimize(decls: list) -> None:
+        for decl in decls:
+            if isinstance(decl, tac.Proc):
+                cfg = cfglib.infer(decl)
+                ssagen.pruned_ssagen(decl, cfg)
+                for opt in passes:
+                    opt(cfg)
+                ssagen.destruct_ssa(decl, cfg)
+                cfglib.linearize(decl, cfg)
+    return optimize
+
+
+ssa_roundtrip = ssa_pipeline()
+
+
+def twice(optimize):
+    '''Apply `optimize' to its own output: the versioned temporaries %x.N
+    of the first round are translated to SSA again'''
+    def optimize_twice(decls: list) -> None:
+        optimize(decls)
+        optimize(decls)
+    return optimize_twice
+
+
+def gcp_roundtrip(decls: list) -> None:
+    for decl in decls:
+        if isinstance(decl, tac.Proc):
+            cfg = cfglib.infer(decl)
+            tac_doft.GCP(decl, cfg)
+            tac_doft.DCE(cfg)
+            ssagen.destruct_ssa(decl, cfg)
+            cfglib.linearize(decl, cfg)
+
+
+def inlined(optimize):
+    '''Inline the calls of the program before applying `optimize' '''
+    def inline_then_optimize(decls: list) -> None:
+        ipa.inline(decls)
+        optimize(decls)
+    return inline_then_optimize
+
+
+def tail_recursive(optimize):
+    '''Remove the tail recursive calls before applying `optimize' '''
+    def tre_then_optimize(decls: list) -> None:
+        for decl in decls:
+            if isinstance(decl, tac.Proc):
+                ipa.tail_recursion(decl)
+        optimize(decls)
+    return tre_then_optimize
+
+
+def specialized(optimize):
+    '''Specialize the procedures for constant arguments before applying
+    `optimize' '''
+    def specialize_then_optimize(decls: list) -> None:
+        ipa.specialize(decls)
+        optimize(decls)
+    return specialize_then_optimize
+
+
+def rotated(optimize):
+    '''Rotate the loops of every procedure before applying `optimize' '''
+    def rotate_then_optimize(decls: list) -> None:
+        for decl in decls:
+            if isinstance(decl, tac.Proc):
+                cfg = cfglib.infer(decl)
+                tac_doft.rotate_loops(cfg)
+                cfglib.linearize(decl, cfg)
+        optimize(decls)
+    return rotate_then_optimize
+
+
+def unrolled(optimize):
+    '''Unroll the counted loops of every procedure before applying
+    `optimize' '''
+    def unroll_then_optimize(decls: list) -> None:
+        for decl in decls:
+            if isinstance(decl, tac.Proc):
+                cfg = cfglib.infer(decl)
+                unroll.unroll_loops(cfg)
+                cfglib.linearize(decl, cfg)
+        optimize(decls)
+    return unroll_then_optimize
+
+
+def switched(optimize):
+    '''Lower the else-if chains of every procedure before applying
+    `optimize' '''
+    def switch_then_optimize(decls: list) -> None:
+        for decl in decls:
+            if isinstance(decl, tac.Proc):
+                cfg = cfglib.infer(decl)
+                switch.lower_switches(cfg)
+                cfglib.linearize(decl, cfg)
+        optimize(decls)
+    return switch_then_optimize
+
+
+def laid_out(optimize, profile=False):
+    '''Apply `optimize', which must leave the program out of SSA form, then
+    lay out the blocks'''
+    def optimize_then_layout(decls: list) -> None:
+        optimize(decls)
+        layout.layout_decls(decls, profile=profile)
+    return optimize_then_layout
+
+
+def if_converted(optimize):
+    '''Apply `optimize', which must leave the program out of SSA form, then
+    if-convert it'''
+    def optimize_then_if_convert(decls: list) -> None:
+        optimize(decls)
+        ifconvert.if_convert_decls(decls)
+    return optimize_then_if_convert
+
+
+def promoted(optimize):
+    '''Promote the global variables to temporaries before applying
+    `optimize' '''
+    def promote_then_optimize(decls: list) -> None:
+        promote.promote_globals(decls)
+        optimize(decls)
+    return promote_then_optimize
+
+
+def partially_evaluated(optimize, **kwargs):
+    '''Partially evaluate the program before applying `optimize' '''
+    def peval_then_optimize(decls: list) -> None:
+        peval.partial_evaluate(decls, **kwargs)
+        optimize(decls)
+    return peval_then_optimize
+
+
+def main() -> None:
+    check_analysis('REACHING DEFINITIONS', dataflow.ReachingDefinitions,
+                   naive_reaching)
+    check_analysis('REACHING DEFINITIONS IN SSA', dataflow.ReachingDefinitions,
+                   naive_reaching, ssa=True)
+    check_analysis('AVAILABLE EXPRESSIONS', dataflow.AvailableExpressions,
+                   naive_available)
+    check_analysis('AVAILABLE EXPRESSIONS IN SSA',
+                   dataflow.AvailableExpressions, naive_available, ssa=True)
+    check_pass('DSE + GCP', doft)
+    check_pass('PRUNE + DSE + GCP WITH SUMMARIES', summarized)
+    check_pass('SSA + OUT OF SSA', ssa_roundtrip)
+    check_pass('(SSA + OUT OF SSA) TWICE', twice(ssa_roundtrip))
+    check_pass('SSA + DCE', ssa_pipeline(tac_doft.DCE))
+    check_pass('GCP + DCE + OUT OF SSA', gcp_roundtrip)
+    check_pass('SSA + SCCP + DCE', ssa_pipeline(tac_doft.SCCP, tac_doft.DCE))
+    check_pass('SSA + GVN + DCE', ssa_pipeline(tac_doft.GVN, tac_doft.DCE))
+    check_pass('SSA + VRP + DCE', ssa_pipeline(ranges.VRP, tac_doft.DCE))
+    check_pass('SSA + LICM', ssa_pipeline(tac_doft.LICM))
+    check_pass('SSA + IVSR + DCE', ssa_pipeline(tac_doft.IVSR, tac_doft.DCE))
+    check_pass('INLINE + SSA + DCE', inlined(ssa_pipeline(tac_doft.DCE)))
+    check_pass('INLINE + DSE + GCP', inlined(doft))
+    check_pass('TRE + INLINE + SSA + DCE',
+               tail_recursive(inlined(ssa_pipeline(tac_doft.DCE))))
+    check_pass('SPECIALIZE + INLINE + SSA + DCE',
+               specialized(inlined(ssa_pipeline(tac_doft.DCE))))
+    check_pass('PROMOTE + SSA + DCE', promoted(ssa_pipeline(tac_doft.DCE)))
+    check_pass('ROTATE + SSA + LICM + DCE',
+               rotated(ssa_pipeline(tac_doft.LICM, tac_doft.DCE)))
+    check_pass('UNROLL + SSA + SCCP + DCE',
+               unrolled(ssa_pipeline(tac_doft.SCCP, tac_doft.DCE)))
+    check_pass('SWITCH + SSA + SCCP + DCE',
+               switched(ssa_pipeline(tac_doft.SCCP, tac_doft.DCE)))
+    check_pass('SSA + DCE + OUT OF SSA + LAYOUT',
+               laid_out(ssa_pipeline(tac_doft.DCE)))
+    check_pass('SSA + DCE + OUT OF SSA + IF-CONVERT + LAYOUT',
+               laid_out(if_converted(ssa_pipeline(tac_doft.DCE))))
+    check_pass('SSA + DCE + OUT OF SSA + PROFILE LAYOUT',
+               laid_out(ssa_pipeline(tac_doft.DCE), profile=True))
+    check_pass('PEVAL + SSA + DCE',
+               partially_evaluated(ssa_pipeline(tac_doft.DCE)))
+    check_pass('PEVAL (BUDGET 50) + SSA + DCE',
+               partially_evaluated(ssa_pipeline(tac_doft.DCE), budget=50))
+    check_native('PEVAL (BUDGET 50) + SSA + OUT OF SSA WITH TAC2X64',
+                 partially_evaluated(ssa_roundtrip, budget=50))
+    check_native('PROMOTE + SSA + OUT OF SSA WITH TAC2X64',
+                 promoted(ssa_roundtrip))
+    check_native('PROFILE LAYOUT WITH TAC2X64',
+                 laid_out(ssa_roundtrip, profile=True))
+    check_native('ROTATE + SSA + OUT OF SSA + LAYOUT WITH TAC2X64',
+                 laid_out(rotated(ssa_roundtrip)))
+    check_native('UNROLL + SSA + OUT OF SSA + LAYOUT WITH TAC2X64',
+                 laid_out(unrolled(ssa_roundtrip)))
+    check_native('SWITCH + SSA + OUT OF SSA + LAYOUT WITH TAC2X64',
+                 laid_out(switched(ssa_roundtrip)))
+    check_native('SWITCH + SSA + OUT OF SSA + LAYOUT WITH TAC2C',
+                 laid_out(switched(ssa_roundtrip)), run_c)
+    check_native('SSA + OUT OF SSA + IF-CONVERT + LAYOUT WITH TAC2X64',
+                 laid_out(if_converted(ssa_roundtrip)))
+    check_native('SSA + OUT OF SSA + IF-CONVERT + LAYOUT WITH TAC2C',
+                 laid_out(if_converted(ssa_roundtrip)), run_c)
+    check_native('SSA + VRP + DCE + OUT OF SSA WITH TAC2X64',
+                 ssa_pipeline(ranges.VRP, tac_doft.DCE))
+    check_native('DSE + GCP WITH TAC2X64', doft)
+    check_native('DSE + GCP + IF-CONVERT + LAYOUT WITH TAC2C',
+                 laid_out(if_converted(doft)), run_c)
+    check_native('TRE + SSA + OUT OF SSA WITH TAC2X64',
+                 tail_recursive(ssa_roundtrip))
+    check_native('SSA + OUT OF SSA WITH TAC2X64', ssa_roundtrip)
+
+
+if __name__ == '__main__':
+    # the interpreter recurses on procedure calls: give it a large stack
+    sys.setrecursionlimit(20000)
+    threading.stack_size(512 * 1024 * 1024)
+    thread = threading.Thread(target=main)
+    thread.start()
+    thread.join()
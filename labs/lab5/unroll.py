@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+"""
+Loop unrolling
+
+Works on the CFG before SSA construction, on the while loops whose header
+ends with the exit test
+
+    j<cc> %d, IN;  jmp OUT          (or with IN and OUT swapped)
+
+where, in terms of the values at the start of the header, %d is %i + k,
+k - %i, %i - %n or %n - %i, with k a constant and %n a temporary that the
+loop does not assign. The induction variable %i must be assigned only once
+in the loop, to %i + s for a constant step s, in a block that every
+iteration goes through (outside of the inner loops), and each step must
+bring the test closer to the exit.
+
+A loop whose trip count is known (constant start, bound and step) and at
+most `max_trip' is fully unrolled: that many copies of the loop are chained
+in front of it, each copy of the header keeping its test, so that constant
+propagation afterwards decides every test and deletes the loop. Otherwise,
+if the header computes nothing but the test, the loop is unrolled `factor'
+times: a new header checks that the next `factor' iterations all pass the
+test, then runs their copies without testing, and the original loop is
+left to run the remaining iterations. The instructions added to a
+procedure are limited by `budget', which may lower `factor' (but not
+below 3).
+"""
+
+import cfg as cfglib
+import tac
+
+# ------------------------------------------------------------------------------
+
+_inverse = {'jl': 'jnl', 'jnl': 'jl', 'jle': 'jnle', 'jnle': 'jle'}
+
+_pure = frozenset(['const', 'copy', 'add', 'sub', 'mul', 'and', 'or',
+                   'xor', 'neg', 'not'])
+
+
+def _combine(opcode, a, b):
+    """Symbolic value of `opcode' (add or sub) on the symbolic values `a'
+    and `b', or None"""
+    if a is None or b is None:
+        return None
+    if opcode == 'add' and a[0] == 'const' and b[0] != 'const':
+        a, b = b, a
+    if a[0] == b[0] == 'const':
+        k = a[1] + b[1] if opcode == 'add' else a[1] - b[1]
+        return ('const', tac.untwoc(tac.twoc(k)))
+    if b[0] == 'const' and a[0] in ('lin', 'nlin'):
+        k = a[2] + b[1] if opcode == 'add' else a[2] - b[1]
+        return (a[0], a[1], k)
+    if opcode == 'sub' and a[0] == 'const' and b[0] in ('lin', 'nlin'):
+        return ('nlin' if b[0] == 'lin' else 'lin', b[1],
+                a[1] - b[2] if b[0] == 'lin' else b[2] - a[1])
+    if opcode == 'sub' and a[0] == b[0] == 'lin' and a[2] == b[2] == 0 and \
+       a[1] != b[1]:
+        return ('diff', a[1], b[1])
+    return None
+
+
+def symbolic(block):
+    """The symbolic values of the temporaries assigned in `block', at its
+    end: ('const', k), ('lin', %t, k) for %t + k, ('nlin', %t, k) for
+    k - %t, or ('diff', %t, %u) for %t - %u, where %t and %u stand for the
+    values at the start of the block; None if unknown"""
+    env = dict()
+
+    def value(t):
+        if not tac.Instr._istemp(t):
+            return None
+        return env[t] if t in env else ('lin', t, 0)
+
+    for instr in block.body:
+        if instr.dest is None:
+            continue
+        if instr.opcode == 'const':
+            env[instr.dest] = ('const', tac.untwoc(tac.twoc(instr.arg1)))
+        elif instr.opcode == 'copy':
+            env[instr.dest] = value(instr.arg1)
+        elif instr.opcode in ('add', 'sub'):
+            env[instr.dest] = _combine(instr.opcode, value(instr.arg1),
+                                       value(instr.arg2))
+        else:
+            env[instr.dest] = None
+    return env
+
+
+def _known(cfg, lab, tmp):
+    """The constant held by `tmp' at the end of the block `lab', looking
+    back through the single predecessors, or None if unknown"""
+    seen = set()
+    while lab not in seen:
+        seen.add(lab)
+        for instr in reversed(cfg[lab].body):
+            if instr.dest == tmp:
+                return tac.untwoc(tac.twoc(instr.arg1)) \
+                    if instr.opcode == 'const' else None
+        if cfg.in_degree(lab) != 1:
+            return None
+        lab = next(iter(cfg.predecessors(lab)))
+    return None
+
+
+class CountedLoop:
+    """The exit test and the induction variable of a loop of the shape
+    described above: `cc' is the jump that stays in the loop when taken,
+    on `%d' = `sign' * %i + `offset' (`offset' is a constant or, for the
+    forms with %n, the pair (-sign, %n)), and %i moves by `step'."""
+
+    def __init__(self, cfg, loops, head):
+        self.head = head
+        self.body = body = loops.body[head]
+        block = cfg[head]
+        jumps = block.jumps
+        self.ok = False
+        if len(jumps) != 2 or jumps[0].opcode not in _inverse or \
+           jumps[1].opcode != 'jmp' or \
+           (jumps[0].arg2 in body) == (jumps[1].arg1 in body):
+            return
+        if jumps[0].arg2 in body:
+            self.cc, self.lab_in, self.lab_out = \
+                jumps[0].opcode, jumps[0].arg2, jumps[1].arg1
+        else:
+            self.cc, self.lab_in, self.lab_out = \
+                _inverse[jumps[0].opcode], jumps[1].arg1, jumps[0].arg2
+        if self.lab_in == head:
+            return
+        self.d = jumps[0].arg1
+        v = symbolic(block).get(self.d, ('lin', self.d, 0))
+        if v is None or v[0] == 'const':
+            return
+        assigned = {instr.dest for lab in body for instr in cfg[lab].body}
+        if v[0] == 'diff':
+            i, n = (v[1], v[2]) if v[2] not in assigned else (v[2], v[1])
+            if n in assigned:
+                return
+            self.sign = 1 if i == v[1] else -1
+            self.offset = (-self.sign, n)
+        else:
+            i, self.sign, self.offset = v[1], 1 if v[0] == 'lin' else -1, v[2]
+        defs = [(lab, instr) for lab in body for instr in cfg[lab].body
+                if instr.dest == i]
+        if len(defs) != 1:
+            return
+        lab_inc = defs[0][0]
+        domtree = cfg.analyses['dominators']
+        if lab_inc == head or loops.innermost[lab_inc] != head or \
+           not all(domtree.dominates(lab_inc, lab)
+                   for lab in loops.back_edges(head)):
+            return
+        inc = symbolic(cfg[lab_inc]).get(i)
+        if inc is None or inc[0] != 'lin' or inc[1] != i or inc[2] == 0:
+            return
+        self.i, self.step = i, inc[2]
+        # the test must get closer to the exit at every step
+        dx = self.sign * self.step
+        if (self.cc in ('jl', 'jle')) != (dx > 0):
+            return
+        self.ok = True
+
+    def trip_count(self, cfg, max_trip):
+        """The number of iterations if it is known and at most `max_trip',
+        else None"""
+        outside = [lab for lab in cfg.predecessors(self.head)
+                   if lab not in self.body]
+        if len(outside) != 1:
+            return None
+        x = _known(cfg, outside[0], self.i)
+        offset = self.offset
+        if isinstance(offset, tuple):
+            n = _known(cfg, outside[0], offset[1])
+            offset = None if n is None else offset[0] * n
+        if x is None or offset is None:
+            return None
+        for trips in range(max_trip + 1):
+            d = tac.twoc(self.sign * x + offset)
+            if not tac.jumps[self.cc](d):
+                return trips
+            x = tac.untwoc(tac.twoc(x + self.step))
+        return None
+
+
+def _size(cfg, labs):
+    return sum(len(cfg[lab].body) + len(cfg[lab].jumps) for lab in labs)
+
+
+def _set_jumps(cfg, lab, jumps):
+    for succ in list(cfg.successors(lab)):
+        cfg.remove_edge(lab, succ)
+    cfg[lab].jumps = jumps
+    for jinstr in jumps:
+        for dest in cfglib.get_jump_dests(jinstr):
+            cfg.add_edge(lab, dest)
+
+
+def _copy(instr):
+    return tac.Instr(instr.dest, instr.opcode, (instr.arg1, instr.arg2))
+
+
+def _copies(cfg, loop, count, last):
+    """Add `count' copies of the blocks of `loop' to `cfg', each jumping
+    back to the header of the next one, and the last one to `last'.
+    Returns the maps from the labels of the loop to those of the copies."""
+    tabs = [{lab: cfg.fresh_label() for lab in loop.body}
+            for _ in range(count)]
+    for tab in tabs:
+        for lab in loop.body:
+            cfg.add_node(cfglib.Block(tab[lab], map(_copy, cfg[lab].body)))
+    for n, tab in enumerate(tabs):
+        rew = dict(tab)
+        rew[loop.head] = tabs[n + 1][loop.head] if n + 1 < count else last
+        for lab in loop.body:
+            jumps = list(map(_copy, cfg[lab].jumps))
+            for jinstr in jumps:
+                cfglib.apply_label_rewrite(jinstr, rew)
+            _set_jumps(cfg, tab[lab], jumps)
+    return tabs
+
+
+def unroll_loop(cfg, head, *, budget, max_trip=16, factor=4):
+    """Unroll the loop of header `head' of `cfg' (see above) adding at most
+    `budget' instructions. Returns the pair (kind, instructions added),
+    where kind is 'full', 'partial' or None if the loop is left alone."""
+    loops = cfg.analyses['loops']
+    loop = CountedLoop(cfg, loops, head)
+    if not loop.ok:
+        return None, 0
+    size = _size(cfg, loop.body)
+    trips = loop.trip_count(cfg, max_trip)
+    if trips is not None and 0 < trips and trips * size <= budget:
+        # the preheader is made before the copies, which jump to the header
+        pre = cfglib.insert_preheader(cfg, head, loop.body)
+        tabs = _copies(cfg, loop, trips, head)
+        _set_jumps(cfg, pre, [tac.Instr(None, 'jmp', (tabs[0][head], None))])
+        return 'full', trips * size
+    header = cfg[head].body
+    while factor > 2 and factor * size + len(header) + 4 > budget:
+        factor -= 1
+    # with two tests a round, two copies would save nothing
+    if factor < 3 or abs((factor - 1) * loop.step) >= 1 << 31 or \
+       any(instr.opcode not in _pure or not tac.Instr._istemp(instr.dest)
+           for instr in header):
+        return None, 0
+    pre = cfglib.insert_preheader(cfg, head, loop.body)
+    guard, check = cfg.fresh_label(), cfg.fresh_label()
+    k, e = cfg.fresh_temp('%unroll'), cfg.fresh_temp('%unroll')
+    # the first and the last of the next iterations must pass the test
+    cfg.add_node(cfglib.Block(guard, map(_copy, header)))
+    cfg.add_node(cfglib.Block(check, [
+        tac.Instr(k, 'const', ((factor - 1) * loop.sign * loop.step, None)),
+        tac.Instr(e, 'add', (loop.d, k))]))
+    tabs = _copies(cfg, loop, factor, guard)
+    for tab in tabs:
+        _set_jumps(cfg, tab[head],
+                   [tac.Instr(None, 'jmp', (tab[loop.lab_in], None))])
+    _set_jumps(cfg, guard, [tac.Instr(None, loop.cc, (loop.d, check)),
+                            tac.Instr(None, 'jmp', (head, None))])
+    _set_jumps(cfg, check, [tac.Instr(None, loop.cc, (e, tabs[0][head])),
+                            tac.Instr(None, 'jmp', (head, None))])
+    _set_jumps(cfg, pre, [tac.Instr(None, 'jmp', (guard, None))])
+    return 'partial', factor * size + len(header) + 4
+
+
+@cfglib.preserves()
+def unroll_loops(cfg, *, budget=256, **kwargs):
+    """Unroll the loops of `cfg', inner loops first, adding at most `budget'
+    instructions in all (see `unroll_loop', which takes the other keyword
+    arguments). Returns the list of the kinds of unrolling done."""
+    done = []
+    for head in reversed(cfg.analyses['loops'].headers()):
+        if head not in cfg.analyses['loops'].body:
+            continue
+        kind, added = unroll_loop(cfg, head, budget=budget, **kwargs)
+        if kind is not None:
+            done.append(kind)
+            budget -= added
+    return done
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    ap = argparse.ArgumentParser(description='Loop unrolling. TAC->TAC')
+    ap.add_argument('fname', metavar='FILE', type=str,
+                    help='The TAC file (.tac or .tac.json) to process')
+    ap.add_argument('-o', '--output', dest='output', type=str)
+    opts = ap.parse_args()
+    decls = tac.load_tac(opts.fname)
+    done = []
+    for decl in decls:
+        if isinstance(decl, tac.Proc):
+            cfg = cfglib.infer(decl)
+            done.extend(unroll_loops(cfg))
+            cfglib.linearize(decl, cfg)
+    print(f'// {done.count("full")} loops fully unrolled, '
+          f'{done.count("partial")} partially')
+    if opts.output:
+        with open(opts.output, 'w') as fp:
+            json.dump([decl.js_obj for decl in decls], fp)
+    else:
+        for decl in decls:
+            print(decl)